@@ -0,0 +1,27 @@
+"""
+Shared setup for benchmark scripts.
+
+bot.config reads Settings at import time, so benchmarks call
+use_temp_database() before importing anything else from the bot package.
+"""
+import os
+import tempfile
+
+_DEFAULTS = {
+    "BOT_TOKEN": "123456:benchmark-token",
+    "CHANNEL_1": "@benchmark_channel_1",
+    "CHANNEL_2": "@benchmark_channel_2",
+    "BOT_USERNAME": "benchmark_bot",
+    "ADMIN_IDS": "[]",
+    "ADMIN_PANEL_TOKEN": "benchmark",
+}
+
+
+def use_temp_database(path: str = None) -> str:
+    """Point the bot at a throwaway database and fill in required settings"""
+    for key, value in _DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="botbench-"), "bench.db")
+    os.environ["DATABASE_PATH"] = path
+    return path
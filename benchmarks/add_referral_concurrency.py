@@ -0,0 +1,73 @@
+"""
+Stress add_referral with many concurrent confirmations.
+
+Fires hundreds of concurrent add_referral calls at a small set of
+inviters (including repeated calls for the same pair) and checks that
+every inviter's referrals_count equals the number of distinct invitees.
+Exits with status 1 on any mismatch.
+
+Usage: python -m benchmarks.add_referral_concurrency [--inviters 5] [--invitees 500] [--repeat 3]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from ._env import use_temp_database
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inviters", type=int, default=5)
+    parser.add_argument("--invitees", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3, help="How many times each pair is submitted")
+    parser.add_argument("--db", help="Database path (default: temporary file)")
+    args = parser.parse_args()
+
+    use_temp_database(args.db)
+    from bot import db, models
+
+    await db.init_db()
+    try:
+        inviters = list(range(1, args.inviters + 1))
+        for inviter_id in inviters:
+            await models.create_user(inviter_id, None, None)
+
+        expected = {inviter_id: set() for inviter_id in inviters}
+        calls = []
+        for invited_id in range(10_000, 10_000 + args.invitees):
+            inviter_id = random.choice(inviters)
+            expected[inviter_id].add(invited_id)
+            calls.extend([(inviter_id, invited_id)] * args.repeat)
+        random.shuffle(calls)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(models.add_referral(i, j) for i, j in calls))
+        elapsed = time.perf_counter() - start
+
+        added = sum(1 for was_added, _ in results if was_added)
+        print(f"{len(calls)} concurrent calls in {elapsed:.2f}s ({len(calls) / elapsed:.0f}/s), {added} added")
+
+        ok = added == args.invitees
+        async with db.get_db() as conn:
+            for inviter_id in inviters:
+                cur = await conn.execute("SELECT referrals_count FROM users WHERE user_id = ?", (inviter_id,))
+                stored = (await cur.fetchone())["referrals_count"]
+                cur = await conn.execute("SELECT COUNT(*) FROM referrals WHERE inviter_id = ?", (inviter_id,))
+                actual = (await cur.fetchone())[0]
+                want = len(expected[inviter_id])
+                # Served from the user cache when the inviter is cached
+                reported = await models.referral_count(inviter_id)
+                status = "ok" if stored == actual == reported == want else "MISMATCH"
+                ok = ok and status == "ok"
+                print(f"inviter {inviter_id}: stored={stored} rows={actual} reported={reported} expected={want} {status}")
+    finally:
+        await db.close_db()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+Push a burst of notifications through DeliveryScheduler against the fake
+Bot API, which answers with 429 once Telegram-like limits are exceeded.
+
+Reports how many messages were delivered, how many 429s were seen and how
+long the burst took. Exits with status 1 if any message was lost.
+
+Usage: python -m benchmarks.delivery_flood [--messages 300] [--chats 100] [--flood-rate 0.05]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from ._env import use_temp_database
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--flood-rate", type=float, default=0.05, help="Probability of a random 429")
+    parser.add_argument("--api-global-limit", type=float, default=30)
+    parser.add_argument("--rate", type=float, default=25, help="Scheduler global rate")
+    args = parser.parse_args()
+
+    use_temp_database()
+    from aiogram import Bot
+    from bot.services.delivery import DeliveryScheduler, Priority
+    from .fake_api import FakeTelegramSession
+
+    session = FakeTelegramSession(global_limit=args.api_global_limit, flood_rate=args.flood_rate, retry_after=1)
+    bot = Bot(token="123456:fake", session=session)
+    scheduler = DeliveryScheduler(
+        global_rate=args.rate, per_chat_rate=1, per_chat_burst=3, workers=8, max_retries=10
+    )
+    scheduler.start(bot)
+
+    start = time.perf_counter()
+    futures = []
+    for i in range(args.messages):
+        priority = Priority.APPROVAL if i % 10 == 0 else Priority.NOTIFICATION
+        futures.append(scheduler.send_message(i % args.chats, f"message {i}", priority=priority))
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+
+    lost = sum(1 for r in results if isinstance(r, BaseException))
+    print(f"delivered {len(session.delivered)}/{args.messages} in {elapsed:.1f}s "
+          f"({len(session.delivered) / elapsed:.1f} msg/s)")
+    print(f"429 responses: {sum(session.floods.values())}, scheduler stats: {scheduler.stats()}")
+    if lost:
+        print(f"LOST {lost} messages")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""
+In-process fake of the Telegram Bot API for local load and flood tests.
+
+FakeTelegramSession plugs into aiogram's Bot in place of the HTTP session,
+answers calls with canned results, and enforces Telegram-like flood limits
+by returning 429 responses with retry_after.
+
+    bot = Bot(token="123456:fake", session=FakeTelegramSession(global_limit=30))
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, AsyncGenerator, Deque, Dict, Iterable, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# Methods that count as messages for flood limits
+_MESSAGE_METHODS = {"sendMessage", "copyMessage", "forwardMessage", "sendPhoto"}
+
+
+class FakeTelegramSession(BaseSession):
+    """
+    Fake Bot API session.
+
+    - latency: seconds each call takes, plus up to latency_jitter more
+    - global_limit / per_chat_limit: messages per second before 429s start
+      (None disables the limit)
+    - flood_rate: probability of a random 429 on any message call
+    - retry_after: seconds reported in injected 429 responses
+    - blocked_chats: chat IDs that answer 403 (user blocked the bot)
+    - error_rate: probability of a 502 server error on any call, or a dict
+      of method name -> probability
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        global_limit: Optional[float] = 30,
+        per_chat_limit: Optional[float] = 1,
+        flood_rate: float = 0.0,
+        retry_after: int = 1,
+        blocked_chats: Iterable[Any] = (),
+        latency_jitter: float = 0.0,
+        error_rate: Union[float, Dict[str, float]] = 0.0,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.global_limit = global_limit
+        self.per_chat_limit = per_chat_limit
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.blocked_chats = set(blocked_chats)
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.calls: Counter = Counter()
+        self.floods: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.delivered: list = []
+        self._global_window: Deque[float] = deque()
+        self._chat_windows: Dict[Any, Deque[float]] = defaultdict(deque)
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+        raise NotImplementedError
+        yield b""  # pragma: no cover
+
+    @staticmethod
+    def _over_limit(window: Deque[float], limit: Optional[float], now: float) -> bool:
+        if limit is None:
+            return False
+        while window and window[0] <= now - 1.0:
+            window.popleft()
+        return len(window) >= limit
+
+    def _flood_check(self, name: str, chat_id: Any) -> bool:
+        if name not in _MESSAGE_METHODS:
+            return False
+        now = time.monotonic()
+        chat_window = self._chat_windows[chat_id]
+        if (
+            random.random() < self.flood_rate
+            or self._over_limit(self._global_window, self.global_limit, now)
+            or self._over_limit(chat_window, self.per_chat_limit, now)
+        ):
+            return True
+        self._global_window.append(now)
+        chat_window.append(now)
+        return False
+
+    def result_for(self, name: str, params: Dict[str, Any]) -> Any:
+        """Canned successful result for a Bot API method"""
+        chat_id = params.get("chat_id", 0)
+        user_id = params.get("user_id", 0)
+        if name == "sendMessage":
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if name in ("copyMessage", "forwardMessage"):
+            self._message_id += 1
+            return {"message_id": self._message_id}
+        if name == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if name == "getChatMember":
+            return {
+                "status": "member",
+                "user": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            }
+        if name == "getChat":
+            return {
+                "id": chat_id,
+                "type": "private",
+                "first_name": f"User{chat_id}",
+                "accent_color_id": 0,
+                "max_reaction_count": 0,
+                "accepted_gift_types": {
+                    "unlimited_gifts": False,
+                    "limited_gifts": False,
+                    "unique_gifts": False,
+                    "premium_subscription": False,
+                },
+            }
+        return True
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None,
+    ) -> TelegramType:
+        name = method.__api_method__
+        params = method.model_dump(warnings=False)
+        self.calls[name] += 1
+
+        delay = self.latency + (random.random() * self.latency_jitter if self.latency_jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        error_rate = self.error_rate.get(name, 0.0) if isinstance(self.error_rate, dict) else self.error_rate
+        if error_rate and random.random() < error_rate:
+            self.errors[name] += 1
+            status, payload = 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+        elif name in _MESSAGE_METHODS and params.get("chat_id") in self.blocked_chats:
+            status, payload = 403, {
+                "ok": False,
+                "error_code": 403,
+                "description": "Forbidden: bot was blocked by the user",
+            }
+        elif self._flood_check(name, params.get("chat_id")):
+            self.floods[name] += 1
+            status, payload = 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        else:
+            if name in _MESSAGE_METHODS:
+                self.delivered.append((params.get("chat_id"), params.get("text")))
+            status, payload = 200, {"ok": True, "result": self.result_for(name, params)}
+
+        response = self.check_response(bot=bot, method=method, status_code=status, content=json.dumps(payload))
+        return response.result  # type: ignore[return-value]
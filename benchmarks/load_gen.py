@@ -0,0 +1,223 @@
+"""
+Replay a viral referral campaign against the real Dispatcher.
+
+Synthetic users arrive at a steady rate, each sending `/start <inviter>`,
+pressing "check subscription" --think-time seconds later and, for a share
+of them, sending a join request to the private group. Updates are fed to
+the Dispatcher from bot.main, which talks to FakeTelegramSession with
+configurable latency and error rates instead of Telegram.
+
+The load is open loop: updates are issued on schedule whether or not the
+bot keeps up, and latency is measured from the scheduled time, so queueing
+shows up in the percentiles. Raise --rate until throughput stops following
+it to find the saturation point. Bot settings such as DELIVERY_GLOBAL_RATE
+or DB_POOL_SIZE are read from the environment as usual.
+
+Usage: python -m benchmarks.load_gen [--rate 200] [--duration 30] [--api-latency 0.05]
+                                      [--api-error-rate 0.01] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from ._env import use_temp_database
+
+PRIVATE_GROUP_ID = -1001000000001
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def start_update(update_id: int, user_id: int, inviter: int) -> Dict[str, Any]:
+    text = f"/start {inviter}" if inviter else "/start"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": "check_subscription",
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "subscribe",
+            },
+        },
+    }
+
+
+def join_request_update(update_id: int, user_id: int) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "chat_join_request": {
+            "chat": {"id": PRIVATE_GROUP_ID, "type": "supergroup", "title": "Private group"},
+            "from": _user(user_id),
+            "user_chat_id": user_id,
+            "date": int(time.time()),
+        },
+    }
+
+
+def build_schedule(args: argparse.Namespace) -> List[Tuple[float, str, Dict[str, Any]]]:
+    """(offset in seconds, kind, raw update) for the whole run, in time order"""
+    rng = random.Random(args.seed)
+    updates_per_user = 2 + args.join_share
+    user_rate = args.rate / updates_per_user
+    users = max(1, int(user_rate * args.duration))
+
+    schedule = []
+    update_id = 0
+    for i in range(users):
+        user_id = 1_000_000 + i
+        arrival = i / user_rate
+        # Early users are the influencers who bring most of the traffic
+        inviter = 1_000_000 + int(i * rng.random() ** 3) if i and rng.random() < args.referred_share else 0
+
+        update_id += 1
+        schedule.append((arrival, "start", start_update(update_id, user_id, inviter)))
+        update_id += 1
+        schedule.append((arrival + args.think_time, "callback", callback_update(update_id, user_id)))
+        if rng.random() < args.join_share:
+            update_id += 1
+            schedule.append((arrival + 2 * args.think_time, "join_request", join_request_update(update_id, user_id)))
+
+    schedule.sort(key=lambda item: item[0])
+    return schedule
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2) if latencies else 0.0
+
+    return {"count": len(latencies), "p50_ms": pct(0.50), "p90_ms": pct(0.90), "p99_ms": pct(0.99), "max_ms": pct(1.0)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=200, help="Target updates per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of arrivals")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between a user's steps")
+    parser.add_argument("--referred-share", type=float, default=0.8, help="Share of users arriving via a referral link")
+    parser.add_argument("--join-share", type=float, default=0.3, help="Share of users sending a join request")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Updates processed at once (like WEBHOOK_MAX_CONCURRENCY)")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Fake Bot API latency in seconds")
+    parser.add_argument("--api-jitter", type=float, default=0.05, help="Extra random Bot API latency in seconds")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="Probability of a 502 on any Bot API call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    os.environ["RECONCILE_INTERVAL_SECONDS"] = "0"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["PRIVATE_GROUP_LINK"] = "https://t.me/+loadtest"
+    use_temp_database()
+
+    from aiogram import Bot
+    from aiogram.types import Update
+    from bot.main import create_dispatcher
+    from bot.services.delivery import delivery
+    from bot.services.join_requests import join_requests
+    from .fake_api import FakeTelegramSession
+
+    # bot.main configures INFO logging; per-update log lines would swamp the output
+    logging.getLogger().setLevel(logging.ERROR)
+
+    session = FakeTelegramSession(
+        latency=args.api_latency,
+        latency_jitter=args.api_jitter,
+        error_rate=args.api_error_rate,
+        global_limit=None,
+        per_chat_limit=None,
+    )
+    bot = Bot(token="123456:fake", session=session)
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot)
+
+    schedule = build_schedule(args)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    slots = asyncio.Semaphore(args.max_in_flight)
+    tasks = set()
+
+    async def feed(due: float, kind: str, raw: Dict[str, Any]):
+        try:
+            async with slots:
+                await dp.feed_update(bot, Update.model_validate(raw, context={"bot": bot}))
+        except Exception:
+            errors[kind] += 1
+        finally:
+            latencies[kind].append(time.perf_counter() - due)
+
+    print(f"feeding {len(schedule)} updates at {args.rate:.0f}/s for {args.duration:.0f}s", file=sys.stderr)
+    started = time.perf_counter()
+    for offset, kind, raw in schedule:
+        due = started + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(feed(due, kind, raw))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    backlog = {"delivery": delivery.queue_depth, "join_requests": join_requests.queue_depth}
+    await dp.emit_shutdown(bot=bot)
+    drained = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        "params": vars(args),
+        "updates": len(schedule),
+        "seconds": round(elapsed, 2),
+        "throughput_per_sec": round(len(schedule) / elapsed, 1),
+        "drain_seconds": round(drained - elapsed, 2),
+        "backlog_at_end": backlog,
+        "latency": {"all": _summary(all_latencies), **{kind: _summary(v) for kind, v in latencies.items()}},
+        "errors": dict(errors),
+        "join_requests": join_requests.stats(),
+        "delivery": delivery.stats(),
+        "api_calls": dict(session.calls),
+        "api_errors": dict(session.errors),
+    }
+
+    print(f"{len(schedule)} updates in {elapsed:.1f}s: {report['throughput_per_sec']:.1f} updates/s "
+          f"(target {args.rate:.0f}/s), drained outbound queues in {report['drain_seconds']:.1f}s")
+    for kind, stats in report["latency"].items():
+        print(f"  {kind:13s} n={stats['count']:<7d} p50 {stats['p50_ms']:9.2f} ms  p90 {stats['p90_ms']:9.2f} ms  "
+              f"p99 {stats['p99_ms']:9.2f} ms  max {stats['max_ms']:9.2f} ms  errors {errors.get(kind, 0)}")
+    print(f"  join requests: {report['join_requests']}")
+    print(f"  delivery: {report['delivery']}, backlog at end of load: {backlog}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+"""
+Event loop cost of logging on the request path.
+
+Runs --requests simulated requests on --concurrency tasks. Each request
+emits the log lines a /start + subscription check used to produce and
+yields to the loop in between. Modes:
+
+  baseline  eager f-strings at INFO, written by a handler on the loop
+            thread (the old logging.basicConfig setup)
+  sync      the current %-style calls and sampling, still written on the
+            loop thread
+  queue     the current calls through bot.log: the loop only enqueues
+            records, a listener thread formats and writes them
+
+Reports CPU time spent on the loop thread per request, wall time and
+event loop lag percentiles (a 1 ms ticker measures how late it wakes up).
+--sink-delay-us adds a sleep to every write to emulate a slow disk or a
+blocked stderr pipe.
+
+Usage: python -m benchmarks.logging_bench [--requests 20000] [--concurrency 200]
+                                          [--sample-rate 0.1] [--sink-delay-us 0] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from ._env import use_temp_database
+
+
+class _SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, delay: float):
+        super().__init__(path)
+        self.delay_seconds = delay
+
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+
+
+def _pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3) if values else 0.0
+
+
+async def _baseline_request(logger: logging.Logger, user_id: int):
+    row = {"user_id": user_id, "invited_by": user_id - 1, "referrals_count": 3, "is_member": 1}
+    logger.info(f"User {user_id} came via referral link from {user_id - 1}")
+    await asyncio.sleep(0)
+    logger.info(f"User {user_id} marked as member")
+    logger.info(f"User {user_id} was invited by {user_id - 1}")
+    await asyncio.sleep(0)
+    logger.info(f"Added referral: inviter={user_id - 1}, invited={user_id}, count=3")
+    logger.info(f"User {user_id} has 3 referrals")
+    await asyncio.sleep(0)
+    logger.info(f"User {user_id} referrals from DB: 3, row data: {dict(row)}")
+
+
+async def _current_request(logger: logging.Logger, user_id: int, sampled: Dict[str, Any]):
+    logger.info("User %s marked as member", user_id, extra=sampled)
+    await asyncio.sleep(0)
+    logger.debug("User %s was invited by %s", user_id, user_id - 1)
+    logger.info("Added referral: inviter=%s, invited=%s, count=%s", user_id - 1, user_id, 3)
+    await asyncio.sleep(0)
+    logger.debug("User %s has %s referrals", user_id, 3)
+    logger.info("Join request from user %s to chat %s", user_id, -100, extra=sampled)
+    await asyncio.sleep(0)
+    logger.debug("User %s referrals from DB: %s", user_id, 3)
+
+
+async def _run(mode: str, args: argparse.Namespace, path: str) -> Dict[str, Any]:
+    from bot import log
+
+    sink = _SlowFileHandler(path, args.sink_delay_us / 1_000_000)
+    if mode == "queue":
+        log.setup_logging("INFO", args.sample_rate, args.queue_size, target=sink)
+    else:
+        log.stop_logging()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        sink.setFormatter(logging.Formatter(log.LOG_FORMAT))
+        if mode == "sync":
+            sink.addFilter(log.SampleFilter(args.sample_rate))
+        root.addHandler(sink)
+        root.setLevel(logging.INFO)
+
+    logger = logging.getLogger("bot.bench")
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, time.perf_counter() - started - 0.001))
+
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for user_id in range(1, args.requests + 1):
+        queue.put_nowait(user_id)
+
+    async def worker():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            if mode == "baseline":
+                await _baseline_request(logger, user_id)
+            else:
+                await _current_request(logger, user_id, log.SAMPLED)
+
+    tick = asyncio.create_task(ticker())
+    cpu_started, wall_started = time.thread_time(), time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    loop_cpu, wall = time.thread_time() - cpu_started, time.perf_counter() - wall_started
+    done.set()
+    await tick
+
+    log.stop_logging()
+    for handler in list(logging.getLogger().handlers):
+        logging.getLogger().removeHandler(handler)
+    sink.close()
+    with open(path, "rb") as f:
+        lines = sum(1 for _ in f)
+
+    return {
+        "loop_cpu_us_per_request": round(loop_cpu / args.requests * 1_000_000, 2),
+        "wall_seconds": round(wall, 3),
+        "lag_p50_ms": _pct(lags, 0.50),
+        "lag_p99_ms": _pct(lags, 0.99),
+        "lag_max_ms": _pct(lags, 1.0),
+        "lines_written": lines,
+        "dropped": log.dropped_records() if mode == "queue" else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--queue-size", type=int, default=100_000)
+    parser.add_argument("--sink-delay-us", type=float, default=0, help="Sleep after every written record")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    use_temp_database()
+    workdir = tempfile.mkdtemp(prefix="logbench-")
+    results = {}
+    for mode in ("baseline", "sync", "queue"):
+        results[mode] = await _run(mode, args, os.path.join(workdir, f"{mode}.log"))
+        r = results[mode]
+        print(f"{mode:9s} loop CPU {r['loop_cpu_us_per_request']:8.2f} us/request  wall {r['wall_seconds']:7.3f}s  "
+              f"lag p50 {r['lag_p50_ms']:7.3f} ms  p99 {r['lag_p99_ms']:7.3f} ms  max {r['lag_max_ms']:8.3f} ms  "
+              f"lines {r['lines_written']}  dropped {r['dropped']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+        print(f"results written to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
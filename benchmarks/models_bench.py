@@ -0,0 +1,181 @@
+"""
+Microbenchmarks for bot.models against a generated SQLite database.
+
+Builds a database of --users users with a heavy-tailed referral fan-out
+(a few inviters bring most referrals, most users bring none), then times
+create_user, get_user, add_referral, referral_count and list_users one
+call at a time and under --concurrency concurrent tasks. Reports ops/s
+and p50/p99 latency per function, and writes JSON with --json for
+comparing runs.
+
+Usage: python -m benchmarks.models_bench [--users 100000] [--ops 2000] [--concurrency 50]
+                                         [--db base.db] [--json results.json]
+
+--db keeps the generated database between runs (it is generated once and
+copied before each run, so every run starts from the same data).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from ._env import use_temp_database
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _pick_inviter(rng: random.Random, users: int) -> int:
+    # Power law over user IDs: low IDs (early users) invite far more people
+    return int(users * rng.random() ** 3) + 1
+
+
+def generate_database(path: str, users: int, referred_share: float, seed: int):
+    """Fill an empty, migrated database with users and referrals"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        batch_users, batch_refs = [], []
+        for user_id in range(1, users + 1):
+            inviter = None
+            if user_id > 1 and rng.random() < referred_share:
+                inviter = min(_pick_inviter(rng, user_id - 1), user_id - 1)
+                batch_refs.append((inviter, user_id))
+            batch_users.append((user_id, f"user{user_id}", f"User {user_id}", inviter, 1))
+            if len(batch_users) >= 50_000:
+                conn.executemany("INSERT INTO users (user_id, username, full_name, invited_by, is_member) VALUES (?, ?, ?, ?, ?)", batch_users)
+                conn.executemany("INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?)", batch_refs)
+                batch_users, batch_refs = [], []
+        conn.executemany("INSERT INTO users (user_id, username, full_name, invited_by, is_member) VALUES (?, ?, ?, ?, ?)", batch_users)
+        conn.executemany("INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?)", batch_refs)
+        conn.execute(
+            "UPDATE users SET referrals_count = actual.cnt "
+            "FROM (SELECT inviter_id, COUNT(*) AS cnt FROM referrals GROUP BY inviter_id) AS actual "
+            "WHERE users.user_id = actual.inviter_id"
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+async def _measure(call: Callable[[int], Awaitable[Any]], ops: int, concurrency: int) -> Dict[str, float]:
+    """Run `ops` calls spread over `concurrency` tasks and summarize latencies"""
+    latencies: List[float] = []
+    counter = iter(range(ops))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "ops": ops,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(ops / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000, help="Users in the generated database")
+    parser.add_argument("--referred-share", type=float, default=0.6, help="Share of users who joined via a referral")
+    parser.add_argument("--ops", type=int, default=2000, help="Calls per function and mode")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100, help="list_users page size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the in-process user cache")
+    parser.add_argument("--db", help="Reusable base database (generated if missing)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ["USER_CACHE_SIZE"] = "0"
+    os.environ["RECONCILE_INTERVAL_SECONDS"] = "0"
+    path = use_temp_database()
+
+    from bot import db, models
+
+    # Create the schema through the normal migrations, then bulk load
+    base = args.db or os.path.join(tempfile.mkdtemp(prefix="botbench-base-"), "base.db")
+    if not os.path.exists(base):
+        db.DB_PATH = base
+        await db.init_db()
+        await db.close_db()
+        started = time.perf_counter()
+        generate_database(base, args.users, args.referred_share, args.seed)
+        print(f"generated {args.users} users in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    shutil.copyfile(base, path)
+    db.DB_PATH = path
+    await db.init_db()
+
+    async with db.get_db() as conn:
+        cur = await conn.execute("SELECT COUNT(*), MAX(user_id) FROM users")
+        user_count, max_user_id = await cur.fetchone()
+    rng = random.Random(args.seed)
+    new_ids = iter(range(max_user_id + 1, max_user_id + 10_000_000))
+
+    def random_user() -> int:
+        return rng.randint(1, max_user_id)
+
+    benchmarks: Dict[str, Callable[[int], Awaitable[Any]]] = {
+        "create_user": lambda i: models.create_user(next(new_ids), "bench", "Bench User", random_user()),
+        "get_user": lambda i: models.get_user(random_user()),
+        "add_referral": lambda i: models.add_referral(_pick_inviter(rng, max_user_id), next(new_ids)),
+        "referral_count": lambda i: models.referral_count(random_user()),
+        "list_users": lambda i: models.list_users(args.page_size, random_user()),
+    }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, call in benchmarks.items():
+        results[name] = {}
+        for mode, concurrency in (("sequential", 1), ("concurrent", args.concurrency)):
+            stats = await _measure(call, args.ops, concurrency)
+            results[name][mode] = stats
+            print(
+                f"{name:15s} {mode:10s} c={concurrency:<4d} {stats['ops_per_sec']:10.1f} ops/s  "
+                f"p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms"
+            )
+
+    await db.close_db()
+
+    report = {
+        "params": {**vars(args), "users_in_db": user_count},
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "user_cache": models.user_cache.stats(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Compare per-call commits with group commit through WriteCoordinator.
+
+Runs the same number of concurrent INSERTs against a temporary SQLite
+database twice: once with batch_size=1 (one transaction per write, like
+the old models code) and once with the configured batch size.
+
+Usage: python -m benchmarks.write_batching [--ops 5000] [--concurrency 200]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+
+from bot.write_coordinator import WriteCoordinator
+
+
+async def _run(path: str, ops: int, concurrency: int, batch_size: int, max_latency_ms: float, synchronous: str) -> float:
+    conn = await aiosqlite.connect(path, isolation_level=None)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute(f"PRAGMA synchronous={synchronous}")
+    await conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT)")
+
+    coordinator = WriteCoordinator(conn, batch_size=batch_size, max_latency=max_latency_ms / 1000)
+    coordinator.start()
+
+    next_id = iter(range(ops))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(user_id: int):
+        async def op(db):
+            await db.execute("INSERT INTO users (user_id, username) VALUES (?, ?)", (user_id, f"user{user_id}"))
+
+        async with sem:
+            await coordinator.submit(op)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in next_id))
+    elapsed = time.perf_counter() - start
+
+    await coordinator.stop()
+    await conn.close()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=2.0)
+    parser.add_argument("--synchronous", default="NORMAL", help="SQLite synchronous pragma (NORMAL or FULL)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, batch_size in (("per-call commit", 1), ("group commit", args.batch_size)):
+            path = os.path.join(tmp, f"bench_{batch_size}.db")
+            elapsed = await _run(path, args.ops, args.concurrency, batch_size, args.max_latency_ms, args.synchronous)
+            results[label] = elapsed
+            print(f"{label:16s} batch={batch_size:<4d} {args.ops / elapsed:10.0f} writes/s  ({elapsed:.2f}s)")
+
+    speedup = results["per-call commit"] / results["group commit"]
+    print(f"speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
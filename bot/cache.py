@@ -0,0 +1,252 @@
+# bot/cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Iterable, Optional, Set, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class AsyncTTLCache(Generic[V]):
+    """
+    Bounded LRU cache for results of async lookups.
+
+    - Truthy and falsy results have separate TTLs, so e.g. "is a member"
+      can be trusted longer than "is not a member".
+    - Concurrent lookups for the same key share one in-flight call.
+    - Exceptions are propagated to every waiter and never cached.
+    """
+
+    def __init__(self, maxsize: int, positive_ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Tuple[V]]:
+        """Return (value,) if a fresh entry exists, otherwise None"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return (value,)
+
+    def set(self, key: Hashable, value: V):
+        if self.maxsize <= 0:
+            return
+        ttl = self.positive_ttl if value else self.negative_ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[V]]) -> V:
+        """Return the cached value for key, calling loader() on a miss"""
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached[0]
+
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            # Someone is already loading this key; piggyback on their call
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The loading caller was cancelled (e.g. timed out), not us
+                inflight = self._inflight.get(key)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._data),
+        }
+
+
+class UserRecord:
+    """
+    Compact snapshot of the user fields read on hot paths.
+    Supports row-style access (record["referrals_count"]) like aiosqlite.Row.
+    """
+
+    __slots__ = ("user_id", "invited_by", "referrals_count", "is_member")
+
+    def __init__(self, user_id: int, invited_by: Optional[int], referrals_count: int, is_member: int):
+        self.user_id = user_id
+        self.invited_by = invited_by
+        self.referrals_count = referrals_count
+        self.is_member = is_member
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self) -> str:
+        return (
+            f"UserRecord(user_id={self.user_id}, invited_by={self.invited_by}, "
+            f"referrals_count={self.referrals_count}, is_member={self.is_member})"
+        )
+
+
+class UserCache:
+    """
+    Bounded LRU cache of UserRecords, kept current by write-through
+    updates from bot.models. A maxsize of 0 disables caching.
+
+    A read that misses fetches the row from the database and then fills the
+    cache. To keep such a fill from overwriting a write that committed in
+    the meantime, every write bumps a version counter for the user's stripe;
+    fill() only stores the record if the stripe version is unchanged since
+    version() was taken before the read.
+    """
+
+    _STRIPES = 4096
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[int, UserRecord]" = OrderedDict()
+        self._versions = [0] * self._STRIPES
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        record = self._data.get(user_id)
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(user_id)
+        return record
+
+    def version(self, user_id: int) -> int:
+        return self._versions[user_id % self._STRIPES]
+
+    def _bump(self, user_id: int):
+        self._versions[user_id % self._STRIPES] += 1
+
+    def _store(self, record: UserRecord):
+        if self.maxsize <= 0:
+            return
+        self._data[record.user_id] = record
+        self._data.move_to_end(record.user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def fill(self, record: UserRecord, version: int):
+        """Cache a record read from the database, unless a write raced the read"""
+        if self.version(record.user_id) == version:
+            self._store(record)
+
+    def put(self, record: UserRecord):
+        """Cache a record that was just written"""
+        self._bump(record.user_id)
+        self._store(record)
+
+    def update(self, user_id: int, **fields):
+        """Apply a committed write to the cached record, if it is cached"""
+        self._bump(user_id)
+        record = self._data.get(user_id)
+        if record is not None:
+            for name, value in fields.items():
+                setattr(record, name, value)
+
+    def invalidate(self, user_id: int):
+        self._bump(user_id)
+        self._data.pop(user_id, None)
+
+    def clear(self):
+        self._versions = [v + 1 for v in self._versions]
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class EligibilityIndex:
+    """
+    Set of user IDs whose referral count has reached the access threshold.
+
+    Loaded from the database at startup and updated as counts change, so
+    access decisions are a set lookup. When `authoritative` is False (other
+    processes also write counts) a miss is only a hint and callers should
+    confirm it against the database.
+    """
+
+    def __init__(self, threshold: int, authoritative: bool = True):
+        self.threshold = threshold
+        self.authoritative = authoritative
+        self.loaded = False
+        self._users: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    def load(self, user_ids: Iterable[int]):
+        self._users = set(user_ids)
+        self.loaded = True
+
+    def observe(self, user_id: int, referrals_count: Optional[int]) -> bool:
+        """Record a user's current referral count; returns True if it just crossed the threshold"""
+        if (referrals_count or 0) >= self.threshold:
+            if user_id not in self._users:
+                self._users.add(user_id)
+                return True
+        else:
+            self._users.discard(user_id)
+        return False
@@ -1,5 +1,6 @@
 # bot/config.py
-from typing import List, Optional
+from typing import List, Literal, Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -9,12 +10,133 @@ class Settings(BaseSettings):
     )
 
     BOT_TOKEN: str
-    CHANNEL_1: str
-    CHANNEL_2: str
+    # Required channels. REQUIRED_CHANNELS takes a JSON list of any length;
+    # CHANNEL_1/CHANNEL_2 are still honoured when it is not set.
+    REQUIRED_CHANNELS: List[str] = []
+    CHANNEL_1: Optional[str] = None
+    CHANNEL_2: Optional[str] = None
     BOT_USERNAME: str
     ADMIN_IDS: List[int]
     ADMIN_PANEL_TOKEN: str
-    DATABASE_PATH: str
+    DATABASE_PATH: str = "data/bot.db"
     PRIVATE_GROUP_LINK: Optional[str] = None
+    # Referrals needed for access to the private group
+    REFERRAL_THRESHOLD: int = 7
+
+    # Storage backend: "sqlite" (DATABASE_PATH, single writer process) or
+    # "postgres" (DATABASE_URL, requires asyncpg; any number of processes)
+    STORAGE_BACKEND: Literal["sqlite", "postgres"] = "sqlite"
+    DATABASE_URL: Optional[str] = None
+    PG_POOL_MIN_SIZE: int = 1
+    PG_POOL_MAX_SIZE: int = 10
+
+    # SQLite connection pool
+    DB_POOL_SIZE: int = 4
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    DB_WRITE_BATCH_SIZE: int = 64
+    DB_WRITE_MAX_LATENCY_MS: float = 2.0
+    # In-process user cache entries (0 disables the cache)
+    USER_CACHE_SIZE: int = 100_000
+    # How often referrals_count is reconciled against referrals (0 disables),
+    # and how many users are recounted per write transaction
+    RECONCILE_INTERVAL_SECONDS: float = 600
+    RECONCILE_CHUNK_SIZE: int = 1000
+
+    # Channel subscription check cache (TTLs in seconds)
+    SUBSCRIPTION_CACHE_SIZE: int = 100_000
+    SUBSCRIPTION_CACHE_POSITIVE_TTL: float = 300
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL: float = 5
+    # Per-channel getChatMember timeout in seconds
+    SUBSCRIPTION_CHECK_TIMEOUT: float = 3.0
+    # Answer subscription checks from channel_members, kept current by
+    # chat_member updates (the bot must be an admin of the channels).
+    # A recorded membership older than MEMBERSHIP_MAX_AGE_SECONDS is
+    # confirmed with getChatMember again, in case an update was missed.
+    MEMBERSHIP_TRACKING: bool = True
+    MEMBERSHIP_MAX_AGE_SECONDS: float = 86400
+
+    # Background re-verification of members with getChatMember. The sweep
+    # pauses SWEEP_INTERVAL_SECONDS after each full pass (0 disables it) and
+    # never makes more than SWEEP_API_CALLS_PER_MINUTE calls per process.
+    SWEEP_INTERVAL_SECONDS: float = 3600
+    SWEEP_BATCH_SIZE: int = 200
+    SWEEP_CONCURRENCY: int = 4
+    SWEEP_API_CALLS_PER_MINUTE: int = 600
+
+    # Logging. Records are formatted and written by a background thread;
+    # per-request INFO events are kept with probability LOG_SAMPLE_RATE.
+    LOG_LEVEL: str = "INFO"
+    LOG_SAMPLE_RATE: float = 0.1
+    LOG_QUEUE_SIZE: int = 10_000
+
+    # Diagnostics: event loop lag monitor, slow update log and the admin
+    # /profiler command, which saves stack samples under DIAG_PROFILE_DIR
+    DIAG_ENABLED: bool = True
+    DIAG_LAG_INTERVAL_SECONDS: float = 0.5
+    DIAG_LAG_WARN_MS: float = 100
+    DIAG_SLOW_UPDATE_MS: float = 1000
+    DIAG_SLOW_UPDATE_HISTORY: int = 100
+    DIAG_PROFILE_DIR: str = "data/profiles"
+    DIAG_PROFILE_INTERVAL_MS: float = 5
+    DIAG_PROFILE_MAX_SECONDS: float = 120
+
+    # Outbound Bot API calls. Telegram allows about 30 messages per second
+    # overall and about 1 per second to the same chat.
+    DELIVERY_GLOBAL_RATE: float = 25
+    DELIVERY_PER_CHAT_RATE: float = 1
+    DELIVERY_PER_CHAT_BURST: float = 3
+    DELIVERY_WORKERS: int = 8
+    DELIVERY_MAX_RETRIES: int = 5
+
+    # Recipients loaded per page (and checkpointed) during a broadcast
+    BROADCAST_BATCH_SIZE: int = 500
+    # A running broadcast is leased to one process, which renews the lease
+    # while sending. Other processes take it over once the lease expires.
+    BROADCAST_LEASE_SECONDS: float = 60
+
+    # Per-user anti-flood: at most ANTIFLOOD_MAX_UPDATES messages/callbacks
+    # per ANTIFLOOD_WINDOW_SECONDS (0 disables the limit)
+    ANTIFLOOD_MAX_UPDATES: int = 10
+    ANTIFLOOD_WINDOW_SECONDS: float = 10.0
+
+    # Join requests decided concurrently, and retries for transient database
+    # errors (Bot API calls are retried by the delivery scheduler)
+    JOIN_REQUEST_WORKERS: int = 16
+    JOIN_REQUEST_MAX_RETRIES: int = 5
+
+    # Update intake: "polling" (getUpdates) or "webhook" (aiohttp server)
+    RUN_MODE: Literal["polling", "webhook"] = "polling"
+    # Public base URL Telegram posts to, e.g. https://bot.example.com.
+    # Leave unset to run the server without registering it (local testing).
+    WEBHOOK_BASE_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Updates handled concurrently per worker process
+    WEBHOOK_MAX_CONCURRENCY: int = 100
+    # Parallel connections Telegram opens to the webhook (1-100)
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    WEBHOOK_WORKERS: int = 1
+
+    # Prometheus metrics. Served at METRICS_PATH on the webhook server, or
+    # on METRICS_HOST:METRICS_PORT in polling mode.
+    METRICS_ENABLED: bool = True
+    METRICS_PATH: str = "/metrics"
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+
+    @property
+    def required_channels(self) -> List[str]:
+        if self.REQUIRED_CHANNELS:
+            return list(self.REQUIRED_CHANNELS)
+        return [ch for ch in (self.CHANNEL_1, self.CHANNEL_2) if ch]
+
+    @model_validator(mode="after")
+    def _require_channels(self) -> "Settings":
+        # An empty list would let every user through the subscription check
+        if not self.required_channels:
+            raise ValueError("Set REQUIRED_CHANNELS or CHANNEL_1/CHANNEL_2: at least one channel is required")
+        return self
 
 settings = Settings()
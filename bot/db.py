@@ -3,9 +3,17 @@ from pathlib import Path
 from .config import settings
 import asyncio
 from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+from .write_coordinator import WriteCoordinator
+from .metrics import InstrumentedConnection, add_phase
+import logging
+import time
 
 DB_PATH = settings.DATABASE_PATH
 DB_LOCK = asyncio.Lock()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 CREATE_USERS = """
 CREATE TABLE IF NOT EXISTS users (
@@ -27,30 +35,252 @@ CREATE TABLE IF NOT EXISTS referrals (
 );
 """
 
+# Versioned schema migrations, applied in order by init_db.
+# The schema version is tracked in PRAGMA user_version; every migration
+# runs in its own transaction together with the version bump, so a
+# failed upgrade leaves the database at the previous version.
+MIGRATIONS = [
+    # 1: base schema (no-op on databases created before migrations existed)
+    [CREATE_USERS, CREATE_REFERRALS],
+    # 2: enforce one referral per (inviter, invited) pair and index hot lookups
+    [
+        # Drop duplicate rows left by the old check-then-insert race
+        """
+        DELETE FROM referrals WHERE id NOT IN (
+            SELECT MIN(id) FROM referrals GROUP BY inviter_id, invited_id
+        )
+        """,
+        # Serves the duplicate check and COUNT(*) ... WHERE inviter_id = ?
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_inviter_invited ON referrals (inviter_id, invited_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_invited ON referrals (invited_id)",
+        # Counts may have drifted because of the removed duplicates
+        """
+        UPDATE users SET referrals_count = (
+            SELECT COUNT(*) FROM referrals WHERE inviter_id = users.user_id
+        )
+        """,
+    ],
+    # 3: admin broadcasts with resumable progress
+    [
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            from_chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at TEXT DEFAULT (datetime('now')),
+            finished_at TEXT
+        )
+        """,
+    ],
+    # 4: channel membership kept current by chat_member updates
+    [
+        """
+        CREATE TABLE IF NOT EXISTS channel_members (
+            channel TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TEXT DEFAULT (datetime('now')),
+            PRIMARY KEY (channel, user_id)
+        )
+        """,
+    ],
+    # 5: membership re-verification sweeper (cursor and detected lapses)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS membership_lapses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            detected_at TEXT DEFAULT (datetime('now'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_membership_lapses_user ON membership_lapses (user_id)",
+        # Keyset walk over current members only
+        "CREATE INDEX IF NOT EXISTS idx_users_members ON users (user_id) WHERE is_member = 1",
+    ],
+    # 6: leaderboard index and incrementally maintained stats rollups
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_referrals_rank ON users (referrals_count DESC, user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS stats_rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            referrals INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket)
+        )
+        """,
+        # Backfill: users have no creation time, so only their total is known
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'total', '', (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM referrals)
+        """,
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'day', substr(created_at, 1, 10), 0, COUNT(*) FROM referrals
+        WHERE created_at IS NOT NULL GROUP BY substr(created_at, 1, 10)
+        """,
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'hour', substr(created_at, 1, 13) || ':00', 0, COUNT(*) FROM referrals
+        WHERE created_at IS NOT NULL GROUP BY substr(created_at, 1, 13)
+        """,
+    ],
+    # 7: broadcast leases, so only one process runs each broadcast
+    [
+        "ALTER TABLE broadcasts ADD COLUMN owner TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN lease_until TEXT",
+    ],
+]
+
+
+async def _run_migrations(conn: aiosqlite.Connection):
+    """Upgrade the schema to the latest version. conn must be in autocommit mode."""
+    while True:
+        # Read the version under the write lock, so several processes
+        # starting at once never apply the same migration twice
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = await conn.execute("PRAGMA user_version")
+            version = (await cur.fetchone())[0]
+            if version >= len(MIGRATIONS):
+                await conn.execute("COMMIT")
+                return
+
+            target = version + 1
+            logger.info("Applying database migration %d", target)
+            for statement in MIGRATIONS[version]:
+                await conn.execute(statement)
+            await conn.execute(f"PRAGMA user_version = {target}")
+            await conn.execute("COMMIT")
+        except Exception:
+            await conn.execute("ROLLBACK")
+            raise
+
+
+# Connection pool: a fixed set of reader connections plus a single writer.
+# SQLite in WAL mode allows many concurrent readers but only one writer,
+# so all writes go through the write coordinator, which owns the writer
+# connection and commits queued writes in batches.
+_readers: Optional[asyncio.Queue] = None
+_reader_conns: list = []
+_writer: Optional[aiosqlite.Connection] = None
+_coordinator: Optional[WriteCoordinator] = None
+
+
+async def _open_connection(isolation_level: Optional[str] = "DEFERRED") -> aiosqlite.Connection:
+    """Open and configure a single pooled connection"""
+    conn = await aiosqlite.connect(DB_PATH, isolation_level=isolation_level)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute(f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    # Set isolation level to ensure we read committed data
+    await conn.execute("PRAGMA read_uncommitted=0")
+    return conn
+
+
+def _instrument(conn: aiosqlite.Connection):
+    """Time every statement on this connection when metrics are enabled"""
+    return InstrumentedConnection(conn) if settings.METRICS_ENABLED else conn
+
 
 async def init_db():
+    global _readers, _writer, _coordinator
     Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
     async with DB_LOCK:
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Enable WAL mode for better concurrency
-            await db.execute("PRAGMA journal_mode=WAL")
-            await db.execute("PRAGMA synchronous=NORMAL")
-            await db.execute(CREATE_USERS)
-            await db.execute(CREATE_REFERRALS)
-            await db.commit()
+        if _writer is not None:
+            return
+
+        # The writer runs in autocommit mode; the write coordinator
+        # issues BEGIN/COMMIT around each batch itself
+        _writer = await _open_connection(isolation_level=None)
+        # Enable WAL mode for better concurrency
+        await _writer.execute("PRAGMA journal_mode=WAL")
+        await _run_migrations(_writer)
+
+        _readers = asyncio.Queue()
+        for _ in range(max(1, settings.DB_POOL_SIZE)):
+            conn = await _open_connection()
+            _reader_conns.append(conn)
+            _readers.put_nowait(_instrument(conn))
+
+        _coordinator = WriteCoordinator(
+            _instrument(_writer),
+            batch_size=settings.DB_WRITE_BATCH_SIZE,
+            max_latency=settings.DB_WRITE_MAX_LATENCY_MS / 1000,
+        )
+        _coordinator.start()
+
+
+async def close_db():
+    """Close all pooled connections. Safe to call more than once."""
+    global _readers, _writer, _coordinator
+    async with DB_LOCK:
+        if _coordinator is not None:
+            # Flush pending writes before closing connections
+            await _coordinator.stop()
+            _coordinator = None
+
+        for conn in _reader_conns:
+            await conn.close()
+        _reader_conns.clear()
+        _readers = None
+
+        if _writer is not None:
+            await _writer.close()
+            _writer = None
 
 
 @asynccontextmanager
 async def get_db():
     """
-    Async context manager that returns a database connection.
+    Async context manager that returns a pooled read connection.
     Usage: async with get_db() as db:
     """
-    conn = await aiosqlite.connect(DB_PATH)
-    conn.row_factory = aiosqlite.Row
-    # Set isolation level to ensure we read committed data
-    await conn.execute("PRAGMA read_uncommitted=0")
+    if _readers is None:
+        raise RuntimeError("Database is not initialized, call init_db() first")
+
+    pool = _readers
+    conn = await pool.get()
     try:
         yield conn
     finally:
-        await conn.close()
\ No newline at end of file
+        if conn.in_transaction:
+            await conn.rollback()
+        pool.put_nowait(conn)
+
+
+def write_queue_depth() -> int:
+    """Writes waiting for the write coordinator"""
+    return _coordinator.queue_depth if _coordinator is not None else 0
+
+
+async def run_write(op: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+    """
+    Run a write operation on the writer connection and wait for its commit.
+    The operation must not commit or roll back itself.
+    Usage: await run_write(lambda db: db.execute(...))
+    """
+    if _coordinator is None:
+        raise RuntimeError("Database is not initialized, call init_db() first")
+    # The writer runs in the coordinator's task, so charge the wait for the
+    # commit to the update that asked for it
+    started = time.perf_counter()
+    try:
+        return await _coordinator.submit(op)
+    finally:
+        add_phase("db", time.perf_counter() - started)
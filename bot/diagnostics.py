@@ -0,0 +1,188 @@
+# bot/diagnostics.py
+"""
+Runtime diagnostics for "the bot feels slow".
+
+- LoopLagMonitor wakes up every interval and measures how late it ran.
+  A late timer means something blocked the event loop.
+- SlowUpdateLog keeps updates that took longer than a threshold, with the
+  handler that ran and how the time split between the database, the Bot
+  API and everything else (Python code and waits on internal queues).
+  The split comes from metrics.UpdateTrace, so it needs METRICS_ENABLED.
+  Calls a handler runs concurrently are summed and can exceed the total.
+- SamplingProfiler samples the event loop thread's stack from another
+  thread for N seconds and writes collapsed stacks ("a;b;c count", the
+  input format of flamegraph.pl and speedscope) to a file.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures event loop lag with a periodic timer"""
+
+    def __init__(self, interval: float, warn_threshold: float):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._task: Optional[asyncio.Task] = None
+        self.last = 0.0
+        self.max = 0.0
+        self.stalls = 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            metrics.loop_lag.observe(lag)
+            if lag >= self.warn_threshold:
+                self.stalls += 1
+                logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {"last_ms": round(self.last * 1000, 1), "max_ms": round(self.max * 1000, 1), "stalls": self.stalls}
+
+
+@dataclass
+class SlowUpdate:
+    at: float
+    event_type: str
+    handler: Optional[str]
+    total: float
+    db: float
+    api: float
+
+    @property
+    def python(self) -> float:
+        """Time not spent waiting on the database or the Bot API"""
+        return max(0.0, self.total - self.db - self.api)
+
+    def describe(self) -> str:
+        return (
+            f"{self.event_type} {self.handler or '-'}: {self.total * 1000:.0f} ms "
+            f"(db {self.db * 1000:.0f}, api {self.api * 1000:.0f}, python {self.python * 1000:.0f})"
+        )
+
+
+class SlowUpdateLog:
+    """The most recent updates that took at least `threshold` seconds"""
+
+    def __init__(self, threshold: float, size: int):
+        self.threshold = threshold
+        self._records: Deque[SlowUpdate] = deque(maxlen=max(1, size))
+        self.count = 0
+
+    def observe(self, event_type: str, trace: metrics.UpdateTrace, elapsed: float):
+        if elapsed < self.threshold:
+            return
+        record = SlowUpdate(time.time(), event_type, trace.handler, elapsed, trace.db, trace.api)
+        self._records.append(record)
+        self.count += 1
+        logger.warning("Slow update: %s", record.describe())
+
+    def recent(self, limit: int = 10) -> List[SlowUpdate]:
+        return list(self._records)[-limit:]
+
+    def stats(self) -> Dict[str, int]:
+        return {"slow_updates": self.count}
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack; one profile at a time"""
+
+    def __init__(self, directory: str, interval: float, max_seconds: float):
+        self.directory = directory
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.running = False
+
+    def _sample(self, thread_id: int, seconds: float) -> Tuple[Counter, int]:
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = getattr(code, "co_qualname", code.co_name)
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{name}")
+                frame = frame.f_back
+            if stack:
+                stacks[";".join(reversed(stack))] += 1
+                samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+    def _profile(self, thread_id: int, seconds: float) -> Tuple[str, int]:
+        stacks, samples = self._sample(thread_id, seconds)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S.txt"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path, samples
+
+    async def run(self, seconds: float) -> Tuple[str, int]:
+        """Profile the calling event loop for `seconds`; returns (path, samples)"""
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        self.running = True
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._profile, threading.get_ident(), seconds)
+        finally:
+            self.running = False
+
+
+lag_monitor = LoopLagMonitor(
+    interval=settings.DIAG_LAG_INTERVAL_SECONDS,
+    warn_threshold=settings.DIAG_LAG_WARN_MS / 1000,
+)
+slow_updates = SlowUpdateLog(
+    threshold=settings.DIAG_SLOW_UPDATE_MS / 1000,
+    size=settings.DIAG_SLOW_UPDATE_HISTORY,
+)
+profiler = SamplingProfiler(
+    directory=settings.DIAG_PROFILE_DIR,
+    interval=settings.DIAG_PROFILE_INTERVAL_MS / 1000,
+    max_seconds=settings.DIAG_PROFILE_MAX_SECONDS,
+)
+
+
+def start():
+    if settings.DIAG_ENABLED:
+        lag_monitor.start()
+
+
+async def stop():
+    await lag_monitor.stop()
+
+
+def stats() -> Dict[str, Any]:
+    return {**lag_monitor.stats(), **slow_updates.stats()}
@@ -0,0 +1,80 @@
+# bot/export.py
+"""
+Export users or referrals to CSV or JSONL at constant memory.
+
+Rows are streamed from the database in keyset-ordered batches and each
+batch is appended to the output file before the next one is read.
+
+Usage:
+    python -m bot.export users --format csv --output users.csv
+    python -m bot.export referrals --format jsonl --output referrals.jsonl
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List
+
+import aiofiles
+
+from . import models
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    "users": ["user_id", "username", "full_name", "invited_by", "referrals_count", "is_member"],
+    "referrals": ["id", "inviter_id", "invited_id", "created_at"],
+}
+
+
+def _format_batch(rows: List[Dict[str, Any]], fmt: str, columns: List[str]) -> str:
+    if fmt == "jsonl":
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    buf = io.StringIO()
+    csv.DictWriter(buf, fieldnames=columns).writerows(rows)
+    return buf.getvalue()
+
+
+async def export_table(table: str, fmt: str, output: str, batch_size: int = 5000) -> int:
+    """Write every row of `table` to `output`; returns the number of rows written"""
+    columns = COLUMNS[table]
+    batches: AsyncIterator[List[Dict[str, Any]]] = (
+        models.iter_users(batch_size) if table == "users" else models.iter_referrals(batch_size)
+    )
+
+    # Write to a temp file and rename, so readers never see a partial export
+    tmp_path = output + ".tmp"
+    count = 0
+    async with aiofiles.open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            await f.write(",".join(columns) + "\r\n")
+        async for rows in batches:
+            await f.write(_format_batch(rows, fmt, columns))
+            count += len(rows)
+    os.replace(tmp_path, output)
+    return count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=sorted(COLUMNS))
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    await storage.open()
+    try:
+        count = await export_table(args.table, args.format, args.output, args.batch_size)
+    finally:
+        await storage.close()
+    logger.info("Exported %d %s rows to %s", count, args.table, args.output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
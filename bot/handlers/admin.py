@@ -0,0 +1,122 @@
+# bot/handlers/admin.py
+import asyncio
+import html
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
+from .. import diagnostics, models
+from ..config import settings
+from ..services import broadcast as broadcast_service
+from ..services import stats as stats_service
+from ..services.delivery import delivery
+import logging
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Every handler in this router is admin-only
+router.message.filter(F.from_user.id.in_(set(settings.ADMIN_IDS)))
+
+
+@router.message(Command("broadcast"))
+async def broadcast_handler(message: types.Message):
+    """Send the replied-to message to every user"""
+    source = message.reply_to_message
+    if not source:
+        await message.answer(
+            "📣 Yubormoqchi bo'lgan xabaringizga javob tariqasida /broadcast yuboring."
+        )
+        return
+
+    broadcast_id = await broadcast_service.create_broadcast(
+        message.from_user.id, source.chat.id, source.message_id
+    )
+    logger.info("Admin %s started broadcast %s", message.from_user.id, broadcast_id)
+
+    await message.answer(
+        f"📣 Xabar yuborish #{broadcast_id} boshlandi.\n"
+        f"Yakunlangach natijalar shu yerga yuboriladi."
+    )
+
+
+@router.message(Command("top"))
+async def top_handler(message: types.Message, command: CommandObject):
+    """Leaderboard of inviters: /top [N], N up to 50 (default 10)"""
+    try:
+        limit = min(max(int(command.args), 1), 50) if command.args else 10
+    except ValueError:
+        limit = 10
+
+    rows = await models.top_inviters(limit)
+    if not rows:
+        await message.answer("🏆 Hali referallar yo'q.")
+        return
+
+    lines = [f"🏆 Top {len(rows)} taklif qiluvchilar:\n"]
+    for place, row in enumerate(rows, start=1):
+        name = row["full_name"] or (f"@{row['username']}" if row["username"] else str(row["user_id"]))
+        lines.append(f"{place}. {html.escape(name)} (<code>{row['user_id']}</code>) — {row['referrals_count']}")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("stats"))
+async def stats_handler(message: types.Message):
+    """New users and referrals from the rollup tables"""
+    summary = await stats_service.summary()
+    total_users, total_referrals = summary["total"]
+    day_users, day_referrals = summary["last_24h"]
+    lines = [
+        "📊 Statistika (UTC)\n",
+        f"👥 Jami foydalanuvchilar: {total_users}",
+        f"🔗 Jami referallar: {total_referrals}",
+        f"🕐 Oxirgi 24 soat: +{day_users} foydalanuvchi, +{day_referrals} referal\n",
+        "📅 Oxirgi 7 kun:",
+    ]
+    lines.extend(f"{day}: +{users} / +{referrals}" for day, (users, referrals) in summary["days"])
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("diag"))
+async def diag_handler(message: types.Message):
+    """Event loop lag and the most recent slow updates"""
+    lag = diagnostics.lag_monitor.stats()
+    lines = [
+        "🩺 Diagnostika",
+        f"Event loop lag: {lag['last_ms']} ms (max {lag['max_ms']} ms, {lag['stalls']} stalls)",
+        f"Slow updates (≥ {settings.DIAG_SLOW_UPDATE_MS:.0f} ms): {diagnostics.slow_updates.count}",
+    ]
+    lines.extend(f"• {record.describe()}" for record in diagnostics.slow_updates.recent(5))
+    await message.answer("\n".join(lines), parse_mode=None)
+
+
+# Profiles still running; the handler returns right away
+_profiles = set()
+
+
+async def _profile_and_report(chat_id: int, seconds: float):
+    try:
+        path, samples = await diagnostics.profiler.run(seconds)
+    except Exception as e:
+        logger.error("Profiler failed: %s", e)
+        delivery.send_message(chat_id, f"❌ Profiler xatosi: {e}", parse_mode=None)
+        return
+    logger.info("Profile with %d samples saved to %s", samples, path)
+    delivery.send_message(chat_id, f"✅ Profil saqlandi: {path}\nNamunalar: {samples}", parse_mode=None)
+
+
+@router.message(Command("profiler"))
+async def profiler_handler(message: types.Message, command: CommandObject):
+    """Sample the event loop for N seconds (default 10) and save the stacks to disk"""
+    try:
+        seconds = float(command.args) if command.args else 10.0
+    except ValueError:
+        await message.answer("Foydalanish: /profiler [soniyalar]")
+        return
+    if diagnostics.profiler.running:
+        await message.answer("⏳ Profiler allaqachon ishlayapti.")
+        return
+
+    seconds = min(max(seconds, 1.0), diagnostics.profiler.max_seconds)
+    task = asyncio.create_task(_profile_and_report(message.chat.id, seconds))
+    _profiles.add(task)
+    task.add_done_callback(_profiles.discard)
+    await message.answer(f"🔬 Profiler {seconds:.0f} soniyaga ishga tushdi.")
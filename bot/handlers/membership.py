@@ -0,0 +1,24 @@
+# bot/handlers/membership.py
+from aiogram import Router, types
+from ..services.subscription import channel_for_chat, record_status, status_name
+import logging
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+@router.chat_member()
+async def handle_chat_member(update: types.ChatMemberUpdated):
+    """
+    Track joins and leaves in the required channels, so subscription
+    checks can be answered without calling getChatMember.
+    Telegram only sends these updates to channel admins.
+    """
+    channel = channel_for_chat(update.chat)
+    if channel is None:
+        return
+
+    user_id = update.new_chat_member.user.id
+    status = status_name(update.new_chat_member.status)
+    logger.debug("Channel %s: user %s is now %s", channel, user_id, status)
+    await record_status(channel, user_id, status)
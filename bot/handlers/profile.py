@@ -6,6 +6,7 @@ from ..config import settings
 from ..keyboards import main_menu_keyboard
 
 router = Router()
+REFERRAL_THRESHOLD = settings.REFERRAL_THRESHOLD
 
 
 @router.message(Command("profile"))
@@ -29,19 +30,19 @@ async def profile_handler(message: types.Message):
     
     profile_text = (
         f"👤 Sizning profilingiz:\n\n"
-        f"📊 Referallar: {referrals}/7\n"
+        f"📊 Referallar: {referrals}/{REFERRAL_THRESHOLD}\n"
         f"📍 Status: {status}\n\n"
     )
     
-    if referrals >= 7:
+    if referrals >= REFERRAL_THRESHOLD:
         profile_text += (
             f"🎊 TABRIKLAYMIZ!\n"
-            f"Siz 7 ta referalni to'pladingiz va yopiq guruhga kirish huquqini oldingiz! 🔐"
+            f"Siz {REFERRAL_THRESHOLD} ta referalni to'pladingiz va yopiq guruhga kirish huquqini oldingiz! 🔐"
         )
     else:
         profile_text += (
             f"🔗 Sizning referal havolangiz:\n{ref_link}\n\n"
-            f"🎯 Yana {7 - referrals} ta referal kerak!"
+            f"🎯 Yana {REFERRAL_THRESHOLD - referrals} ta referal kerak!"
         )
     
     await message.answer(profile_text, reply_markup=main_menu_keyboard())
\ No newline at end of file
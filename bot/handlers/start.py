@@ -1,33 +1,16 @@
-# bot/config.py
-from typing import List, Optional
-from pydantic_settings import BaseSettings, SettingsConfigDict
-
-class Settings(BaseSettings):
-    model_config = SettingsConfigDict(
-        env_file=".env",
-        env_file_encoding="utf-8"
-    )
-
-    BOT_TOKEN: str
-    CHANNEL_1: str
-    CHANNEL_2: str
-    BOT_USERNAME: str
-    ADMIN_IDS: List[int]
-    ADMIN_PANEL_TOKEN: str
-    DATABASE_PATH: str
-    PRIVATE_GROUP_LINK: Optional[str] = None
-
-settings = Settings()
+# bot/handlers/start.py
 from aiogram import Router, types, Bot, F
 from aiogram.filters import CommandStart
 from ..services.subscription import check_subscriptions
 from ..services import referral as referral_service
+from ..services.delivery import delivery, Priority
 from .. import models
 from ..keyboards import channels_keyboard, main_menu_keyboard, admin_contact_keyboard, private_group_keyboard
 from ..config import settings
 import logging
 
 router = Router()
+REFERRAL_THRESHOLD = settings.REFERRAL_THRESHOLD
 logger = logging.getLogger(__name__)
 
 
@@ -80,90 +63,90 @@ async def start_handler(message: types.Message, bot: Bot):
         )
     else:
         # Already subscribed
-        await show_subscribed_message(message, bot, user.id, ref)
+        await show_subscribed_message(message, bot, user, ref)
+
+
+async def complete_onboarding(bot: Bot, user: types.User, ref: int = None) -> int:
+    """
+    Record a subscribed user and credit their inviter; returns the user's
+    own referral count
+    """
+    full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+    result = await referral_service.onboard(user.id, user.username, full_name, inviter=ref)
+
+    if result.referral_added:
+        inviter_id, ref_count = result.inviter_id, result.inviter_count
+        logger.debug("User %s credited to inviter %s, count=%s", user.id, inviter_id, ref_count)
+        try:
+            delivery.send_message(
+                inviter_id,
+                f"🎉 Yangi referal!\n\n"
+                f"👤 {user.first_name} sizning havolangiz orqali qo'shildi!\n\n"
+                f"📊 Sizning referallaringiz: {ref_count}/{REFERRAL_THRESHOLD}"
+            )
+
+            # Grant access once, when the inviter crosses the threshold
+            if ref_count == REFERRAL_THRESHOLD:
+                await send_private_group_access(bot, inviter_id)
+        except Exception as e:
+            logger.error("Error notifying inviter %s: %s", inviter_id, e)
 
+    return result.referrals_count
 
-async def show_subscribed_message(message: types.Message, bot: Bot, user_id: int, ref: int = None):
+
+async def show_subscribed_message(message: types.Message, bot: Bot, user: types.User, ref: int = None):
     """Show message after successful subscription"""
-    # Mark user as member
-    await models.set_user_member(user_id)
-    
-    # Try to register referral if user came via referral link
-    if ref:
-        logger.info(f"User {user_id} came via referral link from {ref}")
-        inviter_id, added, ref_count = await referral_service.try_register_referral(user_id)
-        logger.info(f"try_register_referral returned: inviter_id={inviter_id}, added={added}, count={ref_count}")
-        
-        if added and inviter_id:
-            try:
-                # Get the invited user's info
-                invited_user = await bot.get_chat(user_id)
-                logger.info(f"Sending notification to {inviter_id} with count {ref_count}")
-                
-                await bot.send_message(
-                    inviter_id,
-                    f"🎉 Yangi referal!\n\n"
-                    f"👤 {invited_user.first_name} sizning havolangiz orqali qo'shildi!\n\n"
-                    f"📊 Sizning referallaringiz: {ref_count}/7"
-                )
-                
-                # Check if inviter reached 7 referrals
-                if ref_count >= 7:
-                    await send_private_group_access(bot, inviter_id)
-            except Exception as e:
-                logger.error(f"Error notifying inviter {inviter_id}: {e}")
-        else:
-            logger.warning(f"Referral not added: inviter_id={inviter_id}, added={added}")
+    user_ref_count = await complete_onboarding(bot, user, ref)
 
-    # Check user's own referral count
-    user_ref_count = await models.referral_count(user_id)
-    
-    if user_ref_count >= 7:
-        # User has 7+ referrals, give access
-        await send_private_group_access(bot, user_id)
+    if user_ref_count >= REFERRAL_THRESHOLD:
+        # User reached the threshold, give access
+        await send_private_group_access(bot, user.id)
     else:
         # Show referral link
-        ref_link = f"https://t.me/{settings.BOT_USERNAME}?start={user_id}"
+        ref_link = f"https://t.me/{settings.BOT_USERNAME}?start={user.id}"
         await message.answer(
             f"✅ Ajoyib! Siz kanallarga muvaffaqiyatli obuna bo'ldingiz!\n\n"
-            f"🎯 Endi yopiq guruhga kirish uchun 7 ta do'stingizni taklif qiling.\n\n"
-            f"📊 Sizning referallaringiz: {user_ref_count}/7\n\n"
+            f"🎯 Endi yopiq guruhga kirish uchun {REFERRAL_THRESHOLD} ta do'stingizni taklif qiling.\n\n"
+            f"📊 Sizning referallaringiz: {user_ref_count}/{REFERRAL_THRESHOLD}\n\n"
             f"🔗 Sizning referal havolangiz:\n{ref_link}\n\n"
             f"💡 Havolani do'stlaringizga yuboring va ular botni boshlashini kuting!"
         )
 
 
 async def send_private_group_access(bot: Bot, user_id: int):
-    """Send private group link to user who has 7 referrals"""
+    """Send private group link to user who reached the referral threshold"""
     try:
         private_group_link = settings.PRIVATE_GROUP_LINK
         
-        await bot.send_message(
+        await delivery.send_message(
             user_id,
             "🎊 TABRIKLAYMIZ! 🎊\n\n"
-            "🌟 Siz 7 ta referal to'pladingiz va yopiq guruhga kirish huquqini qo'lga kiritdingiz!\n\n"
+            f"🌟 Siz {REFERRAL_THRESHOLD} ta referal to'pladingiz va yopiq guruhga kirish huquqini qo'lga kiritdingiz!\n\n"
             "👇 Quyidagi tugmani bosib guruhga qo'shilish so'rovini yuboring.\n"
             "Bot avtomatik ravishda sizni tasdiqlaydi.",
+            priority=Priority.APPROVAL,
             reply_markup=private_group_keyboard(private_group_link)
         )
     except AttributeError:
         # PRIVATE_GROUP_LINK not set in config
         logger.error("PRIVATE_GROUP_LINK not configured in settings")
-        await bot.send_message(
+        await delivery.send_message(
             user_id,
             "🎊 TABRIKLAYMIZ! 🎊\n\n"
-            "🌟 Siz 7 ta referal to'pladingiz va yopiq guruhga kirish huquqini qo'lga kiritdingiz!\n\n"
+            f"🌟 Siz {REFERRAL_THRESHOLD} ta referal to'pladingiz va yopiq guruhga kirish huquqini qo'lga kiritdingiz!\n\n"
             "📞 Admin bilan bog'laning, sizga guruh havolasi beriladi.",
+            priority=Priority.APPROVAL,
             reply_markup=admin_contact_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error sending private group access to {user_id}: {e}")
+        logger.error("Error sending private group access to %s: %s", user_id, e)
         # Send a fallback message
-        await bot.send_message(
+        await delivery.send_message(
             user_id,
             "🎊 TABRIKLAYMIZ! 🎊\n\n"
-            "🌟 Siz 7 ta referal to'pladingiz!\n\n"
+            f"🌟 Siz {REFERRAL_THRESHOLD} ta referal to'pladingiz!\n\n"
             "📞 Admin bilan bog'laning.",
+            priority=Priority.APPROVAL,
             reply_markup=admin_contact_keyboard()
         )
 
@@ -184,47 +167,14 @@ async def check_subscription_callback(callback: types.CallbackQuery, bot: Bot):
         )
         return
 
-    # Mark user as member
-    await models.set_user_member(user.id)
-    
-    # Check if user came via referral
-    inviter_id = await models.get_inviter(user.id)
-    logger.info(f"Callback: User {user.id} has inviter: {inviter_id}")
-    
-    if inviter_id:
-        inviter_id_result, added, ref_count = await referral_service.try_register_referral(user.id)
-        logger.info(f"Callback: try_register_referral returned: inviter_id={inviter_id_result}, added={added}, count={ref_count}")
-        
-        if added and inviter_id_result:
-            try:
-                # Get the invited user's info
-                invited_user = await bot.get_chat(user.id)
-                logger.info(f"Callback: Sending notification to {inviter_id_result} with count {ref_count}")
-                
-                await bot.send_message(
-                    inviter_id_result,
-                    f"🎉 Yangi referal!\n\n"
-                    f"👤 {invited_user.first_name} sizning havolangiz orqali qo'shildi!\n\n"
-                    f"📊 Sizning referallaringiz: {ref_count}/7"
-                )
-                
-                # Check if inviter reached 7 referrals
-                if ref_count >= 7:
-                    await send_private_group_access(bot, inviter_id_result)
-            except Exception as e:
-                logger.error(f"Error notifying inviter {inviter_id_result}: {e}")
-        else:
-            logger.warning(f"Callback: Referral not added: inviter_id={inviter_id_result}, added={added}")
-
-    # Check user's referral count
-    user_ref_count = await models.referral_count(user.id)
+    user_ref_count = await complete_onboarding(bot, user)
     
-    if user_ref_count >= 7:
-        # User already has 7+ referrals
+    if user_ref_count >= REFERRAL_THRESHOLD:
+        # User already reached the threshold
         await send_private_group_access(bot, user.id)
         await callback.message.edit_text(
             "✅ Obuna tasdiqlandi!\n\n"
-            "🎊 Siz allaqachon 7 ta referal to'plab bo'lgansiz!\n"
+            f"🎊 Siz allaqachon {REFERRAL_THRESHOLD} ta referal to'plab bo'lgansiz!\n"
             "Yopiq guruh havolasi yuqorida yuborildi."
         )
     else:
@@ -232,8 +182,8 @@ async def check_subscription_callback(callback: types.CallbackQuery, bot: Bot):
         ref_link = f"https://t.me/{settings.BOT_USERNAME}?start={user.id}"
         await callback.message.edit_text(
             f"✅ Ajoyib! Siz kanallarga muvaffaqiyatli obuna bo'ldingiz!\n\n"
-            f"🎯 Endi yopiq guruhga kirish uchun 7 ta do'stingizni taklif qiling.\n\n"
-            f"📊 Sizning referallaringiz: {user_ref_count}/7\n\n"
+            f"🎯 Endi yopiq guruhga kirish uchun {REFERRAL_THRESHOLD} ta do'stingizni taklif qiling.\n\n"
+            f"📊 Sizning referallaringiz: {user_ref_count}/{REFERRAL_THRESHOLD}\n\n"
             f"🔗 Sizning referal havolangiz:\n{ref_link}\n\n"
             f"💡 Havolani do'stlaringizga yuboring va ular botni boshlashini kuting!"
         )
@@ -255,22 +205,22 @@ async def my_referrals_handler(message: types.Message):
         return
 
     referrals = row["referrals_count"] if row["referrals_count"] is not None else 0
-    logger.info(f"User {user.id} referrals from DB: {referrals}, row data: {dict(row)}")
+    logger.debug("User %s referrals from DB: %s", user.id, referrals)
     ref_link = f"https://t.me/{settings.BOT_USERNAME}?start={user.id}"
     
-    if referrals >= 7:
+    if referrals >= REFERRAL_THRESHOLD:
         await message.answer(
             f"🎊 TABRIKLAYMIZ!\n\n"
-            f"✅ Siz 7 ta referalni to'pladingiz!\n"
-            f"📊 Jami referallar: {referrals}/7\n\n"
+            f"✅ Siz {REFERRAL_THRESHOLD} ta referalni to'pladingiz!\n"
+            f"📊 Jami referallar: {referrals}/{REFERRAL_THRESHOLD}\n\n"
             f"🔐 Yopiq guruhga kirish huquqingiz faol.",
             reply_markup=main_menu_keyboard()
         )
     else:
         await message.answer(
             f"📊 Sizning statistikangiz:\n\n"
-            f"👥 Referallar: {referrals}/7\n"
-            f"🎯 Qolgan: {7 - referrals} ta\n\n"
+            f"👥 Referallar: {referrals}/{REFERRAL_THRESHOLD}\n"
+            f"🎯 Qolgan: {REFERRAL_THRESHOLD - referrals} ta\n\n"
             f"🔗 Sizning referal havolangiz:\n{ref_link}\n\n"
             f"💡 Havolani do'stlaringizga ulashing!",
             reply_markup=main_menu_keyboard()
@@ -292,7 +242,7 @@ async def continue_without_referral_handler(message: types.Message):
     """Handle continue without referral option"""
     await message.answer(
         "💳 Referalsiz davom etish\n\n"
-        "Agar siz 7 ta referal to'play olmasangiz, yopiq guruhga to'g'ridan-to'g'ri "
+        f"Agar siz {REFERRAL_THRESHOLD} ta referal to'play olmasangiz, yopiq guruhga to'g'ridan-to'g'ri "
         "kirish uchun admin bilan bog'lanishingiz mumkin.\n\n"
         "Admin sizga to'lov variantlarini taklif qiladi.",
         reply_markup=admin_contact_keyboard()
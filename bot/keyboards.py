@@ -26,18 +26,17 @@ def channels_keyboard():
     """Keyboard with channel subscription links"""
     buttons = [
         [InlineKeyboardButton(
-            text="1-kanal", 
-            url=_format_channel_url(settings.CHANNEL_1)
-        )],
-        [InlineKeyboardButton(
-            text="2-kanal", 
-            url=_format_channel_url(settings.CHANNEL_2)
-        )],
+            text=f"{i}-kanal", 
+            url=_format_channel_url(channel)
+        )]
+        for i, channel in enumerate(settings.required_channels, start=1)
+    ]
+    buttons.append(
         [InlineKeyboardButton(
             text="✅ Obunani tekshirish", 
             callback_data="check_subscription"
         )]
-    ]
+    )
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
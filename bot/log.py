@@ -0,0 +1,113 @@
+# bot/log.py
+import atexit
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .config import settings
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Pass as `extra=SAMPLED` on chatty per-request INFO/DEBUG records; only
+# LOG_SAMPLE_RATE of them are kept. Warnings and errors are never sampled.
+SAMPLED = {"sampled": True}
+
+
+class SampleFilter(logging.Filter):
+    """Keep `rate` of the records marked with extra=SAMPLED"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves all formatting to the listener thread.
+
+    The stock prepare() renders the message and traceback on the calling
+    thread, which is the event loop. Here the record goes on the queue as
+    is, so the loop only pays for creating it. Arguments are formatted
+    later, so don't log objects that are mutated right after the call.
+    When the queue is full, records are counted and dropped rather than
+    blocking the loop.
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[DeferredQueueHandler] = None
+
+
+def setup_logging(
+    level: str = settings.LOG_LEVEL,
+    sample_rate: float = settings.LOG_SAMPLE_RATE,
+    queue_size: int = settings.LOG_QUEUE_SIZE,
+    target: Optional[logging.Handler] = None,
+) -> QueueListener:
+    """
+    Route the root logger through a queue to a background thread that
+    formats and writes records (to stderr unless `target` is given).
+    Safe to call again; the previous listener is stopped first.
+    """
+    global _listener, _handler
+    stop_logging()
+
+    target = target or logging.StreamHandler()
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+    _handler.addFilter(SampleFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(_handler.queue, target, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        while True:
+            try:
+                _listener.stop()
+                break
+            except queue.Full:
+                # No room for the stop sentinel yet; the thread is draining
+                time.sleep(0.01)
+        for handler in _listener.handlers:
+            handler.flush()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+atexit.register(stop_logging)
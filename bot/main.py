@@ -9,42 +9,124 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from .config import settings
-from .db import init_db
-from .handlers import start as start_h, profile as profile_h, common as common_h, join_request as join_req_h
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from . import diagnostics, log, metrics, models
+from .storage import storage
+from .middlewares.metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from .middlewares.diagnostics import SlowUpdateMiddleware
+from .middlewares.throttling import antiflood
+from .services.delivery import delivery
+from .services.subscription import membership_cache
+from .services.join_requests import join_requests
+from .services.sweeper import sweeper
+from .services import broadcast as broadcast_service
+from .services import reconcile as reconcile_service
+from .handlers import start as start_h, profile as profile_h, common as common_h, join_request as join_req_h, admin as admin_h
+from .handlers import membership as membership_h
+
+# Records are formatted and written on a background thread, not the event loop
+log.setup_logging()
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = settings.BOT_TOKEN
 
-
-async def main():
-    """Main bot entry point"""
-    # Initialize database
-    logger.info("Initializing database...")
-    await init_db()
-
-    # Create bot instance with HTML parse mode
+# Queue depths and component counters, read on each metrics scrape
+metrics.queue_depth.add(storage.write_queue_depth, "db_write")
+metrics.queue_depth.add(lambda: delivery.queue_depth, "delivery")
+metrics.queue_depth.add(lambda: join_requests.queue_depth, "join_requests")
+metrics.component_stats.add(delivery.stats, "delivery")
+metrics.component_stats.add(join_requests.stats, "join_requests")
+metrics.component_stats.add(models.user_cache.stats, "user_cache")
+metrics.component_stats.add(membership_cache.stats, "membership_cache")
+metrics.component_stats.add(lambda: reconcile_service.stats, "reconcile")
+metrics.component_stats.add(antiflood.stats, "antiflood")
+metrics.component_stats.add(sweeper.stats, "sweeper")
+metrics.component_stats.add(lambda: {"dropped": log.dropped_records()}, "logging")
+metrics.component_stats.add(diagnostics.stats, "diagnostics")
+
+
+def create_bot() -> Bot:
+    """Create bot instance with HTML parse mode"""
     bot = Bot(
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-
+    if settings.METRICS_ENABLED:
+        bot.session.middleware(ApiMetricsMiddleware())
+    return bot
+
+
+async def on_startup(bot: Bot):
+    """Runs once before the bot starts receiving updates"""
+    logger.info("Initializing %s database...", storage.name)
+    diagnostics.start()
+    await storage.open()
+    await models.load_eligible_users()
+    delivery.start(bot)
+    join_requests.start()
+    reconcile_service.start()
+    sweeper.start(bot)
+    broadcast_service.start()
+
+
+async def on_shutdown():
+    """Runs once after the bot stops receiving updates"""
+    logger.info("Shutting down bot...")
+    await broadcast_service.stop_broadcasts()
+    await reconcile_service.stop()
+    await sweeper.stop()
+    await join_requests.stop()
+    await delivery.stop()
+    await storage.close()
+    await diagnostics.stop()
+
+
+def create_dispatcher() -> Dispatcher:
+    """Create dispatcher with all routers and lifecycle hooks registered"""
     # Create dispatcher with memory storage
     dp = Dispatcher(storage=MemoryStorage())
 
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    if settings.METRICS_ENABLED:
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+        # Inner middlewares on the root router apply to handlers in every router
+        handler_metrics = HandlerMetricsMiddleware()
+        for name, observer in dp.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(handler_metrics)
+    if settings.DIAG_ENABLED:
+        dp.update.outer_middleware(SlowUpdateMiddleware())
+
+    # Drop repeated taps and re-sent commands before they reach handlers
+    dp.message.outer_middleware(antiflood)
+    dp.callback_query.outer_middleware(antiflood)
+
     # Register all routers
+    dp.include_router(admin_h.router)
     dp.include_router(start_h.router)
     dp.include_router(profile_h.router)
     dp.include_router(common_h.router)
     dp.include_router(join_req_h.router)
+    if settings.MEMBERSHIP_TRACKING:
+        # Also adds chat_member to allowed_updates via resolve_used_update_types
+        dp.include_router(membership_h.router)
+
+    return dp
+
+
+async def main():
+    """Main bot entry point (long polling)"""
+    bot = create_bot()
+    dp = create_dispatcher()
+    metrics_runner = None
 
     try:
+        if settings.METRICS_ENABLED and settings.METRICS_PORT:
+            metrics_runner = await metrics.start_server(settings.METRICS_HOST, settings.METRICS_PORT)
         logger.info("Bot is starting...")
+        # getUpdates does not work while a webhook is set
+        await bot.delete_webhook()
         # Start polling
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
@@ -58,12 +140,22 @@ async def main():
         logger.exception("Unexpected error occurred: %s", e)
 
     finally:
-        logger.info("Shutting down bot...")
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         await bot.session.close()
 
 
+def run():
+    """Start the bot in the mode selected by RUN_MODE"""
+    if settings.RUN_MODE == "webhook":
+        from .webhook import run_webhook
+        run_webhook()
+    else:
+        asyncio.run(main())
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        run()
     except KeyboardInterrupt:
-        logger.info("Program terminated by user")
\ No newline at end of file
+        logger.info("Program terminated by user")
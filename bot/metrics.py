@@ -0,0 +1,261 @@
+# bot/metrics.py
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are updated from middlewares and wrappers around
+the database connections and the Bot API session; callback gauges are
+read when the endpoint is scraped. Metrics are per process: with several
+webhook workers each scrape sees the worker that answered it.
+"""
+import bisect
+import logging
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets, one series per label set"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels: Any):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class CallbackGauge(_Metric):
+    """
+    Gauge read at scrape time. The callback returns a number, or a dict of
+    label value -> number when the gauge has one label.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks: List[Tuple[Tuple, Callable[[], Any]]] = []
+
+    def add(self, callback: Callable[[], Any], *labels: Any):
+        """Register a callback for the series identified by `labels`"""
+        self._callbacks.append((labels, callback))
+
+    def samples(self) -> Iterable[str]:
+        for labels, callback in self._callbacks:
+            try:
+                value = callback()
+            except Exception as e:
+                logger.warning("Metric callback for %s failed: %s", self.name, e)
+                continue
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    if isinstance(item, (int, float)) and not isinstance(item, bool):
+                        yield f"{self.name}{_labels(self.labelnames, labels + (key,))} {_number(item)}"
+            elif value is not None:
+                yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+update_latency = REGISTRY.register(Histogram(
+    "bot_update_duration_seconds", "Time to process an update, by event type", ["event_type"]
+))
+update_errors = REGISTRY.register(Counter(
+    "bot_update_errors_total", "Updates whose processing raised, by event type", ["event_type"]
+))
+handler_latency = REGISTRY.register(Histogram(
+    "bot_handler_duration_seconds", "Time spent in a handler", ["handler"]
+))
+db_query_latency = REGISTRY.register(Histogram(
+    "bot_db_query_duration_seconds", "Time to execute a database statement", ["statement"]
+))
+api_latency = REGISTRY.register(Histogram(
+    "bot_api_request_duration_seconds", "Bot API call latency, by method", ["method"]
+))
+api_errors = REGISTRY.register(Counter(
+    "bot_api_errors_total", "Failed Bot API calls, by method and error", ["method", "error"]
+))
+queue_depth = REGISTRY.register(CallbackGauge(
+    "bot_queue_depth", "Items waiting in an internal queue", ["queue"]
+))
+component_stats = REGISTRY.register(CallbackGauge(
+    "bot_component_stats", "Counters reported by internal components", ["component", "stat"]
+))
+loop_lag = REGISTRY.register(Histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop ran a timer scheduled by the lag monitor"
+))
+
+
+class UpdateTrace:
+    """Where the time of one update went, filled in while it is processed"""
+
+    __slots__ = ("handler", "db", "api")
+
+    def __init__(self):
+        self.handler: Optional[str] = None
+        self.db = 0.0
+        self.api = 0.0
+
+
+# Trace of the update being processed by the current task. Tasks started by
+# a handler inherit it, so their database and API time is counted too.
+current_trace: ContextVar[Optional[UpdateTrace]] = ContextVar("current_trace", default=None)
+
+
+def add_phase(phase: str, seconds: float):
+    """Add database ("db") or Bot API ("api") time to the current update"""
+    trace = current_trace.get()
+    if trace is not None:
+        setattr(trace, phase, getattr(trace, phase) + seconds)
+
+
+_WHITESPACE = re.compile(r"\s+")
+_statement_labels: Dict[str, str] = {}
+
+
+def statement_label(sql: str) -> str:
+    """Whitespace-normalized SQL, used as the statement label"""
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = _WHITESPACE.sub(" ", sql).strip()
+        if len(_statement_labels) < 10_000:
+            _statement_labels[sql] = label
+    return label
+
+
+class InstrumentedConnection:
+    """
+    Proxy around an aiosqlite connection that times every execute() by
+    statement. Everything else is passed through to the connection.
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def execute(self, sql: str, parameters: Optional[Iterable[Any]] = None):
+        started = time.perf_counter()
+        try:
+            return await self._conn.execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            db_query_latency.observe(elapsed, statement_label(sql))
+            add_phase("db", elapsed)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Serve the metrics endpoint on its own port (used in polling mode)"""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Metrics available at http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,2 @@
+# bot/middlewares/__init__.py
+# registers middlewares package
@@ -0,0 +1,32 @@
+# bot/middlewares/diagnostics.py
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from .. import metrics
+from ..diagnostics import slow_updates
+
+
+class SlowUpdateMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: traces where each update's time goes and
+    hands updates over the threshold to the slow update log.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = metrics.UpdateTrace()
+        token = metrics.current_trace.set(trace)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.current_trace.reset(token)
+            event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+            slow_updates.observe(event_type, trace, time.perf_counter() - started)
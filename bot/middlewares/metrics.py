@@ -0,0 +1,75 @@
+# bot/middlewares/metrics.py
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from .. import metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: total processing time per update, by event type"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.update_errors.inc(event_type)
+            raise
+        finally:
+            metrics.update_latency.observe(time.perf_counter() - started, event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: time spent in the handler that matched the event"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__qualname__", None) or type(event).__name__
+        trace = metrics.current_trace.get()
+        if trace is not None:
+            trace.handler = name
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.handler_latency.observe(time.perf_counter() - started, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: Bot API latency and errors, by method"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.api_latency.observe(elapsed, name)
+            metrics.add_phase("api", elapsed)
@@ -0,0 +1,117 @@
+# bot/middlewares/throttling.py
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, User
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+PLEASE_WAIT = "⏳ Iltimos, kuting..."
+TOO_MANY = "⏳ Juda ko'p so'rov. Birozdan so'ng qayta urinib ko'ring."
+
+
+def _kind(event: TelegramObject) -> str:
+    """What makes two updates from one user duplicates of each other"""
+    if isinstance(event, CallbackQuery):
+        return f"callback:{event.data}"
+    if isinstance(event, Message) and event.text:
+        if event.text.startswith("/"):
+            # "/start 123" and "/start" both run start_handler
+            return event.text.split(maxsplit=1)[0].split("@", 1)[0]
+        return f"text:{event.text}"
+    return "message"
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """
+    Outer middleware for messages and callback queries.
+
+    Only one update of a given kind (same command, button text or callback
+    data) runs per user at a time; repeats that arrive meanwhile are
+    dropped, and callback queries get a cheap "please wait" answer instead
+    of running the handler. Each user also has a sliding-window limit of
+    `max_updates` per `window` seconds. Admins are exempt.
+    """
+
+    def __init__(self, max_updates: int, window: float):
+        self.max_updates = max_updates
+        self.window = window
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._history: Dict[int, Deque[float]] = {}
+        self._exempt = set(settings.ADMIN_IDS)
+        self.passed = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+
+    def _over_limit(self, user_id: int, now: float) -> bool:
+        if self.max_updates <= 0:
+            return False
+        history = self._history.get(user_id)
+        if history is None:
+            if len(self._history) >= 10_000:
+                # Forget users with no updates inside the window
+                self._history = {
+                    uid: h for uid, h in self._history.items() if h and h[-1] > now - self.window
+                }
+            history = self._history[user_id] = deque()
+        while history and history[0] <= now - self.window:
+            history.popleft()
+        if len(history) >= self.max_updates:
+            return True
+        history.append(now)
+        return False
+
+    async def _reject(self, event: TelegramObject, text: str):
+        # Callback buttons keep spinning until answered; messages are dropped silently
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer(text)
+            except Exception as e:
+                logger.debug("Could not answer throttled callback: %s", e)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is None or user.id in self._exempt:
+            return await handler(event, data)
+
+        key = (user.id, _kind(event))
+        if key in self._in_flight:
+            self.coalesced += 1
+            await self._reject(event, PLEASE_WAIT)
+            return None
+
+        if self._over_limit(user.id, time.monotonic()):
+            self.rate_limited += 1
+            await self._reject(event, TOO_MANY)
+            return None
+
+        self.passed += 1
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "passed": self.passed,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "in_flight": len(self._in_flight),
+        }
+
+
+antiflood = AntiFloodMiddleware(
+    max_updates=settings.ANTIFLOOD_MAX_UPDATES,
+    window=settings.ANTIFLOOD_WINDOW_SECONDS,
+)
@@ -1,11 +1,27 @@
 # bot/models.py
-from typing import Optional, List, Dict, Any, Tuple
-from .db import get_db
-import aiosqlite
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+from .cache import EligibilityIndex, UserCache, UserRecord
+from .config import settings
+from .log import SAMPLED
+from .storage import OnboardingResult, storage
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Whether this process is the only writer. With several webhook workers or
+# a shared PostgreSQL database, other processes change rows behind our back.
+_SOLE_WRITER = settings.STORAGE_BACKEND == "sqlite" and settings.WEBHOOK_WORKERS <= 1
+
+# Write-through cache of hot user fields. Every write below updates it after
+# commit, so reads for cached users never touch the database. The cache is
+# per process, so it is turned off when other processes write to the same
+# database and we could not see their writes.
+user_cache = UserCache(settings.USER_CACHE_SIZE if _SOLE_WRITER else 0)
+
+# Users who have reached REFERRAL_THRESHOLD, for O(1) access decisions.
+# With other writers a miss may be stale and is confirmed in the database.
+eligible_users = EligibilityIndex(settings.REFERRAL_THRESHOLD, authoritative=_SOLE_WRITER)
+
 
 async def create_user(
     user_id: int, 
@@ -14,174 +30,250 @@ async def create_user(
     invited_by: Optional[int] = None
 ):
     """Create a new user or ignore if already exists"""
-    async with get_db() as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO users (user_id, username, full_name, invited_by, referrals_count) VALUES (?, ?, ?, ?, 0)",
-            (user_id, username, full_name, invited_by)
-        )
-        await db.commit()
+    if invited_by == user_id:
+        invited_by = None
+    if await storage.create_user(user_id, username, full_name, invited_by):
+        user_cache.put(UserRecord(user_id, invited_by, 0, 0))
 
 
-async def get_user(user_id: int) -> Optional[aiosqlite.Row]:
-    """Get user by ID with verified referral count"""
-    async with get_db() as db:
-        cur = await db.execute(
-            "SELECT * FROM users WHERE user_id = ?", 
-            (user_id,)
-        )
-        row = await cur.fetchone()
-        
-        if row:
-            # Verify referral count matches actual referrals
-            stored_count = row["referrals_count"] if row["referrals_count"] is not None else 0
-            
-            cur2 = await db.execute(
-                "SELECT COUNT(*) as actual FROM referrals WHERE inviter_id = ?",
-                (user_id,)
-            )
-            actual_row = await cur2.fetchone()
-            actual_count = actual_row["actual"] if actual_row else 0
-            
-            if stored_count != actual_count:
-                logger.warning(f"User {user_id} count mismatch: stored={stored_count}, actual={actual_count}. Fixing...")
-                # Fix the count in the database
-                await db.execute(
-                    "UPDATE users SET referrals_count = ? WHERE user_id = ?",
-                    (actual_count, user_id)
-                )
-                await db.commit()
-                
-                # Re-fetch the updated row
-                cur3 = await db.execute(
-                    "SELECT * FROM users WHERE user_id = ?", 
-                    (user_id,)
-                )
-                row = await cur3.fetchone()
-        
-        return row
+async def get_user(user_id: int) -> Optional[UserRecord]:
+    """Get user by ID"""
+    record = user_cache.get(user_id)
+    if record is not None:
+        return record
+
+    version = user_cache.version(user_id)
+    record = await storage.get_user(user_id)
+    if record is not None:
+        user_cache.fill(record, version)
+    return record
 
 
 async def set_user_member(user_id: int):
     """Mark user as a member"""
-    async with get_db() as db:
-        await db.execute(
-            "UPDATE users SET is_member = 1 WHERE user_id = ?", 
-            (user_id,)
-        )
-        await db.commit()
-        logger.info(f"User {user_id} marked as member")
+    await storage.set_user_member(user_id)
+    user_cache.update(user_id, is_member=1)
+    logger.info("User %s marked as member", user_id, extra=SAMPLED)
 
 
 async def update_user_inviter(user_id: int, inviter_id: int):
-    """Update user's inviter if not already set"""
-    async with get_db() as db:
-        await db.execute(
-            "UPDATE users SET invited_by = ? WHERE user_id = ? AND invited_by IS NULL",
-            (inviter_id, user_id)
-        )
-        await db.commit()
+    """Update user's inviter if not already set (users cannot invite themselves)"""
+    if await storage.update_user_inviter(user_id, inviter_id):
+        user_cache.update(user_id, invited_by=inviter_id)
 
 
 async def add_referral(inviter_id: int, invited_id: int) -> Tuple[bool, int]:
     """
     Add a referral record and increment inviter's referral count.
     Returns (was_added, new_count).
+
+    The insert and the increment run in one transaction, and the
+    increment happens in SQL, so concurrent confirmations for the same
+    inviter cannot lose updates.
     """
-    async with get_db() as db:
-        # Check if referral already exists
-        cur = await db.execute(
-            "SELECT id FROM referrals WHERE inviter_id = ? AND invited_id = ?",
-            (inviter_id, invited_id)
-        )
-        existing = await cur.fetchone()
-        if existing:
-            logger.info(f"Referral already exists: inviter={inviter_id}, invited={invited_id}")
-            # Get current count
-            cur = await db.execute(
-                "SELECT referrals_count FROM users WHERE user_id = ?",
-                (inviter_id,)
-            )
-            row = await cur.fetchone()
-            current_count = row["referrals_count"] if row and row["referrals_count"] is not None else 0
-            return False, current_count
-
-        # Add referral record
-        await db.execute(
-            "INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?)",
-            (inviter_id, invited_id)
-        )
-        
-        # Get current count and increment
-        cur = await db.execute(
-            "SELECT referrals_count FROM users WHERE user_id = ?",
-            (inviter_id,)
-        )
-        row = await cur.fetchone()
-        current_count = row["referrals_count"] if row and row["referrals_count"] is not None else 0
-        new_count = current_count + 1
-        
-        # Update with new count
-        await db.execute(
-            "UPDATE users SET referrals_count = ? WHERE user_id = ?",
-            (new_count, inviter_id)
+    was_added, new_count = await storage.add_referral(inviter_id, invited_id)
+    user_cache.update(inviter_id, referrals_count=new_count)
+    eligible_users.observe(inviter_id, new_count)
+    if was_added:
+        logger.info("Added referral: inviter=%s, invited=%s, count=%s", inviter_id, invited_id, new_count)
+    else:
+        logger.debug("Referral already exists: inviter=%s, invited=%s", inviter_id, invited_id)
+    return was_added, new_count
+
+
+async def onboard_user(
+    user_id: int,
+    username: Optional[str],
+    full_name: Optional[str],
+    inviter_id: Optional[int] = None
+) -> OnboardingResult:
+    """
+    Register a subscribed user in one transaction: create the user if
+    missing, keep the first inviter, mark membership and credit the inviter.
+    """
+    if inviter_id == user_id:
+        inviter_id = None
+    result = await storage.onboard_user(user_id, username, full_name, inviter_id)
+
+    user_cache.put(UserRecord(user_id, result.inviter_id, result.referrals_count, 1))
+    if result.referral_added:
+        user_cache.update(result.inviter_id, referrals_count=result.inviter_count)
+        eligible_users.observe(result.inviter_id, result.inviter_count)
+        logger.info(
+            "Added referral: inviter=%s, invited=%s, count=%s", result.inviter_id, user_id, result.inviter_count
         )
-        await db.commit()
-        
-        # Log the action
-        logger.info(f"Added referral: inviter={inviter_id}, invited={invited_id}")
-        logger.info(f"Inviter {inviter_id} count updated from {current_count} to {new_count}")
-        
-        return True, new_count
+    return result
 
 
 async def referral_count(user_id: int) -> int:
     """Get referral count for a user"""
-    async with get_db() as db:
-        # Force reading the latest data
-        cur = await db.execute(
-            "SELECT referrals_count FROM users WHERE user_id = ?", 
-            (user_id,)
-        )
-        row = await cur.fetchone()
-        
-        # If count is None or seems wrong, recalculate from referrals table
-        stored_count = row["referrals_count"] if row and row["referrals_count"] is not None else 0
-        
-        # Verify against actual referrals (for debugging)
-        cur2 = await db.execute(
-            "SELECT COUNT(*) as actual FROM referrals WHERE inviter_id = ?",
-            (user_id,)
-        )
-        actual_row = await cur2.fetchone()
-        actual_count = actual_row["actual"] if actual_row else 0
-        
-        if stored_count != actual_count:
-            logger.warning(f"User {user_id} count mismatch: stored={stored_count}, actual={actual_count}. Using actual.")
-            return actual_count
-        
-        logger.info(f"User {user_id} has {stored_count} referrals")
-        return stored_count
+    record = await get_user(user_id)
+    count = record.referrals_count if record else 0
+    logger.debug("User %s has %s referrals", user_id, count)
+    return count
 
 
 async def get_inviter(user_id: int) -> Optional[int]:
     """Get the ID of the user who invited this user"""
-    async with get_db() as db:
-        cur = await db.execute(
-            "SELECT invited_by FROM users WHERE user_id = ?", 
-            (user_id,)
-        )
-        row = await cur.fetchone()
-        inviter = row["invited_by"] if row else None
-        logger.info(f"User {user_id} was invited by {inviter}")
-        return inviter
-
-
-async def list_users(limit: int = 1000) -> List[Dict[str, Any]]:
-    """Get list of users with their stats"""
-    async with get_db() as db:
-        cur = await db.execute(
-            "SELECT user_id, username, referrals_count, is_member FROM users LIMIT ?",
-            (limit,)
-        )
-        rows = await cur.fetchall()
-        return [dict(r) for r in rows]
\ No newline at end of file
+    record = await get_user(user_id)
+    inviter = record.invited_by if record else None
+    logger.debug("User %s was invited by %s", user_id, inviter)
+    return inviter
+
+
+async def load_eligible_users():
+    """Build the eligibility index from the database (run once at startup)"""
+    eligible_users.load(await storage.eligible_user_ids(eligible_users.threshold))
+    logger.info("Loaded %d users eligible for the private group", len(eligible_users))
+
+
+async def is_eligible(user_id: int) -> bool:
+    """Whether the user has reached REFERRAL_THRESHOLD"""
+    if user_id in eligible_users:
+        return True
+    if eligible_users.loaded and eligible_users.authoritative:
+        return False
+    record = await get_user(user_id)
+    count = record.referrals_count if record else 0
+    eligible_users.observe(user_id, count)
+    return (count or 0) >= eligible_users.threshold
+
+
+async def reconcile_referral_counts(chunk_size: int = settings.RECONCILE_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    Fix drifted referrals_count values, `chunk_size` users at a time in
+    user_id order. Each chunk is recounted from referrals in its own short
+    write transaction, so live onboarding and referral writes run between
+    chunks and none of them can be overwritten by a stale count.
+
+    Returns (user_id, corrected_count) for every row that changed.
+    """
+    corrected = []
+    last_user_id = 0
+    while True:
+        last_user_id, fixed = await storage.reconcile_referral_chunk(last_user_id, chunk_size)
+        if last_user_id is None:
+            return corrected
+        for user_id, count in fixed:
+            user_cache.update(user_id, referrals_count=count)
+            eligible_users.observe(user_id, count)
+        corrected.extend(fixed)
+
+
+async def list_users(limit: int = 1000, after_user_id: int = 0) -> List[Dict[str, Any]]:
+    """Get a page of users with their stats, in user_id order after after_user_id"""
+    return await storage.list_users(limit, after_user_id)
+
+
+async def iter_users(batch_size: int = 1000, after_user_id: int = 0) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Stream all users in user_id order, one batch at a time.
+    Each batch is read with a keyset query (user_id > last seen), and the
+    connection goes back to the pool between batches.
+    """
+    last_id = after_user_id
+    while True:
+        rows = await storage.users_page(last_id, batch_size)
+        if not rows:
+            return
+        last_id = rows[-1]["user_id"]
+        yield rows
+
+
+async def iter_referrals(batch_size: int = 1000, after_id: int = 0) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream all referral rows in id order, one batch at a time (see iter_users)"""
+    last_id = after_id
+    while True:
+        rows = await storage.referrals_page(last_id, batch_size)
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+
+
+async def get_user_ids_after(after_user_id: int, limit: int) -> List[int]:
+    """Next page of user IDs in primary key order (keyset pagination)"""
+    return await storage.user_ids_after(after_user_id, limit)
+
+
+async def top_inviters(limit: int = 10) -> List[Dict[str, Any]]:
+    """Users with the most referrals, best first (served by the rank index)"""
+    return await storage.top_inviters(limit)
+
+
+async def get_rollups(period: str, since_bucket: str) -> Dict[str, Tuple[int, int]]:
+    """New users and referrals per "hour", "day" or "total" bucket"""
+    return await storage.get_rollups(period, since_bucket)
+
+
+async def set_channel_status(channel: str, user_id: int, status: str):
+    """Record a user's current status in a required channel"""
+    await storage.set_channel_status(channel, user_id, status)
+
+
+async def get_channel_status(
+    channel: str, user_id: int, max_age: Optional[float] = None
+) -> Optional[str]:
+    """Last recorded status in a required channel, None if unknown or older than `max_age` seconds"""
+    return await storage.get_channel_status(channel, user_id, max_age)
+
+
+async def claim_member_batch(job: str, limit: int) -> List[int]:
+    """Next batch of members to re-verify (see Storage.claim_member_batch)"""
+    return await storage.claim_member_batch(job, limit)
+
+
+async def record_lapse(user_id: int, channel: str, status: str):
+    """Mark a member who left a required channel"""
+    await storage.record_lapse(user_id, channel, status)
+    user_cache.update(user_id, is_member=0)
+    logger.info("User %s is no longer subscribed to %s (%s)", user_id, channel, status)
+
+
+async def create_broadcast(
+    admin_id: int,
+    from_chat_id: int,
+    message_id: int,
+    owner: str,
+    lease_seconds: float
+) -> int:
+    """Create a broadcast record leased to `owner` and return its ID"""
+    return await storage.create_broadcast(admin_id, from_chat_id, message_id, owner, lease_seconds)
+
+
+async def get_broadcast(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    """Get broadcast by ID"""
+    return await storage.get_broadcast(broadcast_id)
+
+
+async def claim_broadcasts(owner: str, lease_seconds: float) -> List[int]:
+    """Lease unfinished broadcasts nobody is running to `owner`; returns their IDs"""
+    return await storage.claim_broadcasts(owner, lease_seconds)
+
+
+async def renew_broadcast_lease(broadcast_id: int, owner: str, lease_seconds: float) -> bool:
+    """Extend `owner`'s lease on a broadcast; False if it was lost"""
+    return await storage.renew_broadcast_lease(broadcast_id, owner, lease_seconds)
+
+
+async def release_broadcast(broadcast_id: int, owner: str):
+    """Let another process resume the broadcast"""
+    await storage.release_broadcast(broadcast_id, owner)
+
+
+async def save_broadcast_progress(
+    broadcast_id: int,
+    owner: str,
+    last_user_id: int,
+    delivered: int,
+    blocked: int,
+    failed: int,
+    finished: bool = False
+) -> bool:
+    """
+    Checkpoint a broadcast: recipients up to last_user_id have been handled.
+    Returns False without saving if `owner` no longer holds the lease.
+    """
+    return await storage.save_broadcast_progress(
+        broadcast_id, owner, last_user_id, delivered, blocked, failed, finished
+    )
@@ -0,0 +1,196 @@
+# bot/services/broadcast.py
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Dict, Optional
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import CopyMessage
+
+from .. import models
+from ..config import settings
+from .delivery import delivery, Priority
+
+logger = logging.getLogger(__name__)
+
+# This process's name in broadcast leases; unique per start, so a restarted
+# process never mistakes a lease left by its previous run for its own
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Broadcasts running in this process, by broadcast ID
+_running: Dict[int, asyncio.Task] = {}
+_watcher: Optional[asyncio.Task] = None
+
+
+async def _send_batch(from_chat_id: int, message_id: int, user_ids: list) -> Dict[str, int]:
+    """Copy the message to one page of users and count the outcomes"""
+    futures = [
+        delivery.submit(
+            CopyMessage(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id),
+            chat_id=user_id,
+            priority=Priority.BULK
+        )
+        for user_id in user_ids
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    counts = {"delivered": 0, "blocked": 0, "failed": 0}
+    for result in results:
+        if not isinstance(result, BaseException):
+            counts["delivered"] += 1
+        elif isinstance(result, TelegramForbiddenError):
+            # User blocked the bot or deleted their account
+            counts["blocked"] += 1
+        else:
+            counts["failed"] += 1
+    return counts
+
+
+async def _keep_lease(broadcast_id: int, task: asyncio.Task):
+    """Renew the lease three times per lease period; cancel `task` once it is lost"""
+    lease = settings.BROADCAST_LEASE_SECONDS
+    while True:
+        await asyncio.sleep(lease / 3)
+        try:
+            held = await models.renew_broadcast_lease(broadcast_id, OWNER, lease)
+        except Exception as e:
+            logger.error("Error renewing the lease on broadcast %s: %s", broadcast_id, e)
+            continue
+        if not held:
+            logger.warning("Lost the lease on broadcast %s, stopping", broadcast_id)
+            task.cancel()
+            return
+
+
+async def run_broadcast(broadcast_id: int):
+    """
+    Deliver a broadcast to every user, resuming from its checkpoint.
+
+    Recipients are read page by page in user_id order, and each page is
+    checkpointed once all of its messages are settled. After a restart
+    the broadcast continues after the last fully handled page. The caller
+    must hold the broadcast's lease; sending stops as soon as it is lost.
+    """
+    row = await models.get_broadcast(broadcast_id)
+    if not row or row["status"] != "running":
+        return
+
+    keeper = asyncio.create_task(
+        _keep_lease(broadcast_id, asyncio.current_task()), name=f"broadcast-lease-{broadcast_id}"
+    )
+    try:
+        totals = await _deliver(broadcast_id, row)
+    finally:
+        keeper.cancel()
+    if totals is None:
+        logger.warning("Broadcast %s was taken over by another process", broadcast_id)
+        return
+    logger.info("Broadcast %s finished: %s", broadcast_id, totals)
+
+    try:
+        await delivery.send_message(
+            row["admin_id"],
+            f"📣 Xabar yuborish #{broadcast_id} yakunlandi.\n\n"
+            f"✅ Yetkazildi: {totals['delivered']}\n"
+            f"🚫 Bloklagan: {totals['blocked']}\n"
+            f"⚠️ Xato: {totals['failed']}",
+            priority=Priority.APPROVAL
+        )
+    except Exception as e:
+        logger.error("Error reporting broadcast %s to admin: %s", broadcast_id, e)
+
+
+async def _deliver(broadcast_id: int, row: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """Send the remaining pages; returns the totals, or None if the lease was lost"""
+    from_chat_id, message_id = row["from_chat_id"], row["message_id"]
+    last_user_id = row["last_user_id"]
+    totals = {"delivered": row["delivered"], "blocked": row["blocked"], "failed": row["failed"]}
+    logger.info("Broadcast %s running from user_id > %s", broadcast_id, last_user_id)
+
+    while True:
+        user_ids = await models.get_user_ids_after(last_user_id, settings.BROADCAST_BATCH_SIZE)
+        if not user_ids:
+            break
+
+        counts = await _send_batch(from_chat_id, message_id, user_ids)
+        last_user_id = user_ids[-1]
+        for key, value in counts.items():
+            totals[key] += value
+        if not await models.save_broadcast_progress(broadcast_id, OWNER, last_user_id, **counts):
+            return None
+
+    if not await models.save_broadcast_progress(broadcast_id, OWNER, last_user_id, 0, 0, 0, finished=True):
+        return None
+    return totals
+
+
+async def create_broadcast(admin_id: int, from_chat_id: int, message_id: int) -> int:
+    """Record a new broadcast, leased to this process, and start sending it"""
+    broadcast_id = await models.create_broadcast(
+        admin_id, from_chat_id, message_id, OWNER, settings.BROADCAST_LEASE_SECONDS
+    )
+    start_broadcast(broadcast_id)
+    return broadcast_id
+
+
+def start_broadcast(broadcast_id: int) -> asyncio.Task:
+    """Run a broadcast in the background so update handling is not blocked"""
+    task = _running.get(broadcast_id)
+    if task is None or task.done():
+        task = asyncio.create_task(run_broadcast(broadcast_id), name=f"broadcast-{broadcast_id}")
+        _running[broadcast_id] = task
+        task.add_done_callback(lambda t: _on_done(broadcast_id, t))
+    return task
+
+
+def _on_done(broadcast_id: int, task: asyncio.Task):
+    _running.pop(broadcast_id, None)
+    if not task.cancelled() and task.exception():
+        logger.error("Broadcast %s crashed: %s", broadcast_id, task.exception())
+
+
+async def resume_broadcasts():
+    """
+    Claim and restart broadcasts nobody is running: interrupted by a
+    shutdown, or left behind by a process whose lease expired
+    """
+    for broadcast_id in await models.claim_broadcasts(OWNER, settings.BROADCAST_LEASE_SECONDS):
+        start_broadcast(broadcast_id)
+
+
+async def _watch():
+    while True:
+        try:
+            await resume_broadcasts()
+        except Exception as e:
+            logger.exception("Resuming broadcasts failed: %s", e)
+        await asyncio.sleep(settings.BROADCAST_LEASE_SECONDS)
+
+
+def start():
+    """Resume unfinished broadcasts now and whenever a lease expires"""
+    global _watcher
+    if _watcher is None:
+        _watcher = asyncio.create_task(_watch(), name="broadcast-watcher")
+
+
+async def stop_broadcasts():
+    """Cancel running broadcasts and release them; they resume from their checkpoint"""
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        await asyncio.gather(_watcher, return_exceptions=True)
+        _watcher = None
+
+    broadcast_ids = list(_running)
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for broadcast_id in broadcast_ids:
+        try:
+            await models.release_broadcast(broadcast_id, OWNER)
+        except Exception as e:
+            logger.error("Error releasing broadcast %s: %s", broadcast_id, e)
@@ -0,0 +1,314 @@
+# bot/services/delivery.py
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage, TelegramMethod
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Lower values are sent first"""
+    APPROVAL = 0       # join approvals and private group access
+    NOTIFICATION = 1   # informational pings (new referral, decline reasons)
+    BULK = 2           # campaign messages
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class DelayedQueue:
+    """
+    Wraps an asyncio queue (FIFO or priority) so workers can hand items
+    back for a later attempt without holding a worker while they wait.
+    """
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self._delayed: set = set()
+
+    def __len__(self) -> int:
+        """Queued plus delayed items"""
+        return self.queue.qsize() + len(self._delayed)
+
+    def put_later(self, item: Any, delay: float):
+        """Put `item` back on the queue after `delay` seconds"""
+        def put():
+            self._delayed.discard(handle)
+            self.queue.put_nowait(item)
+
+        handle = asyncio.get_running_loop().call_later(delay, put)
+        self._delayed.add(handle)
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until every queued and delayed item is done; False on timeout"""
+        async def wait():
+            while True:
+                await self.queue.join()
+                if not self._delayed:
+                    return
+                await asyncio.sleep(0.05)
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def cancel_delayed(self):
+        """Drop items still waiting to be put back"""
+        for handle in self._delayed:
+            handle.cancel()
+        self._delayed.clear()
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    method: TelegramMethod = field(compare=False)
+    chat_id: Optional[int] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+# Errors worth retrying; anything else (blocked bot, bad request, ...) fails at once
+_TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError)
+
+
+class DeliveryScheduler:
+    """
+    Outbound Bot API call scheduler.
+
+    Calls are taken from a priority queue by a fixed pool of workers and
+    sent only when both the global token bucket and the destination chat's
+    bucket allow it. A 429 response holds back further calls to that chat
+    for `retry_after` seconds, while other chats keep going (a 429 on a
+    call without a chat pauses all sending). Network and server errors are
+    retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        per_chat_rate: float,
+        per_chat_burst: float,
+        workers: int,
+        max_retries: int,
+    ):
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = max(1.0, per_chat_burst)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._workers = max(1, workers)
+        self._max_retries = max_retries
+        self._queue: "asyncio.PriorityQueue[_Job]" = asyncio.PriorityQueue()
+        self._backlog = DelayedQueue(self._queue)
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._paused_until = 0.0
+        self._chat_paused_until: Dict[int, float] = {}
+        self._bot: Optional[Bot] = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._backlog)
+
+    def start(self, bot: Bot):
+        if self._tasks:
+            return
+        self._bot = bot
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"delivery-worker-{i}")
+            for i in range(self._workers)
+        ]
+
+    async def stop(self, timeout: float = 10.0):
+        """Give queued calls up to `timeout` seconds to go out, then stop workers"""
+        if not self._tasks:
+            return
+        if not await self._backlog.drain(timeout):
+            logger.warning("Stopping delivery with %d calls still queued", self.queue_depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._backlog.cancel_delayed()
+
+    def submit(
+        self,
+        method: TelegramMethod,
+        chat_id: Optional[int] = None,
+        priority: Priority = Priority.NOTIFICATION,
+    ) -> asyncio.Future:
+        """
+        Queue a Bot API call. chat_id selects the per-chat rate limit
+        (None for calls that are not messages to a chat).
+        Returns a future with the call's result; failures are logged.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Callers may fire and forget; don't warn about unretrieved errors
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._queue.put_nowait(_Job(int(priority), next(self._seq), method, chat_id, future))
+        return future
+
+    def send_message(self, chat_id: int, text: str, priority: Priority = Priority.NOTIFICATION, **kwargs: Any) -> asyncio.Future:
+        """Queue a sendMessage call. Await the result or ignore it."""
+        return self.submit(SendMessage(chat_id=chat_id, text=text, **kwargs), chat_id=chat_id, priority=priority)
+
+    def _chat_pause(self, chat_id: int, now: float) -> float:
+        """Seconds left of a 429 pause on this chat"""
+        until = self._chat_paused_until.get(chat_id)
+        if until is None:
+            return 0.0
+        if until <= now:
+            del self._chat_paused_until[chat_id]
+            return 0.0
+        return until - now
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10_000:
+                # Forget chats that have been idle long enough to refill
+                self._chat_buckets = {
+                    cid: b for cid, b in self._chat_buckets.items() if not b.is_full(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._per_chat_rate, self._per_chat_burst)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.exception("Delivery worker error: %s", e)
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: _Job):
+        if job.future.cancelled():
+            return
+
+        now = time.monotonic()
+        if job.chat_id is not None:
+            chat_delay = max(self._chat_pause(job.chat_id, now), self._chat_bucket(job.chat_id, now).delay(now))
+            if chat_delay > 0:
+                # This chat is over its limit; let other chats go first
+                self._backlog.put_later(job, chat_delay)
+                return
+
+        # Global flood wait, then the global rate limit
+        while True:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        self._global.consume(now)
+        if job.chat_id is not None:
+            self._chat_bucket(job.chat_id, now).consume(now)
+
+        try:
+            result = await self._bot(job.method)
+        except TelegramRetryAfter as e:
+            self.rate_limited += 1
+            resume_at = time.monotonic() + e.retry_after
+            if job.chat_id is not None:
+                self._chat_paused_until[job.chat_id] = max(self._chat_paused_until.get(job.chat_id, 0.0), resume_at)
+            else:
+                self._paused_until = max(self._paused_until, resume_at)
+            logger.warning(
+                "Flood limit hit on %s to %s, pausing for %ss", job.method.__api_method__, job.chat_id, e.retry_after
+            )
+            self._retry_or_fail(job, e, delay=e.retry_after)
+        except _TRANSIENT_ERRORS as e:
+            self._retry_or_fail(job, e, delay=min(30.0, 0.5 * 2 ** job.attempts))
+        except Exception as e:
+            self.failed += 1
+            logger.error("Failed to deliver %s to %s: %s", job.method.__api_method__, job.chat_id, e)
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _retry_or_fail(self, job: _Job, error: Exception, delay: float):
+        job.attempts += 1
+        if job.attempts > self._max_retries:
+            self.failed += 1
+            logger.error(
+                "Giving up on %s to %s after %d attempts: %s",
+                job.method.__api_method__, job.chat_id, job.attempts, error
+            )
+            if not job.future.done():
+                job.future.set_exception(error)
+            return
+        self.retried += 1
+        self._backlog.put_later(job, delay)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+        }
+
+
+delivery = DeliveryScheduler(
+    global_rate=settings.DELIVERY_GLOBAL_RATE,
+    per_chat_rate=settings.DELIVERY_PER_CHAT_RATE,
+    per_chat_burst=settings.DELIVERY_PER_CHAT_BURST,
+    workers=settings.DELIVERY_WORKERS,
+    max_retries=settings.DELIVERY_MAX_RETRIES,
+)
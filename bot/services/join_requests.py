@@ -0,0 +1,175 @@
+# bot/services/join_requests.py
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+from aiogram.methods import ApproveChatJoinRequest, DeclineChatJoinRequest
+
+from .. import models
+from ..config import settings
+from ..log import SAMPLED
+from ..storage import storage
+from .delivery import DelayedQueue, delivery, Priority
+
+logger = logging.getLogger(__name__)
+REFERRAL_THRESHOLD = settings.REFERRAL_THRESHOLD
+
+# Database failures worth another attempt. Bot API calls are retried by the
+# delivery scheduler; an error it gives up on is final here.
+_TRANSIENT_DB_ERRORS = (*storage.transient_errors, asyncio.TimeoutError)
+
+
+@dataclass
+class _Request:
+    chat_id: int
+    user_id: int
+    attempts: int = 0
+
+
+class JoinRequestProcessor:
+    """
+    Processing stage for chat join requests.
+
+    Handlers only enqueue requests; a fixed number of workers decide them
+    from the eligibility index and send the approve/decline call. Approvals
+    go out at the highest delivery priority, and explanatory DMs are queued
+    only after the decision has been applied.
+
+    All database reads happen before the approve/decline call, so retrying
+    a request after a transient database error (with exponential backoff)
+    never repeats a call. API failures are retried by the delivery
+    scheduler only. A request that still fails is left pending in Telegram
+    rather than declined.
+    """
+
+    def __init__(self, workers: int, max_retries: int):
+        self._workers = max(1, workers)
+        self._max_retries = max_retries
+        self._queue: "asyncio.Queue[_Request]" = asyncio.Queue()
+        self._backlog = DelayedQueue(self._queue)
+        self._pending: Set[Tuple[int, int]] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.received = 0
+        self.duplicates = 0
+        self.approved = 0
+        self.declined = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._backlog)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"join-request-worker-{i}")
+            for i in range(self._workers)
+        ]
+
+    async def stop(self, timeout: float = 10.0):
+        """Give queued requests up to `timeout` seconds to be decided, then stop workers"""
+        if not self._tasks:
+            return
+        if not await self._backlog.drain(timeout):
+            logger.warning("Stopping join request processing with %d requests still queued", self.queue_depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._backlog.cancel_delayed()
+
+    def enqueue(self, chat_id: int, user_id: int):
+        """Queue a join request; repeats of a request still being processed are dropped"""
+        self.received += 1
+        key = (chat_id, user_id)
+        if key in self._pending:
+            self.duplicates += 1
+            return
+        self._pending.add(key)
+        self._queue.put_nowait(_Request(chat_id, user_id))
+
+    async def _worker(self):
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._process(request)
+            except _TRANSIENT_DB_ERRORS as e:
+                self._retry_or_fail(request, e)
+            except Exception as e:
+                self.failed += 1
+                self._pending.discard((request.chat_id, request.user_id))
+                logger.error("Failed to process join request of user %s to chat %s: %s", request.user_id, request.chat_id, e)
+            finally:
+                self._queue.task_done()
+
+    def _retry_or_fail(self, request: _Request, error: Exception):
+        request.attempts += 1
+        if request.attempts > self._max_retries:
+            self.failed += 1
+            self._pending.discard((request.chat_id, request.user_id))
+            logger.error(
+                "Giving up on join request of user %s to chat %s after %d attempts: %s",
+                request.user_id, request.chat_id, request.attempts, error
+            )
+            return
+        self.retried += 1
+        delay = min(30.0, 0.5 * 2 ** request.attempts)
+        logger.warning("Retrying join request of user %s in %ss: %s", request.user_id, delay, error)
+        self._backlog.put_later(request, delay)
+
+    async def _process(self, request: _Request):
+        chat_id, user_id = request.chat_id, request.user_id
+
+        if await models.is_eligible(user_id):
+            await delivery.submit(
+                ApproveChatJoinRequest(chat_id=chat_id, user_id=user_id),
+                priority=Priority.APPROVAL
+            )
+            self.approved += 1
+            self._pending.discard((chat_id, user_id))
+            logger.info("Approved join request for user %s", user_id)
+
+            delivery.send_message(
+                user_id,
+                "✅ Tabriklaymiz!\n\n"
+                "Sizning so'rovingiz tasdiqlandi. Yopiq guruhga xush kelibsiz! 🎉"
+            )
+            return
+
+        ref_count = await models.referral_count(user_id)
+        # Declines are not urgent; let pending approvals go first
+        await delivery.submit(
+            DeclineChatJoinRequest(chat_id=chat_id, user_id=user_id),
+            priority=Priority.NOTIFICATION
+        )
+        self.declined += 1
+        self._pending.discard((chat_id, user_id))
+
+        logger.info("Declined join request for user %s (refs: %s)", user_id, ref_count, extra=SAMPLED)
+        delivery.send_message(
+            user_id,
+            f"❌ Afsuski, sizning so'rovingiz rad etildi.\n\n"
+            f"📊 Sizda {ref_count}/{REFERRAL_THRESHOLD} referal bor.\n"
+            f"🎯 Yana {REFERRAL_THRESHOLD - ref_count} ta referal to'plang yoki admin bilan bog'laning.\n\n"
+            f"💡 Mening referallarim menyusidan havolangizni oling.",
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue_depth,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "approved": self.approved,
+            "declined": self.declined,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+join_requests = JoinRequestProcessor(
+    workers=settings.JOIN_REQUEST_WORKERS,
+    max_retries=settings.JOIN_REQUEST_MAX_RETRIES,
+)
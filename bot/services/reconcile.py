@@ -0,0 +1,65 @@
+# bot/services/reconcile.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from .. import models
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Outcome of reconciliation runs in this process
+stats: Dict[str, Any] = {
+    "runs": 0,
+    "corrected_total": 0,
+    "last_corrected": 0,
+    "last_run_at": None,
+    "last_duration": None,
+}
+
+_task: Optional[asyncio.Task] = None
+
+
+async def reconcile_once() -> int:
+    """Run one reconciliation pass and return the number of corrected rows"""
+    started = time.monotonic()
+    corrected = await models.reconcile_referral_counts()
+    duration = time.monotonic() - started
+
+    stats["runs"] += 1
+    stats["corrected_total"] += len(corrected)
+    stats["last_corrected"] = len(corrected)
+    stats["last_run_at"] = time.time()
+    stats["last_duration"] = duration
+
+    if corrected:
+        sample = ", ".join(f"{user_id}->{count}" for user_id, count in corrected[:20])
+        logger.warning("Reconciliation corrected %d referral counts in %.3fs: %s", len(corrected), duration, sample)
+    else:
+        logger.info("Reconciliation found no drift (%.3fs)", duration)
+    return len(corrected)
+
+
+async def _loop(interval: float):
+    while True:
+        try:
+            await reconcile_once()
+        except Exception as e:
+            logger.exception("Reconciliation failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+def start():
+    """Start periodic reconciliation (RECONCILE_INTERVAL_SECONDS, 0 disables)"""
+    global _task
+    if _task is None and settings.RECONCILE_INTERVAL_SECONDS > 0:
+        _task = asyncio.create_task(_loop(settings.RECONCILE_INTERVAL_SECONDS), name="reconcile-referrals")
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
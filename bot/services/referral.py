@@ -1,5 +1,6 @@
 # bot/services/referral.py
 from .. import models
+from ..storage import OnboardingResult
 from typing import Optional, Tuple
 
 
@@ -36,4 +37,20 @@ async def try_register_referral(candidate_user_id: int) -> Tuple[Optional[int],
         return None, False, 0
 
     was_added, new_count = await models.add_referral(inviter_id, candidate_user_id)
-    return inviter_id, was_added, new_count
\ No newline at end of file
+    return inviter_id, was_added, new_count
+
+
+async def onboard(
+    user_id: int,
+    username: Optional[str],
+    full_name: Optional[str],
+    inviter: Optional[int] = None
+) -> OnboardingResult:
+    """
+    Complete onboarding of a user who passed the subscription check.
+
+    Registers the user if needed, marks membership, credits the inviter
+    (once per invited user) and reads the user's own referral count, all
+    in one transaction.
+    """
+    return await models.onboard_user(user_id, username, full_name, inviter)
@@ -0,0 +1,36 @@
+# bot/services/stats.py
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from .. import models
+from ..storage.base import DAY_FORMAT, HOUR_FORMAT
+
+
+def _add(a: Tuple[int, int], b: Tuple[int, int]) -> Tuple[int, int]:
+    return a[0] + b[0], a[1] + b[1]
+
+
+async def summary(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    New users and referrals: all time, the last 24 hours, today and each
+    of the last 7 days (UTC). Reads at most 32 rollup rows, however many
+    users there are.
+    """
+    now = now or datetime.now(timezone.utc)
+    totals = await models.get_rollups("total", "")
+    hours = await models.get_rollups("hour", (now - timedelta(hours=23)).strftime(HOUR_FORMAT))
+    days = await models.get_rollups("day", (now - timedelta(days=6)).strftime(DAY_FORMAT))
+
+    last_24h = (0, 0)
+    for counts in hours.values():
+        last_24h = _add(last_24h, counts)
+    week = [
+        (day, days.get(day, (0, 0)))
+        for day in ((now - timedelta(days=offset)).strftime(DAY_FORMAT) for offset in range(6, -1, -1))
+    ]
+    return {
+        "total": totals.get("", (0, 0)),
+        "last_24h": last_24h,
+        "today": week[-1][1],
+        "days": week,
+    }
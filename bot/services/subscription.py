@@ -1,33 +1,132 @@
 # bot/services/subscription.py
+import asyncio
+import logging
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
-from typing import List
+from aiogram.types import Chat
+from typing import List, Optional, Set
+from .. import models
+from ..cache import AsyncTTLCache
 from ..config import settings
 
+logger = logging.getLogger(__name__)
 
-CHANNELS = [settings.CHANNEL_1, settings.CHANNEL_2]
+
+CHANNELS = settings.required_channels
+
+# Valid member statuses
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+# Membership results keyed by (channel, user_id). Users who just joined a
+# channel click "check" again right away, so negative results expire fast.
+membership_cache: AsyncTTLCache[bool] = AsyncTTLCache(
+    maxsize=settings.SUBSCRIPTION_CACHE_SIZE,
+    positive_ttl=settings.SUBSCRIPTION_CACHE_POSITIVE_TTL,
+    negative_ttl=settings.SUBSCRIPTION_CACHE_NEGATIVE_TTL,
+)
+
+
+def status_name(status) -> str:
+    """ChatMemberStatus or plain string as the stored status text"""
+    return str(getattr(status, "value", status))
+
+
+def channel_for_chat(chat: Chat) -> Optional[str]:
+    """The CHANNELS entry ("@username" or numeric ID) naming this chat, if any"""
+    username = f"@{chat.username}".lower() if chat.username else None
+    for channel in CHANNELS:
+        if channel == str(chat.id) or channel.lower() == username:
+            return channel
+    return None
+
+
+async def record_status(channel: str, user_id: int, status: str):
+    """Store a membership change and drop the cached check result"""
+    await models.set_channel_status(channel, user_id, status)
+    membership_cache.invalidate((channel, user_id))
+
+
+async def _fetch_membership(bot: Bot, channel: str, user_id: int) -> bool:
+    known = None
+    if settings.MEMBERSHIP_TRACKING:
+        known = await models.get_channel_status(
+            channel, user_id, max_age=settings.MEMBERSHIP_MAX_AGE_SECONDS
+        )
+        # Joins and leaves arrive as chat_member updates, so a recently
+        # recorded membership is current. Anything else is confirmed with
+        # the API: the user may have joined a moment before the update
+        # reaches us, or a leave may have been missed while the bot was
+        # down. Stale rows read as unknown, so the confirmed status is
+        # written back and renews them.
+        if known in MEMBER_STATUSES:
+            return True
+
+    try:
+        member = await bot.get_chat_member(chat_id=channel, user_id=user_id)
+    except TelegramBadRequest:
+        # User not found in chat or bot doesn't have access
+        return False
+
+    status = status_name(member.status)
+    if settings.MEMBERSHIP_TRACKING and status != known:
+        try:
+            await models.set_channel_status(channel, user_id, status)
+        except Exception as e:
+            logger.warning("Could not record %s status of %s: %s", channel, user_id, e)
+    return status in MEMBER_STATUSES
+
+
+async def is_member(bot: Bot, channel: str, user_id: int) -> bool:
+    """Cached membership check for a single channel"""
+    return await membership_cache.get_or_load(
+        (channel, user_id),
+        lambda: _fetch_membership(bot, channel, user_id)
+    )
+
+
+# Lookups still running after check_subscriptions returned early; they
+# finish in the background and warm the cache for the next check.
+_background_checks: Set[asyncio.Task] = set()
+
+
+async def _check_channel(bot: Bot, channel: str, user_id: int) -> bool:
+    try:
+        return await asyncio.wait_for(
+            is_member(bot, channel, user_id),
+            timeout=settings.SUBSCRIPTION_CHECK_TIMEOUT
+        )
+    except Exception:
+        # Any other error or timeout - assume user is not subscribed to be safe.
+        # Errors are not cached, so the next check asks the API again.
+        return False
 
 
 async def check_subscriptions(bot: Bot, user_id: int) -> List[str]:
     """
     Check user's subscription status for all required channels.
-    
+
+    All channels are queried concurrently and the check returns as soon as
+    any channel is known to be missing, so the list may not name every
+    missing channel.
+
     Returns:
         List of channel IDs where user is NOT a member.
     """
+    tasks = {
+        asyncio.create_task(_check_channel(bot, ch, user_id)): ch
+        for ch in CHANNELS
+    }
     missing = []
-    
-    for ch in CHANNELS:
-        try:
-            member = await bot.get_chat_member(chat_id=ch, user_id=user_id)
-            # Valid member statuses
-            if member.status not in ("member", "administrator", "creator"):
-                missing.append(ch)
-        except TelegramBadRequest:
-            # User not found in chat or bot doesn't have access
-            missing.append(ch)
-        except Exception as e:
-            # Any other error - assume user is not subscribed to be safe
-            missing.append(ch)
-    
-    return missing
\ No newline at end of file
+    pending = set(tasks)
+
+    while pending and not missing:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.result():
+                missing.append(tasks[task])
+
+    for task in pending:
+        _background_checks.add(task)
+        task.add_done_callback(_background_checks.discard)
+
+    return missing
@@ -0,0 +1,141 @@
+# bot/services/sweeper.py
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from .. import models
+from ..config import settings
+from .delivery import TokenBucket
+from .subscription import CHANNELS, MEMBER_STATUSES, membership_cache, status_name
+
+logger = logging.getLogger(__name__)
+
+# job_state row holding the sweep cursor (last user_id handed out)
+CURSOR_JOB = "member_sweep"
+
+
+class MembershipSweeper:
+    """
+    Background re-verification of users marked is_member = 1.
+
+    Members are walked in user_id order in keyset batches claimed from a
+    cursor stored in the database, so a restart resumes where the last
+    batch ended and several processes share one pass. Each member is
+    checked with getChatMember in every required channel, at most
+    `concurrency` at a time and within `calls_per_minute`, leaving the rest
+    of the Bot API budget to interactive traffic. A flood limit pauses every
+    worker for the requested time. Users who left a channel are recorded in
+    membership_lapses and get is_member = 0. Errors never count as a lapse;
+    those users are checked again on the next pass.
+    """
+
+    def __init__(self, interval: float, batch_size: int, concurrency: int, calls_per_minute: int):
+        self._interval = interval
+        self._batch_size = max(1, batch_size)
+        self._concurrency = max(1, concurrency)
+        rate = max(1, calls_per_minute) / 60
+        self._budget = TokenBucket(rate, capacity=min(self._concurrency, max(1.0, rate)))
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.checked = 0
+        self.lapsed = 0
+        self.errors = 0
+        self.api_calls = 0
+
+    async def _spend(self):
+        """Wait for one getChatMember call from the budget"""
+        while True:
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._budget.delay(now))
+            if delay <= 0:
+                self._budget.consume()
+                self.api_calls += 1
+                return
+            await asyncio.sleep(delay)
+
+    async def _verify(self, bot: Bot, user_id: int):
+        for channel in CHANNELS:
+            await self._spend()
+            try:
+                member = await bot.get_chat_member(chat_id=channel, user_id=user_id)
+            except TelegramRetryAfter as e:
+                # Back off the whole sweep, not just this worker
+                self.errors += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning("Sweep hit the flood limit, pausing for %ss", e.retry_after)
+                return
+            except (TelegramAPIError, asyncio.TimeoutError) as e:
+                # Includes "chat not found" when the bot lost access, which
+                # must not turn every member into a lapse
+                self.errors += 1
+                logger.debug("Sweep could not check %s in %s: %s", user_id, channel, e)
+                return
+
+            status = status_name(member.status)
+            if status not in MEMBER_STATUSES:
+                await models.record_lapse(user_id, channel, status)
+                if settings.MEMBERSHIP_TRACKING:
+                    await models.set_channel_status(channel, user_id, status)
+                membership_cache.invalidate((channel, user_id))
+                self.lapsed += 1
+                return
+        self.checked += 1
+
+    async def sweep_batch(self, bot: Bot) -> int:
+        """Verify the next batch of members; returns its size (0 at the end of a pass)"""
+        user_ids = await models.claim_member_batch(CURSOR_JOB, self._batch_size)
+        slots = asyncio.Semaphore(self._concurrency)
+
+        async def verify(user_id: int):
+            async with slots:
+                try:
+                    await self._verify(bot, user_id)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning("Sweep failed for user %s: %s", user_id, e)
+
+        await asyncio.gather(*(verify(user_id) for user_id in user_ids))
+        return len(user_ids)
+
+    async def _loop(self, bot: Bot):
+        while True:
+            try:
+                if await self.sweep_batch(bot):
+                    continue
+                self.passes += 1
+                logger.info("Membership sweep pass complete: %s", self.stats())
+            except Exception as e:
+                logger.exception("Membership sweep failed: %s", e)
+            await asyncio.sleep(self._interval)
+
+    def start(self, bot: Bot):
+        if self._task is None and self._interval > 0 and CHANNELS:
+            self._task = asyncio.create_task(self._loop(bot), name="membership-sweeper")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "passes": self.passes,
+            "checked": self.checked,
+            "lapsed": self.lapsed,
+            "errors": self.errors,
+            "api_calls": self.api_calls,
+        }
+
+
+sweeper = MembershipSweeper(
+    interval=settings.SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.SWEEP_BATCH_SIZE,
+    concurrency=settings.SWEEP_CONCURRENCY,
+    calls_per_minute=settings.SWEEP_API_CALLS_PER_MINUTE,
+)
@@ -0,0 +1,26 @@
+# bot/storage/__init__.py
+"""
+Storage backends for bot.models, selected by STORAGE_BACKEND:
+"sqlite" (default, a local file, one writer process) or "postgres"
+(asyncpg pool, any number of bot processes and hosts).
+"""
+from ..config import settings
+from .base import OnboardingResult, Storage
+
+
+def create_storage() -> Storage:
+    """Build the backend configured in settings"""
+    if settings.STORAGE_BACKEND == "postgres":
+        from .postgres import PostgresStorage
+        return PostgresStorage(
+            settings.DATABASE_URL,
+            min_size=settings.PG_POOL_MIN_SIZE,
+            max_size=settings.PG_POOL_MAX_SIZE,
+        )
+    from .sqlite import SQLiteStorage
+    return SQLiteStorage()
+
+
+storage = create_storage()
+
+__all__ = ["OnboardingResult", "Storage", "create_storage", "storage"]
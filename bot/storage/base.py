@@ -0,0 +1,204 @@
+# bot/storage/base.py
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from ..cache import UserRecord
+
+
+# stats_rollups buckets, in UTC. Backends count each new user and referral
+# in the hour, day and total rows in the transaction that creates it.
+HOUR_FORMAT = "%Y-%m-%d %H:00"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def rollup_buckets(at: Optional[datetime] = None) -> List[Tuple[str, str]]:
+    """(period, bucket) rows an event at `at` (default: now) is counted in"""
+    at = (at or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return [("hour", at.strftime(HOUR_FORMAT)), ("day", at.strftime(DAY_FORMAT)), ("total", "")]
+
+
+class OnboardingResult(NamedTuple):
+    """Outcome of Storage.onboard_user"""
+    inviter_id: Optional[int]       # the user's inviter, if any
+    referral_added: bool            # True the first time this user credits the inviter
+    inviter_count: Optional[int]    # inviter's new count when referral_added
+    referrals_count: int            # the user's own referral count
+
+
+class Storage(ABC):
+    """
+    Data access interface used by bot.models.
+
+    Implementations own their connection pool and schema migrations, and
+    must make add_referral atomic: the referral insert and the inviter's
+    count increment happen in one transaction, and duplicates are ignored.
+    Every user and referral they create is also counted in stats_rollups
+    (see rollup_buckets) within the same transaction.
+    Rows are returned as plain dicts.
+    """
+
+    name = ""
+    # Errors that mean "try again later" (lost connection, lock timeout,
+    # serialization failure) rather than a bug or bad data
+    transient_errors: Tuple[Type[BaseException], ...] = ()
+
+    @abstractmethod
+    async def open(self):
+        """Connect, create or migrate the schema and start background writers"""
+
+    @abstractmethod
+    async def close(self):
+        """Flush pending writes and close every connection"""
+
+    def write_queue_depth(self) -> int:
+        """Writes waiting to be committed (for metrics)"""
+        return 0
+
+    # Users
+
+    @abstractmethod
+    async def create_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], invited_by: Optional[int]
+    ) -> bool:
+        """Insert a user unless it exists; True if it was created. A self-inviter is dropped."""
+
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        """Primary key lookup of the hot user fields"""
+
+    @abstractmethod
+    async def set_user_member(self, user_id: int):
+        pass
+
+    @abstractmethod
+    async def update_user_inviter(self, user_id: int, inviter_id: int) -> bool:
+        """Set the inviter if none is set yet and it is not the user; True if it was set"""
+
+    @abstractmethod
+    async def list_users(self, limit: int, after_user_id: int) -> List[Dict[str, Any]]:
+        """user_id, username, referrals_count, is_member in user_id order"""
+
+    @abstractmethod
+    async def users_page(self, after_user_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Every user column in user_id order (for exports)"""
+
+    @abstractmethod
+    async def user_ids_after(self, after_user_id: int, limit: int) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def onboard_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], inviter_id: Optional[int]
+    ) -> OnboardingResult:
+        """
+        In one transaction: create the user if missing, set the inviter if
+        none is set yet, mark the user as a member and credit the inviter.
+        A user is never credited as their own inviter, even if an older
+        row already stores one.
+        """
+
+    # Referrals
+
+    @abstractmethod
+    async def add_referral(self, inviter_id: int, invited_id: int) -> Tuple[bool, int]:
+        """Record a referral and credit the inviter; returns (was_added, new_count)"""
+
+    @abstractmethod
+    async def referrals_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """id, inviter_id, invited_id, created_at (as text) in id order"""
+
+    @abstractmethod
+    async def eligible_user_ids(self, threshold: int) -> List[int]:
+        """Users whose referrals_count is at least `threshold`"""
+
+    @abstractmethod
+    async def reconcile_referral_chunk(self, after_user_id: int, limit: int) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+        """
+        Recount referrals_count for the next `limit` users after
+        `after_user_id`, in one short write transaction that no concurrent
+        increment can interleave with. Returns the last user_id covered
+        (None when there are no more users) and (user_id, count) per fixed row.
+        """
+
+    @abstractmethod
+    async def top_inviters(self, limit: int) -> List[Dict[str, Any]]:
+        """user_id, username, full_name, referrals_count of the best inviters"""
+
+    # Stats
+
+    @abstractmethod
+    async def get_rollups(self, period: str, since_bucket: str) -> Dict[str, Tuple[int, int]]:
+        """{bucket: (new_users, referrals)} for `period` buckets from `since_bucket` on"""
+
+    # Channel membership
+
+    @abstractmethod
+    async def set_channel_status(self, channel: str, user_id: int, status: str):
+        """Upsert a user's chat member status in a required channel"""
+
+    @abstractmethod
+    async def get_channel_status(
+        self, channel: str, user_id: int, max_age: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        Last known status, or None if the user was never seen in the channel
+        or, with `max_age`, the status was last written more than `max_age`
+        seconds ago
+        """
+
+    @abstractmethod
+    async def claim_member_batch(self, job: str, limit: int) -> List[int]:
+        """
+        Next `limit` member user IDs after the cursor stored under `job`,
+        advancing the cursor in the same transaction so concurrent
+        processes get disjoint batches. An empty list means the pass is
+        complete and the cursor was reset.
+        """
+
+    @abstractmethod
+    async def record_lapse(self, user_id: int, channel: str, status: str):
+        """Clear is_member and log the channel the user is no longer in"""
+
+    # Broadcasts
+    #
+    # A running broadcast is leased to the process sending it. The owner
+    # renews the lease while it works; when the lease expires (the owner
+    # crashed or lost the database) any process may claim the broadcast
+    # and resume it from its checkpoint.
+
+    @abstractmethod
+    async def create_broadcast(
+        self, admin_id: int, from_chat_id: int, message_id: int, owner: str, lease_seconds: float
+    ) -> int:
+        """Create a running broadcast, leased to `owner`"""
+
+    @abstractmethod
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def claim_broadcasts(self, owner: str, lease_seconds: float) -> List[int]:
+        """
+        Lease every running broadcast that has no owner or an expired lease
+        to `owner` and return their IDs. Claiming is atomic, so each
+        broadcast is handed to one process only.
+        """
+
+    @abstractmethod
+    async def renew_broadcast_lease(self, broadcast_id: int, owner: str, lease_seconds: float) -> bool:
+        """Extend the lease; False if `owner` no longer holds it"""
+
+    @abstractmethod
+    async def release_broadcast(self, broadcast_id: int, owner: str):
+        """Drop the lease so another process can resume the broadcast right away"""
+
+    @abstractmethod
+    async def save_broadcast_progress(
+        self, broadcast_id: int, owner: str, last_user_id: int,
+        delivered: int, blocked: int, failed: int, finished: bool
+    ) -> bool:
+        """
+        Checkpoint and add to the counters if `owner` still holds the
+        lease; False (and nothing saved) otherwise. Finishing releases it.
+        """
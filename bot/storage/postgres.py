@@ -0,0 +1,532 @@
+# bot/storage/postgres.py
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency, only needed for STORAGE_BACKEND=postgres
+    asyncpg = None
+
+from .. import metrics
+from ..cache import UserRecord
+from ..config import settings
+from .base import OnboardingResult, Storage, rollup_buckets
+
+logger = logging.getLogger(__name__)
+
+# Serializes migrations between nodes starting at the same time
+_MIGRATION_LOCK_ID = 0x626F7472  # "botr"
+
+# Same numbering as the SQLite migrations in bot.db
+MIGRATIONS = [
+    # 1: base schema
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            invited_by BIGINT,
+            referrals_count INTEGER DEFAULT 0,
+            is_member INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS referrals (
+            id BIGSERIAL PRIMARY KEY,
+            inviter_id BIGINT,
+            invited_id BIGINT,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+    ],
+    # 2: one referral per (inviter, invited) pair, hot lookups indexed
+    [
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_inviter_invited ON referrals (inviter_id, invited_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_invited ON referrals (invited_id)",
+    ],
+    # 3: admin broadcasts with resumable progress
+    [
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id BIGSERIAL PRIMARY KEY,
+            admin_id BIGINT NOT NULL,
+            from_chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at TIMESTAMPTZ DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )
+        """,
+    ],
+    # 4: channel membership kept current by chat_member updates
+    [
+        """
+        CREATE TABLE IF NOT EXISTS channel_members (
+            channel TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (channel, user_id)
+        )
+        """,
+    ],
+    # 5: membership re-verification sweeper (cursor and detected lapses)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS membership_lapses (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            detected_at TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_membership_lapses_user ON membership_lapses (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_members ON users (user_id) WHERE is_member = 1",
+    ],
+    # 6: leaderboard index and incrementally maintained stats rollups
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_referrals_rank ON users (referrals_count DESC, user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS stats_rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            new_users BIGINT NOT NULL DEFAULT 0,
+            referrals BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket)
+        )
+        """,
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'total', '', (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM referrals)
+        """,
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'day', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD'), 0, COUNT(*) FROM referrals
+        WHERE created_at IS NOT NULL GROUP BY 2
+        """,
+        """
+        INSERT INTO stats_rollups (period, bucket, new_users, referrals)
+        SELECT 'hour', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:00'), 0, COUNT(*) FROM referrals
+        WHERE created_at IS NOT NULL GROUP BY 2
+        """,
+    ],
+    # 7: broadcast leases, so only one process runs each broadcast
+    [
+        "ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS owner TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ",
+    ],
+]
+
+_ROLLUP_UPSERT = (
+    "INSERT INTO stats_rollups (period, bucket, new_users, referrals) "
+    "VALUES ($1, $2, $7, $8), ($3, $4, $7, $8), ($5, $6, $7, $8) "
+    "ON CONFLICT (period, bucket) DO UPDATE SET "
+    "new_users = stats_rollups.new_users + EXCLUDED.new_users, "
+    "referrals = stats_rollups.referrals + EXCLUDED.referrals"
+)
+
+
+class PostgresStorage(Storage):
+    """
+    Storage on PostgreSQL through an asyncpg connection pool.
+
+    Every write is its own transaction and counts are updated in SQL, so
+    any number of bot processes on any number of hosts can share one
+    database. Requires the asyncpg package and DATABASE_URL.
+    """
+
+    name = "postgres"
+    transient_errors = (
+        asyncpg.TransactionRollbackError,  # serialization failures and deadlocks
+        asyncpg.PostgresConnectionError,
+        asyncpg.TooManyConnectionsError,
+        asyncpg.CannotConnectNowError,
+        ConnectionError,
+    ) if asyncpg is not None else ()
+
+    def __init__(self, dsn: str, min_size: int, max_size: int):
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._pool: Optional["asyncpg.Pool"] = None
+
+    async def open(self):
+        if self._pool is not None:
+            return
+        if asyncpg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires the asyncpg package")
+        if not self._dsn:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires DATABASE_URL")
+        self._pool = await asyncpg.create_pool(self._dsn, min_size=self._min_size, max_size=self._max_size)
+        async with self._pool.acquire() as conn:
+            await self._run_migrations(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @staticmethod
+    async def _run_migrations(conn: "asyncpg.Connection"):
+        await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        while True:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK_ID)
+                version = await conn.fetchval("SELECT max(version) FROM schema_version") or 0
+                if version >= len(MIGRATIONS):
+                    return
+                target = version + 1
+                logger.info("Applying database migration %d", target)
+                for statement in MIGRATIONS[version]:
+                    await conn.execute(statement)
+                await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", target)
+
+    async def _query(self, conn: "asyncpg.Connection", kind: str, sql: str, *args: Any):
+        """Run conn.<kind>(sql, *args), timed by statement like the SQLite connections"""
+        if not settings.METRICS_ENABLED:
+            return await getattr(conn, kind)(sql, *args)
+        started = time.perf_counter()
+        try:
+            return await getattr(conn, kind)(sql, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.db_query_latency.observe(elapsed, metrics.statement_label(sql))
+            metrics.add_phase("db", elapsed)
+
+    def _acquire(self):
+        if self._pool is None:
+            raise RuntimeError("Database is not initialized, call open() first")
+        return self._pool.acquire()
+
+    async def _pooled(self, kind: str, sql: str, *args: Any):
+        async with self._acquire() as conn:
+            return await self._query(conn, kind, sql, *args)
+
+    async def _bump_rollups(self, conn: "asyncpg.Connection", new_users: int, referrals: int):
+        buckets = [value for bucket in rollup_buckets() for value in bucket]
+        await self._query(conn, "execute", _ROLLUP_UPSERT, *buckets, new_users, referrals)
+
+    async def create_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], invited_by: Optional[int]
+    ) -> bool:
+        if invited_by == user_id:
+            invited_by = None
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                created = await self._query(
+                    conn, "fetchval",
+                    "INSERT INTO users (user_id, username, full_name, invited_by, referrals_count) "
+                    "VALUES ($1, $2, $3, $4, 0) ON CONFLICT (user_id) DO NOTHING RETURNING user_id",
+                    user_id, username, full_name, invited_by
+                )
+                if created is not None:
+                    await self._bump_rollups(conn, new_users=1, referrals=0)
+        return created is not None
+
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        row = await self._pooled(
+            "fetchrow",
+            "SELECT user_id, invited_by, referrals_count, is_member FROM users WHERE user_id = $1",
+            user_id
+        )
+        if row is None:
+            return None
+        return UserRecord(row["user_id"], row["invited_by"], row["referrals_count"] or 0, row["is_member"] or 0)
+
+    async def set_user_member(self, user_id: int):
+        await self._pooled("execute", "UPDATE users SET is_member = 1 WHERE user_id = $1", user_id)
+
+    async def update_user_inviter(self, user_id: int, inviter_id: int) -> bool:
+        if inviter_id == user_id:
+            return False
+        status = await self._pooled(
+            "execute",
+            "UPDATE users SET invited_by = $1 WHERE user_id = $2 AND invited_by IS NULL",
+            inviter_id, user_id
+        )
+        return status == "UPDATE 1"
+
+    async def list_users(self, limit: int, after_user_id: int) -> List[Dict[str, Any]]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT user_id, username, referrals_count, is_member FROM users "
+            "WHERE user_id > $1 ORDER BY user_id LIMIT $2",
+            after_user_id, limit
+        )
+        return [dict(r) for r in rows]
+
+    async def users_page(self, after_user_id: int, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT user_id, username, full_name, invited_by, referrals_count, is_member "
+            "FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2",
+            after_user_id, limit
+        )
+        return [dict(r) for r in rows]
+
+    async def user_ids_after(self, after_user_id: int, limit: int) -> List[int]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT user_id FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2",
+            after_user_id, limit
+        )
+        return [r["user_id"] for r in rows]
+
+    async def onboard_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], inviter_id: Optional[int]
+    ) -> OnboardingResult:
+        if inviter_id == user_id:
+            inviter_id = None
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                row = await self._query(
+                    conn, "fetchrow",
+                    "INSERT INTO users (user_id, username, full_name, invited_by, referrals_count, is_member) "
+                    "VALUES ($1, $2, $3, $4, 0, 1) "
+                    "ON CONFLICT (user_id) DO UPDATE SET is_member = 1, "
+                    "invited_by = COALESCE(users.invited_by, EXCLUDED.invited_by) "
+                    "RETURNING invited_by, referrals_count, (xmax = 0) AS created",
+                    user_id, username, full_name, inviter_id
+                )
+                invited_by, own_count = row["invited_by"], row["referrals_count"] or 0
+                if invited_by == user_id:
+                    # Stored before self-referrals were rejected; never credit it
+                    invited_by = None
+                added = inviter_count = None
+                if invited_by is not None:
+                    added = await self._query(
+                        conn, "fetchval",
+                        "INSERT INTO referrals (inviter_id, invited_id) VALUES ($1, $2) "
+                        "ON CONFLICT (inviter_id, invited_id) DO NOTHING RETURNING id",
+                        invited_by, user_id
+                    )
+                if added is not None:
+                    inviter_count = await self._query(
+                        conn, "fetchval",
+                        "UPDATE users SET referrals_count = COALESCE(referrals_count, 0) + 1 "
+                        "WHERE user_id = $1 RETURNING referrals_count",
+                        invited_by
+                    ) or 0
+                if row["created"] or added is not None:
+                    await self._bump_rollups(conn, int(row["created"]), int(added is not None))
+        return OnboardingResult(invited_by, added is not None, inviter_count, own_count)
+
+    async def add_referral(self, inviter_id: int, invited_id: int) -> Tuple[bool, int]:
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                # The unique index on (inviter_id, invited_id) rejects duplicates
+                added = await self._query(
+                    conn, "fetchval",
+                    "INSERT INTO referrals (inviter_id, invited_id) VALUES ($1, $2) "
+                    "ON CONFLICT (inviter_id, invited_id) DO NOTHING RETURNING id",
+                    inviter_id, invited_id
+                )
+                if added is not None:
+                    new_count = await self._query(
+                        conn, "fetchval",
+                        "UPDATE users SET referrals_count = COALESCE(referrals_count, 0) + 1 "
+                        "WHERE user_id = $1 RETURNING referrals_count",
+                        inviter_id
+                    )
+                    await self._bump_rollups(conn, new_users=0, referrals=1)
+                else:
+                    new_count = await self._query(
+                        conn, "fetchval",
+                        "SELECT referrals_count FROM users WHERE user_id = $1",
+                        inviter_id
+                    )
+        return added is not None, new_count or 0
+
+    async def referrals_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT id, inviter_id, invited_id, to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS created_at "
+            "FROM referrals WHERE id > $1 ORDER BY id LIMIT $2",
+            after_id, limit
+        )
+        return [dict(r) for r in rows]
+
+    async def eligible_user_ids(self, threshold: int) -> List[int]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT user_id FROM users WHERE referrals_count >= $1",
+            threshold
+        )
+        return [r["user_id"] for r in rows]
+
+    async def reconcile_referral_chunk(self, after_user_id: int, limit: int) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                last_user_id = await self._query(
+                    conn, "fetchval",
+                    "SELECT MAX(user_id) FROM (SELECT user_id FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2) AS chunk",
+                    after_user_id, limit
+                )
+                if last_user_id is None:
+                    return None, []
+                # Wait for in-flight add_referral transactions and hold off new
+                # ones until this chunk commits, so the counts below cannot
+                # overwrite a fresh increment
+                await self._query(conn, "execute", "LOCK TABLE referrals IN SHARE MODE")
+                rows = await self._query(
+                    conn, "fetch",
+                    "UPDATE users SET referrals_count = actual.cnt "
+                    "FROM (SELECT u.user_id, "
+                    "(SELECT COUNT(*) FROM referrals r WHERE r.inviter_id = u.user_id) AS cnt "
+                    "FROM users u WHERE u.user_id > $1 AND u.user_id <= $2) AS actual "
+                    "WHERE users.user_id = actual.user_id "
+                    "AND users.referrals_count IS DISTINCT FROM actual.cnt "
+                    "RETURNING users.user_id, users.referrals_count",
+                    after_user_id, last_user_id
+                )
+        return last_user_id, [(r["user_id"], r["referrals_count"]) for r in rows]
+
+    async def top_inviters(self, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT user_id, username, full_name, referrals_count FROM users "
+            "WHERE referrals_count > 0 ORDER BY referrals_count DESC, user_id LIMIT $1",
+            limit
+        )
+        return [dict(r) for r in rows]
+
+    async def get_rollups(self, period: str, since_bucket: str) -> Dict[str, Tuple[int, int]]:
+        rows = await self._pooled(
+            "fetch",
+            "SELECT bucket, new_users, referrals FROM stats_rollups "
+            "WHERE period = $1 AND bucket >= $2 ORDER BY bucket",
+            period, since_bucket
+        )
+        return {r["bucket"]: (r["new_users"], r["referrals"]) for r in rows}
+
+    async def set_channel_status(self, channel: str, user_id: int, status: str):
+        await self._pooled(
+            "execute",
+            "INSERT INTO channel_members (channel, user_id, status) VALUES ($1, $2, $3) "
+            "ON CONFLICT (channel, user_id) DO UPDATE SET status = EXCLUDED.status, updated_at = now()",
+            channel, user_id, status
+        )
+
+    async def get_channel_status(
+        self, channel: str, user_id: int, max_age: Optional[float] = None
+    ) -> Optional[str]:
+        if max_age is None:
+            return await self._pooled(
+                "fetchval",
+                "SELECT status FROM channel_members WHERE channel = $1 AND user_id = $2",
+                channel, user_id
+            )
+        return await self._pooled(
+            "fetchval",
+            "SELECT status FROM channel_members WHERE channel = $1 AND user_id = $2 "
+            "AND updated_at >= now() - make_interval(secs => $3)",
+            channel, user_id, float(max_age)
+        )
+
+    async def claim_member_batch(self, job: str, limit: int) -> List[int]:
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                await self._query(
+                    conn, "execute",
+                    "INSERT INTO job_state (name, value) VALUES ($1, '0') ON CONFLICT (name) DO NOTHING",
+                    job
+                )
+                # The row lock hands each batch to exactly one process
+                cursor = await self._query(
+                    conn, "fetchval", "SELECT value FROM job_state WHERE name = $1 FOR UPDATE", job
+                )
+                rows = await self._query(
+                    conn, "fetch",
+                    "SELECT user_id FROM users WHERE is_member = 1 AND user_id > $1 ORDER BY user_id LIMIT $2",
+                    int(cursor), limit
+                )
+                ids = [r["user_id"] for r in rows]
+                await self._query(
+                    conn, "execute",
+                    "UPDATE job_state SET value = $2, updated_at = now() WHERE name = $1",
+                    job, str(ids[-1] if ids else 0)
+                )
+        return ids
+
+    async def record_lapse(self, user_id: int, channel: str, status: str):
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                await self._query(conn, "execute", "UPDATE users SET is_member = 0 WHERE user_id = $1", user_id)
+                await self._query(
+                    conn, "execute",
+                    "INSERT INTO membership_lapses (user_id, channel, status) VALUES ($1, $2, $3)",
+                    user_id, channel, status
+                )
+
+    async def create_broadcast(
+        self, admin_id: int, from_chat_id: int, message_id: int, owner: str, lease_seconds: float
+    ) -> int:
+        return await self._pooled(
+            "fetchval",
+            "INSERT INTO broadcasts (admin_id, from_chat_id, message_id, owner, lease_until) "
+            "VALUES ($1, $2, $3, $4, now() + make_interval(secs => $5)) RETURNING id",
+            admin_id, from_chat_id, message_id, owner, float(lease_seconds)
+        )
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        row = await self._pooled("fetchrow", "SELECT * FROM broadcasts WHERE id = $1", broadcast_id)
+        return dict(row) if row else None
+
+    async def claim_broadcasts(self, owner: str, lease_seconds: float) -> List[int]:
+        # A concurrent claim blocks on the row lock and then re-checks the
+        # WHERE clause against the new owner, so each row goes to one process
+        rows = await self._pooled(
+            "fetch",
+            "UPDATE broadcasts SET owner = $1, lease_until = now() + make_interval(secs => $2) "
+            "WHERE status = 'running' AND (owner IS NULL OR lease_until IS NULL OR lease_until < now()) "
+            "RETURNING id",
+            owner, float(lease_seconds)
+        )
+        return sorted(r["id"] for r in rows)
+
+    async def renew_broadcast_lease(self, broadcast_id: int, owner: str, lease_seconds: float) -> bool:
+        status = await self._pooled(
+            "execute",
+            "UPDATE broadcasts SET lease_until = now() + make_interval(secs => $3) "
+            "WHERE id = $1 AND owner = $2 AND status = 'running'",
+            broadcast_id, owner, float(lease_seconds)
+        )
+        return status == "UPDATE 1"
+
+    async def release_broadcast(self, broadcast_id: int, owner: str):
+        await self._pooled(
+            "execute",
+            "UPDATE broadcasts SET owner = NULL, lease_until = NULL WHERE id = $1 AND owner = $2",
+            broadcast_id, owner
+        )
+
+    async def save_broadcast_progress(
+        self, broadcast_id: int, owner: str, last_user_id: int,
+        delivered: int, blocked: int, failed: int, finished: bool
+    ) -> bool:
+        status = await self._pooled(
+            "execute",
+            "UPDATE broadcasts SET last_user_id = $1, delivered = delivered + $2, "
+            "blocked = blocked + $3, failed = failed + $4, "
+            "status = CASE WHEN $5 THEN 'finished' ELSE status END, "
+            "finished_at = CASE WHEN $5 THEN now() ELSE finished_at END, "
+            "owner = CASE WHEN $5 THEN NULL ELSE owner END, "
+            "lease_until = CASE WHEN $5 THEN NULL ELSE lease_until END "
+            "WHERE id = $6 AND owner = $7 AND status = 'running'",
+            last_user_id, delivered, blocked, failed, finished, broadcast_id, owner
+        )
+        return status == "UPDATE 1"
@@ -0,0 +1,396 @@
+# bot/storage/sqlite.py
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from .. import db
+from ..cache import UserRecord
+from .base import OnboardingResult, Storage, rollup_buckets
+
+_USER_FIELDS = "user_id, invited_by, referrals_count, is_member"
+
+_ROLLUP_UPSERT = (
+    "INSERT INTO stats_rollups (period, bucket, new_users, referrals) "
+    "VALUES (?, ?, ?, ?), (?, ?, ?, ?), (?, ?, ?, ?) "
+    "ON CONFLICT (period, bucket) DO UPDATE SET "
+    "new_users = new_users + excluded.new_users, referrals = referrals + excluded.referrals"
+)
+
+
+async def _bump_rollups(conn: aiosqlite.Connection, new_users: int, referrals: int):
+    """Count new users and referrals in the current hour, day and total rows"""
+    params = []
+    for period, bucket in rollup_buckets():
+        params += [period, bucket, new_users, referrals]
+    await conn.execute(_ROLLUP_UPSERT, params)
+
+
+def _seconds(seconds: float) -> str:
+    """datetime() modifier for `seconds` from now, negative for the past"""
+    return f"{seconds:+.3f} seconds"
+
+
+def _to_record(row: aiosqlite.Row) -> UserRecord:
+    return UserRecord(
+        row["user_id"],
+        row["invited_by"],
+        row["referrals_count"] if row["referrals_count"] is not None else 0,
+        row["is_member"] or 0,
+    )
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage on a local SQLite file (bot.db): pooled reader connections and
+    a single writer whose operations are group-committed by the write
+    coordinator. Only one process may write to the file at a time.
+    """
+
+    name = "sqlite"
+    # "database is locked" and friends
+    transient_errors = (sqlite3.OperationalError,)
+
+    async def open(self):
+        await db.init_db()
+
+    async def close(self):
+        await db.close_db()
+
+    def write_queue_depth(self) -> int:
+        return db.write_queue_depth()
+
+    async def create_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], invited_by: Optional[int]
+    ) -> bool:
+        if invited_by == user_id:
+            invited_by = None
+
+        async def op(conn: aiosqlite.Connection) -> bool:
+            cur = await conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, username, full_name, invited_by, referrals_count) VALUES (?, ?, ?, ?, 0)",
+                (user_id, username, full_name, invited_by)
+            )
+            created = cur.rowcount == 1
+            if created:
+                await _bump_rollups(conn, new_users=1, referrals=0)
+            return created
+
+        return await db.run_write(op)
+
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                f"SELECT {_USER_FIELDS} FROM users WHERE user_id = ?",
+                (user_id,)
+            )
+            row = await cur.fetchone()
+        return _to_record(row) if row else None
+
+    async def set_user_member(self, user_id: int):
+        async def op(conn: aiosqlite.Connection):
+            await conn.execute(
+                "UPDATE users SET is_member = 1 WHERE user_id = ?",
+                (user_id,)
+            )
+
+        await db.run_write(op)
+
+    async def update_user_inviter(self, user_id: int, inviter_id: int) -> bool:
+        if inviter_id == user_id:
+            return False
+
+        async def op(conn: aiosqlite.Connection) -> bool:
+            cur = await conn.execute(
+                "UPDATE users SET invited_by = ? WHERE user_id = ? AND invited_by IS NULL",
+                (inviter_id, user_id)
+            )
+            return cur.rowcount == 1
+
+        return await db.run_write(op)
+
+    async def list_users(self, limit: int, after_user_id: int) -> List[Dict[str, Any]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT user_id, username, referrals_count, is_member FROM users "
+                "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit)
+            )
+            return [dict(r) for r in await cur.fetchall()]
+
+    async def users_page(self, after_user_id: int, limit: int) -> List[Dict[str, Any]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT user_id, username, full_name, invited_by, referrals_count, is_member "
+                "FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit)
+            )
+            return [dict(r) for r in await cur.fetchall()]
+
+    async def user_ids_after(self, after_user_id: int, limit: int) -> List[int]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit)
+            )
+            return [r["user_id"] for r in await cur.fetchall()]
+
+    async def onboard_user(
+        self, user_id: int, username: Optional[str], full_name: Optional[str], inviter_id: Optional[int]
+    ) -> OnboardingResult:
+        if inviter_id == user_id:
+            inviter_id = None
+
+        async def op(conn: aiosqlite.Connection) -> OnboardingResult:
+            cur = await conn.execute(
+                "INSERT INTO users (user_id, username, full_name, invited_by, referrals_count, is_member) "
+                "VALUES (?, ?, ?, ?, 0, 1) ON CONFLICT (user_id) DO NOTHING",
+                (user_id, username, full_name, inviter_id)
+            )
+            created = cur.rowcount == 1
+            if created:
+                invited_by, own_count = inviter_id, 0
+            else:
+                cur = await conn.execute(
+                    "UPDATE users SET is_member = 1, invited_by = COALESCE(invited_by, ?) "
+                    "WHERE user_id = ? RETURNING invited_by, referrals_count",
+                    (inviter_id, user_id)
+                )
+                row = await cur.fetchone()
+                invited_by, own_count = row["invited_by"], row["referrals_count"] or 0
+            if invited_by == user_id:
+                # Stored before self-referrals were rejected; never credit it
+                invited_by = None
+
+            added, inviter_count = False, None
+            if invited_by is not None:
+                cur = await conn.execute(
+                    "INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?) "
+                    "ON CONFLICT (inviter_id, invited_id) DO NOTHING",
+                    (invited_by, user_id)
+                )
+                added = cur.rowcount == 1
+            if added:
+                cur = await conn.execute(
+                    "UPDATE users SET referrals_count = COALESCE(referrals_count, 0) + 1 "
+                    "WHERE user_id = ? RETURNING referrals_count",
+                    (invited_by,)
+                )
+                row = await cur.fetchone()
+                inviter_count = row["referrals_count"] if row else 0
+            if created or added:
+                await _bump_rollups(conn, int(created), int(added))
+            return OnboardingResult(invited_by, added, inviter_count, own_count)
+
+        return await db.run_write(op)
+
+    async def add_referral(self, inviter_id: int, invited_id: int) -> Tuple[bool, int]:
+        async def op(conn: aiosqlite.Connection) -> Tuple[bool, int]:
+            # The unique index on (inviter_id, invited_id) rejects duplicates
+            cur = await conn.execute(
+                "INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?) "
+                "ON CONFLICT (inviter_id, invited_id) DO NOTHING",
+                (inviter_id, invited_id)
+            )
+            was_added = cur.rowcount == 1
+
+            if was_added:
+                await _bump_rollups(conn, new_users=0, referrals=1)
+                cur = await conn.execute(
+                    "UPDATE users SET referrals_count = COALESCE(referrals_count, 0) + 1 "
+                    "WHERE user_id = ? RETURNING referrals_count",
+                    (inviter_id,)
+                )
+            else:
+                cur = await conn.execute(
+                    "SELECT referrals_count FROM users WHERE user_id = ?",
+                    (inviter_id,)
+                )
+            row = await cur.fetchone()
+            new_count = row["referrals_count"] if row and row["referrals_count"] is not None else 0
+            return was_added, new_count
+
+        return await db.run_write(op)
+
+    async def referrals_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT id, inviter_id, invited_id, created_at "
+                "FROM referrals WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            )
+            return [dict(r) for r in await cur.fetchall()]
+
+    async def eligible_user_ids(self, threshold: int) -> List[int]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT user_id FROM users WHERE referrals_count >= ?",
+                (threshold,)
+            )
+            return [row[0] for row in await cur.fetchall()]
+
+    async def reconcile_referral_chunk(self, after_user_id: int, limit: int) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+        async def op(conn: aiosqlite.Connection) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+            cur = await conn.execute(
+                "SELECT MAX(user_id) FROM (SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?)",
+                (after_user_id, limit)
+            )
+            last_user_id = (await cur.fetchone())[0]
+            if last_user_id is None:
+                return None, []
+            # Each count is an index range lookup on (inviter_id, invited_id)
+            cur = await conn.execute(
+                "UPDATE users SET referrals_count = "
+                "(SELECT COUNT(*) FROM referrals WHERE inviter_id = users.user_id) "
+                "WHERE user_id > ? AND user_id <= ? AND referrals_count IS NOT "
+                "(SELECT COUNT(*) FROM referrals WHERE inviter_id = users.user_id) "
+                "RETURNING user_id, referrals_count",
+                (after_user_id, last_user_id)
+            )
+            return last_user_id, [tuple(r) for r in await cur.fetchall()]
+
+        return await db.run_write(op)
+
+    async def top_inviters(self, limit: int) -> List[Dict[str, Any]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT user_id, username, full_name, referrals_count FROM users "
+                "WHERE referrals_count > 0 ORDER BY referrals_count DESC, user_id LIMIT ?",
+                (limit,)
+            )
+            return [dict(r) for r in await cur.fetchall()]
+
+    async def get_rollups(self, period: str, since_bucket: str) -> Dict[str, Tuple[int, int]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT bucket, new_users, referrals FROM stats_rollups "
+                "WHERE period = ? AND bucket >= ? ORDER BY bucket",
+                (period, since_bucket)
+            )
+            return {r["bucket"]: (r["new_users"], r["referrals"]) for r in await cur.fetchall()}
+
+    async def set_channel_status(self, channel: str, user_id: int, status: str):
+        async def op(conn: aiosqlite.Connection):
+            await conn.execute(
+                "INSERT INTO channel_members (channel, user_id, status) VALUES (?, ?, ?) "
+                "ON CONFLICT (channel, user_id) DO UPDATE SET status = excluded.status, "
+                "updated_at = datetime('now')",
+                (channel, user_id, status)
+            )
+
+        await db.run_write(op)
+
+    async def get_channel_status(
+        self, channel: str, user_id: int, max_age: Optional[float] = None
+    ) -> Optional[str]:
+        sql = "SELECT status FROM channel_members WHERE channel = ? AND user_id = ?"
+        params = [channel, user_id]
+        if max_age is not None:
+            sql += " AND updated_at >= datetime('now', ?)"
+            params.append(_seconds(-max_age))
+        async with db.get_db() as conn:
+            cur = await conn.execute(sql, params)
+            row = await cur.fetchone()
+        return row["status"] if row else None
+
+    async def claim_member_batch(self, job: str, limit: int) -> List[int]:
+        async def op(conn: aiosqlite.Connection) -> List[int]:
+            cur = await conn.execute("SELECT value FROM job_state WHERE name = ?", (job,))
+            row = await cur.fetchone()
+            cur = await conn.execute(
+                "SELECT user_id FROM users WHERE is_member = 1 AND user_id > ? ORDER BY user_id LIMIT ?",
+                (int(row["value"]) if row else 0, limit)
+            )
+            ids = [r["user_id"] for r in await cur.fetchall()]
+            await conn.execute(
+                "INSERT INTO job_state (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = datetime('now')",
+                (job, str(ids[-1] if ids else 0))
+            )
+            return ids
+
+        return await db.run_write(op)
+
+    async def record_lapse(self, user_id: int, channel: str, status: str):
+        async def op(conn: aiosqlite.Connection):
+            await conn.execute("UPDATE users SET is_member = 0 WHERE user_id = ?", (user_id,))
+            await conn.execute(
+                "INSERT INTO membership_lapses (user_id, channel, status) VALUES (?, ?, ?)",
+                (user_id, channel, status)
+            )
+
+        await db.run_write(op)
+
+    async def create_broadcast(
+        self, admin_id: int, from_chat_id: int, message_id: int, owner: str, lease_seconds: float
+    ) -> int:
+        async def op(conn: aiosqlite.Connection) -> int:
+            cur = await conn.execute(
+                "INSERT INTO broadcasts (admin_id, from_chat_id, message_id, owner, lease_until) "
+                "VALUES (?, ?, ?, ?, datetime('now', ?))",
+                (admin_id, from_chat_id, message_id, owner, _seconds(lease_seconds))
+            )
+            return cur.lastrowid
+
+        return await db.run_write(op)
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        async with db.get_db() as conn:
+            cur = await conn.execute(
+                "SELECT * FROM broadcasts WHERE id = ?",
+                (broadcast_id,)
+            )
+            row = await cur.fetchone()
+        return dict(row) if row else None
+
+    async def claim_broadcasts(self, owner: str, lease_seconds: float) -> List[int]:
+        async def op(conn: aiosqlite.Connection) -> List[int]:
+            cur = await conn.execute(
+                "UPDATE broadcasts SET owner = ?, lease_until = datetime('now', ?) "
+                "WHERE status = 'running' "
+                "AND (owner IS NULL OR lease_until IS NULL OR lease_until < datetime('now')) "
+                "RETURNING id",
+                (owner, _seconds(lease_seconds))
+            )
+            return sorted(r["id"] for r in await cur.fetchall())
+
+        return await db.run_write(op)
+
+    async def renew_broadcast_lease(self, broadcast_id: int, owner: str, lease_seconds: float) -> bool:
+        async def op(conn: aiosqlite.Connection) -> bool:
+            cur = await conn.execute(
+                "UPDATE broadcasts SET lease_until = datetime('now', ?) "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (_seconds(lease_seconds), broadcast_id, owner)
+            )
+            return cur.rowcount == 1
+
+        return await db.run_write(op)
+
+    async def release_broadcast(self, broadcast_id: int, owner: str):
+        async def op(conn: aiosqlite.Connection):
+            await conn.execute(
+                "UPDATE broadcasts SET owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?",
+                (broadcast_id, owner)
+            )
+
+        await db.run_write(op)
+
+    async def save_broadcast_progress(
+        self, broadcast_id: int, owner: str, last_user_id: int,
+        delivered: int, blocked: int, failed: int, finished: bool
+    ) -> bool:
+        async def op(conn: aiosqlite.Connection) -> bool:
+            cur = await conn.execute(
+                "UPDATE broadcasts SET last_user_id = ?, delivered = delivered + ?, "
+                "blocked = blocked + ?, failed = failed + ?, "
+                "status = CASE WHEN ? THEN 'finished' ELSE status END, "
+                "finished_at = CASE WHEN ? THEN datetime('now') ELSE finished_at END, "
+                "owner = CASE WHEN ? THEN NULL ELSE owner END, "
+                "lease_until = CASE WHEN ? THEN NULL ELSE lease_until END "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (last_user_id, delivered, blocked, failed, finished, finished, finished, finished, broadcast_id, owner)
+            )
+            return cur.rowcount == 1
+
+        return await db.run_write(op)
@@ -0,0 +1,166 @@
+# bot/webhook.py
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from . import metrics
+from .config import settings
+from .main import create_bot, create_dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that processes at most max_concurrency updates at once.
+
+    Telegram gets its response as soon as a slot is free, and the update
+    is then handled in the background. During a burst, requests wait for a
+    slot, so the backlog pushes back on Telegram instead of piling up
+    unbounded handler tasks in the process.
+    """
+
+    def __init__(self, *args: Any, max_concurrency: int, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        except Exception as e:
+            logger.exception("Failed to process webhook update: %s", e)
+        finally:
+            self._slots.release()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._slots.acquire()
+        try:
+            return await super()._handle_request_background(bot=bot, request=request)
+        except BaseException:
+            # The update was never scheduled, so its slot is still ours
+            self._slots.release()
+            raise
+
+
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """Build the aiohttp application serving the webhook endpoint"""
+    app = web.Application()
+
+    BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET,
+        max_concurrency=settings.WEBHOOK_MAX_CONCURRENCY,
+    ).register(app, path=settings.WEBHOOK_PATH)
+    if settings.METRICS_ENABLED:
+        app.router.add_get(settings.METRICS_PATH, metrics.handle_metrics)
+
+    # Runs dispatcher startup/shutdown hooks together with the app
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def register_webhook(bot: Bot, dp: Dispatcher):
+    """Point Telegram at WEBHOOK_BASE_URL. Skipped when it is not set (local testing)."""
+    if not settings.WEBHOOK_BASE_URL:
+        logger.warning("WEBHOOK_BASE_URL is not set, not registering webhook with Telegram")
+        return
+
+    url = settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH
+    await bot.set_webhook(
+        url=url,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info("Webhook registered at %s", url)
+
+
+async def serve(register: bool = True, reuse_port: bool = False, stop: Optional[asyncio.Event] = None):
+    """Run one webhook server process until stop is set or the task is cancelled"""
+    bot = create_bot()
+    dp = create_dispatcher()
+    if register:
+        await register_webhook(bot, dp)
+
+    app = create_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=settings.WEBHOOK_HOST,
+        port=settings.WEBHOOK_PORT,
+        reuse_port=reuse_port or None,
+    )
+    await site.start()
+    logger.info(
+        "Webhook server listening on %s:%d%s",
+        settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, settings.WEBHOOK_PATH
+    )
+
+    try:
+        await (stop or asyncio.Event()).wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _serve_worker():
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await serve(register=False, reuse_port=True, stop=stop)
+
+
+def _worker_main():
+    # Ctrl+C goes to the whole process group; let the parent stop workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve_worker())
+
+
+async def _register_only():
+    bot = create_bot()
+    try:
+        await register_webhook(bot, create_dispatcher())
+    finally:
+        await bot.session.close()
+
+
+def run_webhook():
+    """
+    Register the webhook and serve it with WEBHOOK_WORKERS processes.
+
+    With more than one worker, every process binds the same port with
+    SO_REUSEPORT and the kernel spreads incoming connections between them.
+    Workers are spawned (not forked) so each builds its own dispatcher,
+    bot session and database pool.
+    """
+    workers = max(1, settings.WEBHOOK_WORKERS)
+    if workers == 1:
+        asyncio.run(serve())
+        return
+
+    asyncio.run(_register_only())
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=_worker_main, name=f"webhook-worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info("Started %d webhook workers", workers)
+
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,139 @@
+# bot/write_coordinator.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_STOP = object()
+
+
+class WriteCoordinator:
+    """
+    Single writer task that drains a queue of write operations and
+    commits them in batched transactions (group commit).
+
+    Each operation is an async callable receiving the writer connection.
+    It runs inside its own SAVEPOINT, so a failing operation is rolled back
+    without affecting the rest of its batch. Callers await their own result.
+
+    The connection must be opened with isolation_level=None, since the
+    coordinator issues BEGIN/COMMIT itself.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, batch_size: int = 64, max_latency: float = 0.005):
+        self._conn = conn
+        self._batch_size = max(1, batch_size)
+        self._max_latency = max(0.0, max_latency)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.operations = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="db-write-coordinator")
+
+    async def stop(self):
+        """Flush queued writes and stop the writer task"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, op: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """Queue a write operation and wait until its batch is committed"""
+        if self._task is None:
+            raise RuntimeError("Write coordinator is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return await future
+
+    async def _collect_batch(self, first) -> Tuple[List[tuple], bool]:
+        """Gather up to batch_size operations, waiting at most max_latency"""
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_latency
+
+        while len(batch) < self._batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = await self._collect_batch(first)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[tuple]):
+        conn = self._conn
+        results = []
+
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                if future.cancelled():
+                    results.append(None)
+                    continue
+                await conn.execute("SAVEPOINT write_op")
+                try:
+                    result = await op(conn)
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_op")
+                    await conn.execute("RELEASE write_op")
+                    results.append(e)
+                else:
+                    await conn.execute("RELEASE write_op")
+                    results.append(_Ok(result))
+            await conn.execute("COMMIT")
+        except Exception as e:
+            logger.exception("Write batch of %d operations failed", len(batch))
+            if conn.in_transaction:
+                await conn.execute("ROLLBACK")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, _Ok):
+                future.set_result(result.value)
+            else:
+                future.set_exception(result)
+
+
+class _Ok:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
@@ -0,0 +1,116 @@
+"""
+Shared fixtures.
+
+bot.config reads Settings at import time, so required settings are filled
+in here before any test module imports the bot package. Coroutine tests
+run on the per-test `event_loop`, the same loop their fixtures opened
+the database on.
+
+`backend` runs a test against every Storage implementation: SQLite on a
+temporary file, and PostgreSQL on TEST_DATABASE_URL (or DATABASE_URL)
+when one is set. The PostgreSQL tables are emptied before each test, so
+point it at a throwaway database.
+"""
+import asyncio
+import inspect
+import os
+import re
+
+import pytest
+
+for _key, _value in {
+    "BOT_TOKEN": "123456:test-token",
+    "CHANNEL_1": "@test_channel_1",
+    "CHANNEL_2": "@test_channel_2",
+    "BOT_USERNAME": "test_bot",
+    "ADMIN_IDS": "[]",
+    "ADMIN_PANEL_TOKEN": "test",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    loop = pyfuncitem.funcargs.get("event_loop") or asyncio.new_event_loop()
+    loop.run_until_complete(pyfuncitem.obj(**args))
+    return True
+
+
+@pytest.fixture
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def sqlite_db(event_loop, tmp_path, monkeypatch):
+    """The configured SQLite storage on an empty database file, with empty caches"""
+    from bot import db, models
+    from bot.storage import storage
+
+    if storage.name != "sqlite":
+        pytest.skip("STORAGE_BACKEND is not sqlite")
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+    models.user_cache.clear()
+    models.eligible_users.load([])
+    event_loop.run_until_complete(storage.open())
+    yield storage
+    event_loop.run_until_complete(storage.close())
+    models.user_cache.clear()
+
+
+_PG_TABLES = "users, referrals, broadcasts, channel_members, job_state, membership_lapses, stats_rollups"
+
+
+def _postgres_url():
+    return os.environ.get("TEST_DATABASE_URL") or os.environ.get("DATABASE_URL")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, event_loop, tmp_path, monkeypatch):
+    """An open Storage of each kind on an empty database"""
+    from bot import db
+
+    if request.param == "sqlite":
+        from bot.storage.sqlite import SQLiteStorage
+
+        monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+        storage = SQLiteStorage()
+        event_loop.run_until_complete(storage.open())
+    else:
+        from bot.storage.postgres import PostgresStorage, asyncpg
+
+        if not _postgres_url():
+            pytest.skip("set TEST_DATABASE_URL or DATABASE_URL to run against PostgreSQL")
+        if asyncpg is None:
+            pytest.skip("asyncpg is not installed")
+        storage = PostgresStorage(_postgres_url(), min_size=1, max_size=8)
+        event_loop.run_until_complete(storage.open())
+        event_loop.run_until_complete(execute(storage, f"TRUNCATE {_PG_TABLES} RESTART IDENTITY"))
+    yield storage
+    event_loop.run_until_complete(storage.close())
+
+
+async def execute(storage, sql: str, *args):
+    """Run raw SQL written with ? placeholders on either backend"""
+    if storage.name == "sqlite":
+        from bot import db
+
+        async def op(conn):
+            await conn.execute(sql, args)
+
+        await db.run_write(op)
+    else:
+        numbered = iter(range(1, len(args) + 1))
+        async with storage._acquire() as conn:
+            await conn.execute(re.sub(r"\?", lambda _: f"${next(numbered)}", sql), *args)
+
+
+@pytest.fixture
+def sql(backend):
+    """execute() bound to the backend under test"""
+    return lambda statement, *args: execute(backend, statement, *args)
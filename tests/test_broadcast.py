@@ -0,0 +1,47 @@
+from bot import db, models
+from bot.services import broadcast
+
+
+async def _expire_leases():
+    async def op(conn):
+        await conn.execute("UPDATE broadcasts SET lease_until = datetime('now', '-1 seconds')")
+
+    await db.run_write(op)
+
+
+async def test_running_broadcast_is_resumed_by_one_process(sqlite_db, monkeypatch):
+    started = []
+    monkeypatch.setattr(broadcast, "start_broadcast", lambda broadcast_id: started.append(broadcast_id))
+    broadcast_id = await models.create_broadcast(1, 1, 10, "worker-a", 60)
+    await models.release_broadcast(broadcast_id, "worker-a")
+
+    # Every worker resumes broadcasts on startup; only the first claim wins
+    for worker in ("worker-b", "worker-c"):
+        monkeypatch.setattr(broadcast, "OWNER", worker)
+        await broadcast.resume_broadcasts()
+
+    assert started == [broadcast_id]
+    assert (await models.get_broadcast(broadcast_id))["owner"] == "worker-b"
+
+
+async def test_live_lease_is_not_claimed(sqlite_db):
+    broadcast_id = await models.create_broadcast(1, 1, 10, "worker-a", 60)
+
+    assert await models.claim_broadcasts("worker-b", 60) == []
+    await _expire_leases()
+    assert await models.claim_broadcasts("worker-b", 60) == [broadcast_id]
+    assert not await models.renew_broadcast_lease(broadcast_id, "worker-a", 60)
+
+
+async def test_progress_is_saved_only_by_the_lease_holder(sqlite_db):
+    broadcast_id = await models.create_broadcast(1, 1, 10, "worker-a", 60)
+    await _expire_leases()
+    await models.claim_broadcasts("worker-b", 60)
+
+    assert not await models.save_broadcast_progress(broadcast_id, "worker-a", 500, 500, 0, 0)
+    assert await models.save_broadcast_progress(broadcast_id, "worker-b", 500, 490, 10, 0)
+    assert await models.save_broadcast_progress(broadcast_id, "worker-b", 500, 0, 0, 0, finished=True)
+
+    row = await models.get_broadcast(broadcast_id)
+    assert (row["delivered"], row["blocked"], row["status"], row["owner"]) == (490, 10, "finished", None)
+    assert await models.claim_broadcasts("worker-c", 60) == []
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from bot import cache as cache_module
+from bot.cache import AsyncTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def _cache(positive_ttl=60.0, negative_ttl=5.0):
+    return AsyncTTLCache(maxsize=100, positive_ttl=positive_ttl, negative_ttl=negative_ttl)
+
+
+async def test_concurrent_lookups_share_one_load():
+    cache = _cache()
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return True
+
+    waiters = [asyncio.ensure_future(cache.get_or_load("k", loader)) for _ in range(50)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [True] * 50
+    assert calls == 1
+    assert cache.stats() == {"hits": 0, "misses": 1, "coalesced": 49, "size": 1}
+
+
+async def test_entries_expire_after_their_ttl(clock):
+    cache = _cache(positive_ttl=60, negative_ttl=5)
+    cache.set("member", True)
+    cache.set("not member", False)
+
+    clock.now += 4.9
+    assert cache.get("member") == (True,)
+    assert cache.get("not member") == (False,)
+
+    clock.now += 0.1
+    assert cache.get("not member") is None
+    assert cache.get("member") == (True,)
+
+    clock.now += 55
+    assert cache.get("member") is None
+    assert len(cache) == 0
+
+    async def loader():
+        return True
+
+    assert await cache.get_or_load("member", loader) is True
+    assert cache.misses == 1
+
+
+async def test_loader_errors_are_not_cached():
+    cache = _cache()
+    calls = 0
+    release = asyncio.Event()
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        raise RuntimeError("api down")
+
+    waiters = [asyncio.ensure_future(cache.get_or_load("k", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    # Every waiter sees the error of the one shared call
+    assert calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get("k") is None
+
+    async def working():
+        return True
+
+    assert await cache.get_or_load("k", working) is True
+    assert cache.get("k") == (True,)
@@ -0,0 +1,19 @@
+import pytest
+from pydantic import ValidationError
+
+from bot.config import Settings
+
+
+def test_channels_are_required():
+    with pytest.raises(ValidationError, match="at least one channel"):
+        Settings(_env_file=None, REQUIRED_CHANNELS=[], CHANNEL_1=None, CHANNEL_2=None)
+
+
+def test_required_channels_take_precedence():
+    settings = Settings(_env_file=None, REQUIRED_CHANNELS=["@a", "@b", "@c"], CHANNEL_1="@x")
+    assert settings.required_channels == ["@a", "@b", "@c"]
+
+
+def test_legacy_channels_are_used_as_fallback():
+    settings = Settings(_env_file=None, REQUIRED_CHANNELS=[], CHANNEL_1="@x", CHANNEL_2=None)
+    assert settings.required_channels == ["@x"]
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from aiogram import Bot
+
+from benchmarks.fake_api import FakeTelegramSession
+from bot.services.delivery import DeliveryScheduler, Priority
+
+
+class RecordingSession(FakeTelegramSession):
+    """Fake Bot API that also records when each call arrived"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.call_times = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.call_times.append(time.monotonic())
+        return await super().make_request(bot, method, timeout)
+
+
+def _scheduler(session, global_rate=1000.0, workers=4):
+    scheduler = DeliveryScheduler(
+        global_rate=global_rate, per_chat_rate=1000, per_chat_burst=1000, workers=workers, max_retries=5
+    )
+    return scheduler, Bot(token="123456:fake", session=session)
+
+
+def _finished_at(future, times, key):
+    future.add_done_callback(lambda f: times.__setitem__(key, time.monotonic()))
+    return future
+
+
+async def test_429_holds_back_only_the_affected_chat(event_loop):
+    # One message per chat per second; the second message to chat 1 gets a 429
+    session = RecordingSession(global_limit=None, per_chat_limit=1, retry_after=1)
+    scheduler, bot = _scheduler(session, workers=1)
+    scheduler.start(bot)
+    started, done = time.monotonic(), {}
+
+    futures = [
+        _finished_at(scheduler.send_message(1, "first"), done, "chat 1 first"),
+        _finished_at(scheduler.send_message(1, "second"), done, "chat 1 second"),
+    ]
+    futures += [_finished_at(scheduler.send_message(chat, "other"), done, chat) for chat in range(2, 12)]
+    await asyncio.gather(*futures)
+    await scheduler.stop()
+
+    assert scheduler.rate_limited == 1
+    assert done["chat 1 second"] - started >= 1.0
+    assert all(done[chat] - started < 0.5 for chat in range(2, 12))
+
+
+async def test_higher_priority_goes_first(event_loop):
+    session = RecordingSession(global_limit=None, per_chat_limit=None)
+    scheduler, bot = _scheduler(session, workers=1)
+
+    futures = [scheduler.send_message(chat, "bulk", priority=Priority.BULK) for chat in range(1, 6)]
+    futures.append(scheduler.send_message(10, "note", priority=Priority.NOTIFICATION))
+    futures.append(scheduler.send_message(20, "approval", priority=Priority.APPROVAL))
+    scheduler.start(bot)
+    await asyncio.gather(*futures)
+    await scheduler.stop()
+
+    assert [text for _, text in session.delivered] == ["approval", "note"] + ["bulk"] * 5
+
+
+async def test_global_rate_is_never_exceeded(event_loop):
+    rate = 50.0
+    session = RecordingSession(global_limit=None, per_chat_limit=None)
+    scheduler, bot = _scheduler(session, global_rate=rate, workers=8)
+    scheduler.start(bot)
+
+    await asyncio.gather(*(scheduler.send_message(chat, "hi") for chat in range(120)))
+    await scheduler.stop()
+
+    # A full bucket allows a burst of `rate` calls, then `rate` per second
+    first = session.call_times[0]
+    for sent, at in enumerate(sorted(session.call_times), start=1):
+        assert sent <= rate + rate * (at - first) + 1
+    assert session.call_times[-1] - first >= (120 - rate) / rate * 0.9
@@ -0,0 +1,62 @@
+import sqlite3
+
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import ApproveChatJoinRequest, DeclineChatJoinRequest
+
+from bot.services import join_requests as join_requests_module
+from bot.services.join_requests import JoinRequestProcessor
+
+
+def _patch(monkeypatch, eligible, submit_errors=()):
+    """Record API calls; raise each of `submit_errors` from the first calls"""
+    calls = []
+    errors = list(submit_errors)
+
+    async def submit(method, **kwargs):
+        calls.append(type(method))
+        if errors:
+            raise errors.pop(0)
+
+    async def referral_count(user_id):
+        return 2
+
+    monkeypatch.setattr(join_requests_module.delivery, "submit", submit)
+    monkeypatch.setattr(join_requests_module.delivery, "send_message", lambda *args, **kwargs: None)
+    monkeypatch.setattr(join_requests_module.models, "is_eligible", eligible)
+    monkeypatch.setattr(join_requests_module.models, "referral_count", referral_count)
+    return calls
+
+
+async def _process(processor, chat_id, user_id):
+    processor.start()
+    processor.enqueue(chat_id, user_id)
+    await processor.stop(timeout=5)
+
+
+async def test_api_errors_are_not_retried_on_top_of_delivery(event_loop, monkeypatch):
+    async def eligible(user_id):
+        return True
+
+    calls = _patch(monkeypatch, eligible, [TelegramNetworkError(method=None, message="down")])
+    processor = JoinRequestProcessor(workers=1, max_retries=5)
+    await _process(processor, -100, 7)
+
+    assert calls == [ApproveChatJoinRequest]
+    assert (processor.failed, processor.retried, processor.approved) == (1, 0, 0)
+
+
+async def test_database_errors_are_retried_before_any_call(event_loop, monkeypatch):
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    async def eligible(user_id):
+        if failures:
+            raise failures.pop()
+        return False
+
+    calls = _patch(monkeypatch, eligible)
+    processor = JoinRequestProcessor(workers=1, max_retries=5)
+    await _process(processor, -100, 7)
+
+    assert calls == [DeclineChatJoinRequest]
+    assert (processor.retried, processor.declined, processor.failed) == (1, 1, 0)
+    assert processor.queue_depth == 0
@@ -0,0 +1,81 @@
+import re
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+
+from bot import metrics
+from bot.middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+
+# One exposition line: a HELP/TYPE comment or `name{labels} value`
+_LINE = re.compile(
+    r'^(# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+'
+    r'|[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? (\+Inf|-?[0-9.e+-]+))$'
+)
+
+
+def _update(update_id: int, text: str) -> types.Update:
+    return types.Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    })
+
+
+def _samples(text: str, name: str) -> dict:
+    """{labels: value} of the samples of one series"""
+    found = {}
+    for line in text.splitlines():
+        match = re.match(rf"^{name}(\{{.*\}})? (\S+)$", line)
+        if match:
+            found[match.group(1) or ""] = float(match.group(2))
+    return found
+
+
+async def test_update_is_exposed_in_prometheus_format():
+    async def greet(message: types.Message):
+        pass
+
+    async def crash(message: types.Message):
+        raise RuntimeError("boom")
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.message.register(greet, lambda message: message.text == "hi")
+    dp.message.register(crash)
+    bot = Bot("123456:test-token")
+
+    errors_before = _samples(metrics.REGISTRY.render(), "bot_update_errors_total").get('{event_type="message"}', 0)
+    await dp.feed_update(bot, _update(1, "hi"))
+    with pytest.raises(RuntimeError):
+        await dp.feed_update(bot, _update(2, "crash"))
+
+    response = await metrics.handle_metrics(None)
+    assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+    text = response.body.decode()
+    assert text.endswith("\n")
+    bad = [line for line in text.splitlines() if not _LINE.match(line)]
+    assert not bad, bad
+    assert "# TYPE bot_handler_duration_seconds histogram" in text
+    assert "# TYPE bot_update_errors_total counter" in text
+
+    # Handler latency: one observation per handler, cumulative buckets
+    for handler in (greet, crash):
+        label = f'handler="{handler.__qualname__}"'
+        count = _samples(text, "bot_handler_duration_seconds_count")
+        assert count[f"{{{label}}}"] == 1
+        buckets = [
+            value for labels, value in _samples(text, "bot_handler_duration_seconds_bucket").items()
+            if label in labels
+        ]
+        assert len(buckets) == len(metrics.DEFAULT_BUCKETS) + 1
+        assert buckets == sorted(buckets) and buckets[-1] == 1
+
+    errors = _samples(text, "bot_update_errors_total")
+    assert errors['{event_type="message"}'] == errors_before + 1
+    assert _samples(text, "bot_update_duration_seconds_count")['{event_type="message"}'] >= 2
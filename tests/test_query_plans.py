@@ -0,0 +1,78 @@
+"""
+The hot paths must be served by indexes. Every statement the SQLite
+backend runs for them is captured from the connections and checked with
+EXPLAIN QUERY PLAN: no plan may scan the users or referrals table.
+"""
+import re
+
+import pytest
+
+from bot import db
+
+_FULL_SCAN = re.compile(r"\bSCAN (users|referrals)\b")
+
+
+async def _traced(statements, operation):
+    def trace(sql):
+        if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            statements.append(sql)
+
+    conns = [db._writer, *db._reader_conns]
+    for conn in conns:
+        await conn.set_trace_callback(trace)
+    try:
+        await operation()
+    finally:
+        for conn in conns:
+            await conn.set_trace_callback(None)
+
+
+async def _plan(sql):
+    async with db.get_db() as conn:
+        cur = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row["detail"] for row in await cur.fetchall()]
+
+
+async def _hot_paths(storage):
+    await storage.create_user(1, "inviter", "Inviter", None)
+    await storage.create_user(2, "friend", "Friend", None)
+    await storage.update_user_inviter(2, 1)
+    await storage.get_user(2)
+    await storage.set_user_member(2)
+    await storage.onboard_user(2, "friend", "Friend", 1)
+    await storage.onboard_user(3, "new", "New", 1)
+    await storage.add_referral(1, 4)
+    await storage.add_referral(1, 4)
+    await storage.get_channel_status("@c", 2)
+    await storage.set_channel_status("@c", 2, "member")
+    await storage.user_ids_after(0, 100)
+    await storage.users_page(0, 100)
+    await storage.referrals_page(0, 100)
+    await storage.claim_member_batch("sweep", 100)
+    await storage.record_lapse(3, "@c", "left")
+    await storage.top_inviters(10)
+    await storage.eligible_user_ids(7)
+    await storage.get_rollups("hour", "")
+    # Background, but it shares the writer with everything above
+    await storage.reconcile_referral_chunk(0, 100)
+
+
+async def test_hot_paths_do_not_scan_tables(sqlite_db):
+    statements = []
+    await _traced(statements, lambda: _hot_paths(sqlite_db))
+    assert statements
+
+    scans = {}
+    for sql in dict.fromkeys(statements):
+        plan = await _plan(sql)
+        if any(_FULL_SCAN.search(step) for step in plan):
+            scans[sql] = plan
+    assert not scans, scans
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT invited_by FROM users WHERE user_id = 1", False),
+    ("SELECT user_id FROM users WHERE full_name = 'x'", True),
+])
+async def test_full_scans_are_detected(sqlite_db, sql, expected):
+    assert any(_FULL_SCAN.search(step) for step in await _plan(sql)) is expected
@@ -0,0 +1,93 @@
+import asyncio
+
+from aiogram import types
+
+from bot import db, models
+from bot.config import settings
+from bot.handlers import start
+
+
+class FakeMessage:
+    """The parts of types.Message that start_handler uses"""
+
+    def __init__(self, text: str, user: types.User):
+        self.text = text
+        self.from_user = user
+        self.answers = []
+
+    async def answer(self, text: str, **kwargs):
+        self.answers.append(text)
+
+
+def _user(user_id: int) -> types.User:
+    return types.User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+
+
+def _patch_bot_api(monkeypatch):
+    """Everyone is subscribed; outgoing messages are recorded instead of sent"""
+    sent = []
+
+    async def check_subscriptions(bot, user_id):
+        return []
+
+    def send_message(chat_id, text, **kwargs):
+        sent.append((chat_id, text))
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    monkeypatch.setattr(start, "check_subscriptions", check_subscriptions)
+    monkeypatch.setattr(start.delivery, "send_message", send_message)
+    return sent
+
+
+async def _referral_rows():
+    rows = []
+    async for batch in models.iter_referrals():
+        rows.extend((r["inviter_id"], r["invited_id"]) for r in batch)
+    return rows
+
+
+async def test_start_with_own_id_is_not_a_referral(sqlite_db, monkeypatch):
+    sent = _patch_bot_api(monkeypatch)
+
+    await start.start_handler(FakeMessage("/start 42", _user(42)), bot=None)
+
+    user = await sqlite_db.get_user(42)
+    assert user.invited_by is None
+    assert user.referrals_count == 0
+    assert user.is_member == 1
+    assert await _referral_rows() == []
+    assert sent == []
+
+
+async def test_stored_self_inviter_is_never_credited(sqlite_db, monkeypatch):
+    _patch_bot_api(monkeypatch)
+    # A row written before self-referrals were rejected
+    await sqlite_db.create_user(42, None, "User 42", None)
+
+    async def op(conn):
+        await conn.execute("UPDATE users SET invited_by = 42 WHERE user_id = 42")
+
+    await db.run_write(op)
+    models.user_cache.clear()
+
+    await start.start_handler(FakeMessage("/start 42", _user(42)), bot=None)
+
+    assert (await sqlite_db.get_user(42)).referrals_count == 0
+    assert await _referral_rows() == []
+
+
+async def test_start_with_referral_credits_inviter_once(sqlite_db, monkeypatch):
+    sent = _patch_bot_api(monkeypatch)
+    await start.start_handler(FakeMessage("/start", _user(1)), bot=None)
+
+    message = FakeMessage("/start 1", _user(2))
+    await start.start_handler(message, bot=None)
+    await start.start_handler(message, bot=None)
+
+    assert (await sqlite_db.get_user(2)).invited_by == 1
+    assert (await sqlite_db.get_user(1)).referrals_count == 1
+    assert await _referral_rows() == [(1, 2)]
+    assert [chat_id for chat_id, _ in sent] == [1]
+    assert f"1/{settings.REFERRAL_THRESHOLD}" in sent[0][1]
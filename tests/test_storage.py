@@ -0,0 +1,214 @@
+"""
+Conformance tests every Storage backend must pass (see the `backend`
+fixture in conftest.py for running them against PostgreSQL).
+"""
+import asyncio
+
+from bot.storage.base import rollup_buckets
+
+
+async def _referrals(backend):
+    rows = await backend.referrals_page(0, 1000)
+    return [(r["inviter_id"], r["invited_id"]) for r in rows]
+
+
+async def test_create_and_get_user(backend):
+    assert await backend.create_user(1, "alice", "Alice", None)
+    assert not await backend.create_user(1, "other", "Other", 5)
+
+    user = await backend.get_user(1)
+    assert (user.user_id, user.invited_by, user.referrals_count, user.is_member) == (1, None, 0, 0)
+    assert await backend.get_user(2) is None
+
+
+async def test_self_inviter_is_never_stored(backend):
+    await backend.create_user(1, None, None, 1)
+    assert (await backend.get_user(1)).invited_by is None
+    assert not await backend.update_user_inviter(1, 1)
+    assert (await backend.get_user(1)).invited_by is None
+
+
+async def test_first_inviter_wins(backend):
+    await backend.create_user(1, None, None, None)
+    assert await backend.update_user_inviter(1, 7)
+    assert not await backend.update_user_inviter(1, 8)
+    assert (await backend.get_user(1)).invited_by == 7
+
+
+async def test_add_referral_ignores_duplicates(backend):
+    await backend.create_user(1, None, None, None)
+    assert await backend.add_referral(1, 2) == (True, 1)
+    assert await backend.add_referral(1, 2) == (False, 1)
+    assert await backend.add_referral(1, 3) == (True, 2)
+    assert await _referrals(backend) == [(1, 2), (1, 3)]
+
+
+async def test_concurrent_referrals_are_all_counted(backend):
+    await backend.create_user(1, None, None, None)
+    # Several hundred confirmations span many group-commit batches
+    invitees = range(1000, 1500)
+    results = await asyncio.gather(*(backend.add_referral(1, i) for i in invitees), backend.add_referral(1, invitees[0]))
+
+    assert sum(added for added, _ in results) == len(invitees)
+    assert (await backend.get_user(1)).referrals_count == len(invitees)
+
+
+async def test_onboard_new_user_credits_inviter_once(backend):
+    await backend.create_user(1, None, None, None)
+
+    first = await backend.onboard_user(2, "bob", "Bob", 1)
+    assert tuple(first) == (1, True, 1, 0)
+    again = await backend.onboard_user(2, "bob", "Bob", 1)
+    assert tuple(again) == (1, False, None, 0)
+
+    user = await backend.get_user(2)
+    assert (user.invited_by, user.is_member) == (1, 1)
+    assert (await backend.get_user(1)).referrals_count == 1
+    assert await _referrals(backend) == [(1, 2)]
+
+
+async def test_onboard_keeps_the_stored_inviter(backend):
+    await backend.create_user(2, None, None, 1)
+    result = await backend.onboard_user(2, None, None, 9)
+
+    assert (result.inviter_id, result.referral_added) == (1, True)
+    assert await _referrals(backend) == [(1, 2)]
+
+
+async def test_onboard_without_inviter(backend):
+    result = await backend.onboard_user(3, None, None, None)
+    assert tuple(result) == (None, False, None, 0)
+    assert (await backend.get_user(3)).is_member == 1
+
+
+async def test_onboard_never_credits_self(backend, sql):
+    result = await backend.onboard_user(4, None, None, 4)
+    assert (result.inviter_id, result.referral_added) == (None, False)
+
+    # A self-inviter stored before this was rejected
+    await sql("UPDATE users SET invited_by = user_id WHERE user_id = 4")
+    result = await backend.onboard_user(4, None, None, None)
+    assert (result.inviter_id, result.referral_added) == (None, False)
+    assert (await backend.get_user(4)).referrals_count == 0
+    assert await _referrals(backend) == []
+
+
+async def test_onboard_returns_own_count(backend):
+    await backend.create_user(5, None, None, None)
+    await backend.add_referral(5, 50)
+    await backend.add_referral(5, 51)
+    assert (await backend.onboard_user(5, None, None, None)).referrals_count == 2
+
+
+async def _reconcile(backend, chunk_size):
+    corrected, chunks, last_user_id = [], 0, 0
+    while True:
+        last_user_id, fixed = await backend.reconcile_referral_chunk(last_user_id, chunk_size)
+        if last_user_id is None:
+            return sorted(corrected), chunks
+        corrected.extend(fixed)
+        chunks += 1
+
+
+async def test_reconcile_fixes_drifted_counts_in_chunks(backend, sql):
+    for user_id in (1, 2, 3, 4, 5):
+        await backend.create_user(user_id, None, None, None)
+    await backend.add_referral(1, 10)
+    await backend.add_referral(1, 11)
+    await backend.add_referral(2, 12)
+    await backend.add_referral(5, 13)
+    await sql("UPDATE users SET referrals_count = ? WHERE user_id = ?", 5, 1)
+    await sql("UPDATE users SET referrals_count = ? WHERE user_id = ?", 4, 3)
+    await sql("UPDATE users SET referrals_count = NULL WHERE user_id = 5")
+
+    assert await _reconcile(backend, chunk_size=2) == ([(1, 2), (3, 0), (5, 1)], 3)
+    assert [(await backend.get_user(i)).referrals_count for i in (1, 2, 3, 4, 5)] == [2, 1, 0, 0, 1]
+    assert await _reconcile(backend, chunk_size=1000) == ([], 1)
+
+
+async def test_eligible_and_top_inviters(backend):
+    for user_id, count in ((1, 3), (2, 1), (3, 3), (4, 0)):
+        await backend.create_user(user_id, f"u{user_id}", None, None)
+        for invited in range(count):
+            await backend.add_referral(user_id, user_id * 100 + invited)
+
+    assert sorted(await backend.eligible_user_ids(3)) == [1, 3]
+    top = await backend.top_inviters(10)
+    assert [(r["user_id"], r["referrals_count"]) for r in top] == [(1, 3), (3, 3), (2, 1)]
+    assert top[0]["username"] == "u1"
+
+
+async def test_rollups_count_users_and_referrals(backend):
+    await backend.create_user(1, None, None, None)
+    await backend.onboard_user(2, None, None, 1)
+    await backend.add_referral(1, 3)
+    await backend.add_referral(1, 3)
+
+    expected = (2, 2)
+    for period, bucket in rollup_buckets():
+        assert (await backend.get_rollups(period, bucket))[bucket] == expected
+
+
+async def test_pages_are_in_key_order(backend):
+    for user_id in (3, 1, 2):
+        await backend.create_user(user_id, f"u{user_id}", f"User {user_id}", None)
+    await backend.add_referral(1, 2)
+
+    assert [r["user_id"] for r in await backend.list_users(2, 0)] == [1, 2]
+    assert [r["user_id"] for r in await backend.users_page(1, 10)] == [2, 3]
+    assert await backend.user_ids_after(2, 10) == [3]
+    (referral,) = await backend.referrals_page(0, 10)
+    assert isinstance(referral["created_at"], str)
+
+
+async def test_channel_status_upsert(backend):
+    assert await backend.get_channel_status("@c", 1) is None
+    await backend.set_channel_status("@c", 1, "member")
+    await backend.set_channel_status("@c", 1, "left")
+    assert await backend.get_channel_status("@c", 1) == "left"
+    assert await backend.get_channel_status("@d", 1) is None
+
+
+async def test_channel_status_max_age(backend, sql):
+    await backend.set_channel_status("@c", 1, "member")
+    assert await backend.get_channel_status("@c", 1, max_age=3600) == "member"
+
+    two_days_ago = "datetime('now', '-2 days')" if backend.name == "sqlite" else "now() - interval '2 days'"
+    await sql(f"UPDATE channel_members SET updated_at = {two_days_ago}")
+    assert await backend.get_channel_status("@c", 1, max_age=3600) is None
+    assert await backend.get_channel_status("@c", 1) == "member"
+
+    await backend.set_channel_status("@c", 1, "member")
+    assert await backend.get_channel_status("@c", 1, max_age=3600) == "member"
+
+
+async def test_member_batches_and_lapses(backend):
+    for user_id in range(1, 6):
+        await backend.onboard_user(user_id, None, None, None)
+
+    assert await backend.claim_member_batch("sweep", 2) == [1, 2]
+    assert await backend.claim_member_batch("sweep", 2) == [3, 4]
+    await backend.record_lapse(5, "@c", "left")
+    assert await backend.claim_member_batch("sweep", 2) == []
+    assert await backend.claim_member_batch("sweep", 2) == [1, 2]
+    assert (await backend.get_user(5)).is_member == 0
+
+
+async def test_broadcast_progress_and_leases(backend, sql):
+    broadcast_id = await backend.create_broadcast(1, 2, 3, "a", 60)
+    assert await backend.claim_broadcasts("b", 60) == []
+    assert await backend.renew_broadcast_lease(broadcast_id, "a", 60)
+
+    assert await backend.save_broadcast_progress(broadcast_id, "a", 10, 8, 1, 1, False)
+    assert await backend.save_broadcast_progress(broadcast_id, "a", 20, 9, 1, 0, False)
+    await backend.release_broadcast(broadcast_id, "a")
+    assert not await backend.save_broadcast_progress(broadcast_id, "a", 30, 10, 0, 0, False)
+
+    assert await backend.claim_broadcasts("b", 60) == [broadcast_id]
+    assert await backend.save_broadcast_progress(broadcast_id, "b", 30, 0, 0, 0, True)
+
+    row = await backend.get_broadcast(broadcast_id)
+    assert (row["last_user_id"], row["delivered"], row["blocked"], row["failed"]) == (30, 17, 2, 1)
+    assert (row["status"], row["owner"]) == ("finished", None)
+    assert row["finished_at"] is not None
+    assert await backend.claim_broadcasts("c", 60) == []
@@ -0,0 +1,63 @@
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import GetChatMember
+
+from bot import db, models
+from bot.services import subscription
+
+
+class FakeBot:
+    """getChatMember answered from a {(channel, user_id): status} dict"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append((chat_id, user_id))
+        status = self.statuses.get((chat_id, user_id))
+        if status is None:
+            raise TelegramBadRequest(GetChatMember(chat_id=chat_id, user_id=user_id), "user not found")
+        return type("ChatMember", (), {"status": status})()
+
+
+async def _backdate(channel, user_id, days):
+    async def op(conn):
+        await conn.execute(
+            "UPDATE channel_members SET updated_at = datetime('now', ?) WHERE channel = ? AND user_id = ?",
+            (f"-{days} days", channel, user_id)
+        )
+
+    await db.run_write(op)
+
+
+async def test_recent_member_row_skips_the_api(sqlite_db):
+    subscription.membership_cache.clear()
+    await models.set_channel_status("@c", 1, "member")
+    bot = FakeBot({("@c", 1): "left"})
+
+    assert await subscription.is_member(bot, "@c", 1)
+    assert bot.calls == []
+
+
+async def test_stale_member_row_is_confirmed_with_the_api(sqlite_db):
+    subscription.membership_cache.clear()
+    # The leave update was missed: the row still says member, days later
+    await models.set_channel_status("@c", 1, "member")
+    await _backdate("@c", 1, days=2)
+    bot = FakeBot({("@c", 1): "left"})
+
+    assert not await subscription.is_member(bot, "@c", 1)
+    assert bot.calls == [("@c", 1)]
+    assert await models.get_channel_status("@c", 1) == "left"
+
+
+async def test_confirmed_stale_member_row_is_renewed(sqlite_db):
+    subscription.membership_cache.clear()
+    await models.set_channel_status("@c", 1, "member")
+    await _backdate("@c", 1, days=2)
+    bot = FakeBot({("@c", 1): "member"})
+
+    assert await subscription.is_member(bot, "@c", 1)
+    subscription.membership_cache.clear()
+    assert await subscription.is_member(bot, "@c", 1)
+    assert bot.calls == [("@c", 1)]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChatMember
+
+from bot import models
+from bot.config import settings
+from bot.services.subscription import CHANNELS, membership_cache
+from bot.services.sweeper import MembershipSweeper
+
+
+class FakeBot:
+    """getChatMember returning `status`, with a flood limit on the first call if `retry_after` is set"""
+
+    def __init__(self, status="member", retry_after=None):
+        self.status = status
+        self.retry_after = retry_after
+        self.call_times = []
+        self.flood_at = None
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.call_times.append(time.monotonic())
+        await asyncio.sleep(0.01)
+        if self.retry_after is not None:
+            retry_after, self.retry_after = self.retry_after, None
+            self.flood_at = time.monotonic()
+            raise TelegramRetryAfter(GetChatMember(chat_id=chat_id, user_id=user_id), "flood", retry_after)
+        return type("ChatMember", (), {"status": self.status})()
+
+
+def _sweeper(concurrency=4):
+    return MembershipSweeper(interval=0, batch_size=100, concurrency=concurrency, calls_per_minute=60_000)
+
+
+async def _members(*user_ids):
+    for user_id in user_ids:
+        await models.onboard_user(user_id, None, None, None)
+        await models.set_user_member(user_id)
+
+
+async def test_lapse_drops_the_cached_check_without_tracking(sqlite_db, monkeypatch):
+    monkeypatch.setattr(settings, "MEMBERSHIP_TRACKING", False)
+    await _members(1)
+    channel = CHANNELS[0]
+    membership_cache.set((channel, 1), True)
+
+    sweeper = _sweeper()
+    await sweeper.sweep_batch(FakeBot(status="left"))
+
+    assert sweeper.lapsed == 1
+    assert membership_cache.get((channel, 1)) is None
+
+
+async def test_flood_limit_pauses_every_worker(sqlite_db):
+    await _members(*range(1, 21))
+    bot = FakeBot(retry_after=1)
+
+    sweeper = _sweeper(concurrency=4)
+    await sweeper.sweep_batch(bot)
+
+    # Calls already in flight finish; no worker starts a new one until
+    # the pause is over
+    assert not [t for t in bot.call_times if bot.flood_at < t < bot.flood_at + 1]
+    assert sweeper.errors == 1
+    assert sweeper.checked == 19
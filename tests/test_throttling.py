@@ -0,0 +1,95 @@
+import asyncio
+from typing import ClassVar, List
+
+from aiogram import types
+
+from bot.middlewares.throttling import PLEASE_WAIT, TOO_MANY, AntiFloodMiddleware
+
+
+class FakeCallback(types.CallbackQuery):
+    """Callback query whose answers are recorded instead of sent"""
+
+    answers: ClassVar[List[tuple]] = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append((self.from_user.id, text))
+
+
+def _user(user_id: int) -> types.User:
+    return types.User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+
+
+def _message(user_id: int, text: str) -> types.Message:
+    return types.Message.model_validate({
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id).model_dump(),
+        "text": text,
+    })
+
+
+def _callback(user_id: int, data: str) -> FakeCallback:
+    return FakeCallback(id=f"{user_id}:{data}", from_user=_user(user_id), chat_instance="c", data=data)
+
+
+class Handler:
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, event, data):
+        self.calls.append(data["event_from_user"].id)
+        await self.release.wait()
+        return "handled"
+
+
+async def _feed(antiflood, handler, event):
+    return await antiflood(handler, event, {"event_from_user": event.from_user})
+
+
+async def test_messages_over_the_limit_are_dropped_for_that_user_only():
+    antiflood = AntiFloodMiddleware(max_updates=3, window=60)
+    handler = Handler()
+
+    results = [await _feed(antiflood, handler, _message(1, f"text {i}")) for i in range(5)]
+    assert results == ["handled"] * 3 + [None] * 2
+
+    results = [await _feed(antiflood, handler, _message(2, f"text {i}")) for i in range(3)]
+    assert results == ["handled"] * 3
+    assert handler.calls == [1, 1, 1, 2, 2, 2]
+    assert antiflood.stats()["rate_limited"] == 2
+
+
+async def test_callbacks_over_the_limit_are_answered_once():
+    FakeCallback.answers.clear()
+    antiflood = AntiFloodMiddleware(max_updates=2, window=60)
+    handler = Handler()
+
+    for i in range(3):
+        await _feed(antiflood, handler, _callback(1, f"button {i}"))
+    await _feed(antiflood, handler, _callback(2, "button 0"))
+
+    assert handler.calls == [1, 1, 2]
+    assert FakeCallback.answers == [(1, TOO_MANY)]
+
+
+async def test_repeat_while_in_flight_is_coalesced():
+    FakeCallback.answers.clear()
+    antiflood = AntiFloodMiddleware(max_updates=10, window=60)
+    handler = Handler()
+    handler.release.clear()
+
+    first = asyncio.ensure_future(_feed(antiflood, handler, _callback(1, "check")))
+    await asyncio.sleep(0)
+    assert await _feed(antiflood, handler, _callback(1, "check")) is None
+    other = asyncio.ensure_future(_feed(antiflood, handler, _callback(2, "check")))
+    await asyncio.sleep(0)
+
+    handler.release.set()
+    assert await first == "handled"
+    assert await other == "handled"
+    assert handler.calls == [1, 2]
+    assert FakeCallback.answers == [(1, PLEASE_WAIT)]
+    assert antiflood.stats()["in_flight"] == 0
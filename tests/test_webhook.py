@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, types
+
+from bot import log
+from bot.webhook import BoundedRequestHandler
+
+SECRET = "s3cret"
+PATH = "/webhook"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _stop_logging():
+    # Importing bot.webhook imports bot.main, which starts the log listener
+    # on pytest's captured stderr; stop it before that stream is closed
+    yield
+    log.stop_logging()
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "text": "hi",
+        },
+    }
+
+
+class Handlers:
+    """Message handler that records updates and blocks until released"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.seen = []
+        self.running = 0
+        self.max_running = 0
+
+    async def on_message(self, message: types.Message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.seen.append(message.message_id)
+        try:
+            await self.release.wait()
+        finally:
+            self.running -= 1
+
+
+async def _client(handlers: Handlers, max_concurrency: int) -> TestClient:
+    dp = Dispatcher()
+    dp.message.register(handlers.on_message)
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher=dp,
+        bot=Bot("123456:test-token"),
+        secret_token=SECRET,
+        max_concurrency=max_concurrency,
+    ).register(app, path=PATH)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client
+
+
+def _post(client: TestClient, update_id: int, secret: str = SECRET):
+    return client.post(PATH, json=_update(update_id), headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+
+async def test_update_is_acknowledged_and_handled():
+    handlers = Handlers()
+    handlers.release.set()
+    client = await _client(handlers, max_concurrency=4)
+    try:
+        response = await _post(client, 1)
+        assert response.status == 200
+        await asyncio.sleep(0.05)
+        assert handlers.seen == [1]
+    finally:
+        await client.close()
+
+
+async def test_wrong_secret_is_rejected():
+    handlers = Handlers()
+    client = await _client(handlers, max_concurrency=4)
+    try:
+        response = await _post(client, 1, secret="wrong")
+        assert response.status == 401
+        await asyncio.sleep(0.05)
+        assert handlers.seen == []
+    finally:
+        await client.close()
+
+
+async def test_requests_wait_for_a_free_slot():
+    handlers = Handlers()
+    client = await _client(handlers, max_concurrency=2)
+    try:
+        # Both slots are taken by updates whose handlers are still running
+        for update_id in (1, 2):
+            assert (await _post(client, update_id)).status == 200
+        await asyncio.sleep(0.05)
+
+        # The next request is held, pushing back on Telegram
+        third = asyncio.ensure_future(_post(client, 3))
+        await asyncio.sleep(0.2)
+        assert not third.done()
+        assert handlers.seen == [1, 2]
+
+        handlers.release.set()
+        assert (await asyncio.wait_for(third, 5)).status == 200
+        await asyncio.sleep(0.05)
+        assert handlers.seen == [1, 2, 3]
+        assert handlers.max_running == 2
+    finally:
+        handlers.release.set()
+        await client.close()